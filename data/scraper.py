@@ -1,10 +1,22 @@
 import requests
 from bs4 import BeautifulSoup
 import pandas as pd
+import argparse
 import re
+import os
+import sys
 from datetime import datetime
 import json
 
+try:
+    from local_strategies.column_store import STORE_DIRNAME, ColumnStore, parse_klines
+except ImportError:
+    # 在 data 目录下直接运行时，从仓库根目录导入
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from local_strategies.column_store import STORE_DIRNAME, ColumnStore, parse_klines
+from local_strategies.data_loader import load_price_data, normalize_price_frame
+from local_strategies.partition_store import PARTITION_DIRNAME, PartitionedPriceStore
+
 def scrape_palmmicro_data(symbol, code):
     """爬取palmmicro网站的股票历史数据"""
     url = f"https://palmmicro.com/woody/res/stockhistorycn.php?symbol={symbol}&num=500"
@@ -44,8 +56,13 @@ def scrape_palmmicro_data(symbol, code):
         print(f"爬取{symbol}数据时出错: {e}")
         return []
 
-def scrape_eastmoney_data(code):
-    """爬取东方财富网站的基金净值数据"""
+def scrape_eastmoney_data(code, store_dir=None):
+    """
+    爬取东方财富网站的基金净值数据
+
+    store_dir 不为空且K线接口可用时，另把完整日K线（开收高低、量、额、振幅，原始精度）并入该目录下的列式存储，
+    接口只返回最近 600 条，更早的历史保留在存储中
+    """
     
     try:
         headers = {
@@ -70,6 +87,15 @@ def scrape_eastmoney_data(code):
                 kline_json = kline_resp.json()
                 klines = kline_json.get('data', {}).get('klines')
                 if klines:
+                    if store_dir:
+                        columns = parse_klines(klines)
+                        if len(columns['date']):
+                            column_store = ColumnStore(store_dir)
+                            # 首次写入时先导入已有 CSV 的收盘价，存储中的历史不会少于 CSV
+                            if not column_store.has(code, ()) and os.path.exists(f'{code}_data.csv'):
+                                column_store.import_frame(code, load_price_data(f'{code}_data.csv'))
+                            total = column_store.update(code, columns)
+                            print(f"已并入 {code} 完整K线 {len(columns['date'])} 条，{os.path.join(store_dir, code)} 共 {total} 条")
                     data = []
                     for item in klines:
                         parts = item.split(',')
@@ -196,8 +222,12 @@ def scrape_eastmoney_data(code):
         traceback.print_exc()
         return []
 
-def main():
-    """主函数：爬取所有数据并保存为CSV文件"""
+def main(export_csv=False):
+    """
+    主函数：爬取所有数据，只把新增的行追加到按年分区的存储（data/partitions）
+
+    export_csv 为 True 时另外由存储导出旧格式的 {代码}_data.csv 与 all_funds_data.csv
+    """
     
     # 定义要爬取的数据源
     sources = [
@@ -207,7 +237,8 @@ def main():
         ('518880', '518880', 'eastmoney')
     ]
     
-    all_data = []
+    store = PartitionedPriceStore(PARTITION_DIRNAME)
+    fetched = {}
     
     for symbol, code, source_type in sources:
         print(f"正在爬取 {code} 的数据...")
@@ -215,29 +246,36 @@ def main():
         if source_type == 'palmmicro':
             data = scrape_palmmicro_data(symbol, code)
         elif source_type == 'eastmoney':
-            data = scrape_eastmoney_data(code)
+            data = scrape_eastmoney_data(code, store_dir=STORE_DIRNAME)
         else:
             continue
             
         if data:
             print(f"成功获取 {code} 的 {len(data)} 条数据")
-            all_data.extend(data)
-            
-            # 为每个基金单独保存CSV文件
-            df = pd.DataFrame(data)
-            df.to_csv(f'{code}_data.csv', index=False, encoding='utf-8-sig')
-            print(f"已保存 {code} 数据到 {code}_data.csv")
+            frame = normalize_price_frame(pd.DataFrame(data))[['close']]
+            # 首次写入该代码时先并入已有 CSV 的历史，接口返回范围之前的数据不会丢失
+            if code not in store and os.path.exists(f'{code}_data.csv'):
+                frame = pd.concat([load_price_data(f'{code}_data.csv'), frame])
+            fetched[code] = frame
         else:
             print(f"未能获取 {code} 的数据")
     
-    # 保存所有数据到一个综合文件
-    if all_data:
-        df_all = pd.DataFrame(all_data)
-        df_all = df_all.sort_values(['code', 'date'])
-        df_all.to_csv('all_funds_data.csv', index=False, encoding='utf-8-sig')
-        print(f"已保存所有数据到 all_funds_data.csv，共 {len(all_data)} 条记录")
-    else:
+    if not fetched:
         print("未获取到任何数据")
+        return
+
+    # 只追加晚于已提交日期的行，全部写完后一次提交清单
+    for code, count in store.append(fetched).items():
+        print(f"{code} 新增 {count} 条，最新日期 {store.max_date(code).date()}")
+
+    if export_csv:
+        for code in fetched:
+            store.export_csv(code, f'{code}_data.csv')
+        df_all = store.combined()
+        df_all.to_csv('all_funds_data.csv', index=False, encoding='utf-8-sig')
+        print(f"已导出 {len(fetched)} 个 {{代码}}_data.csv 与 all_funds_data.csv，共 {len(df_all)} 条记录")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='爬取基金行情并追加到分区存储')
+    parser.add_argument('--export-csv', action='store_true', help='另外导出旧格式的 {代码}_data.csv 与 all_funds_data.csv')
+    main(export_csv=parser.parse_args().export_csv)
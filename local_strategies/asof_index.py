@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按日期的 as-of 价格查询
+每只ETF的日期存为升序 int64（纳秒）数组，“某日及之前最近一个收盘价”用 searchsorted 在 O(log n) 内定位，
+不再对整条日期索引做 df.index <= date 比较；一天内多只ETF、整段回测的多日查询都可一次向量化完成。
+"""
+
+from typing import Dict, Mapping, Sequence
+
+import numpy as np
+import pandas as pd
+
+
+def date_keys(dates) -> np.ndarray:
+    """
+    日期序列转为 int64 纳秒时间戳（与 pd.Timestamp(date).value 一致）
+    """
+    if not isinstance(dates, pd.DatetimeIndex):
+        dates = pd.DatetimeIndex(pd.to_datetime(dates))
+    return dates.values.astype('datetime64[ns]').astype(np.int64)
+
+
+class AsOfIndex:
+    """
+    多只ETF的 as-of 价格索引：price(code, date) 等价于 df.loc[:date, 'close'].iloc[-1]，之前无数据时为 NaN
+    """
+
+    def __init__(self, keys: Mapping[str, np.ndarray], values: Mapping[str, np.ndarray]) -> None:
+        self._keys: Dict[str, np.ndarray] = {code: np.asarray(keys[code], dtype=np.int64) for code in keys}
+        # float32 的价格（紧凑模式）原样保存，取出时再转为 float64
+        self._values: Dict[str, np.ndarray] = {
+            code: np.asarray(values[code], dtype=np.result_type(values[code], np.float32)) for code in keys
+        }
+
+    @classmethod
+    def from_frames(cls, etf_data: Mapping[str, pd.DataFrame], column: str = 'close') -> 'AsOfIndex':
+        keys = {code: date_keys(df.index) for code, df in etf_data.items()}
+        values = {code: df[column].to_numpy(dtype=np.float64) for code, df in etf_data.items()}
+        return cls(keys, values)
+
+    @classmethod
+    def from_panel(cls, panel) -> 'AsOfIndex':
+        """
+        由 PricePanel 构建，值数组直接复用面板中按ETF压缩的收盘价
+        """
+        all_keys = date_keys(panel.dates)
+        keys = {code: all_keys[panel.valid[:, j]] for j, code in enumerate(panel.codes)}
+        values = {code: panel.series[j] for j, code in enumerate(panel.codes)}
+        return cls(keys, values)
+
+    @property
+    def nbytes(self) -> int:
+        return int(sum(self._keys[code].nbytes + self._values[code].nbytes for code in self._keys))
+
+    def __contains__(self, etf_code: str) -> bool:
+        return etf_code in self._keys
+
+    def price(self, etf_code: str, date) -> float:
+        """
+        单只ETF在 date 当日或之前最近一个交易日的收盘价
+        """
+        keys = self._keys[etf_code]
+        i = int(np.searchsorted(keys, pd.Timestamp(date).value, side='right')) - 1
+        return float(self._values[etf_code][i]) if i >= 0 else float('nan')
+
+    def prices(self, etf_codes: Sequence[str], date) -> np.ndarray:
+        """
+        同一日期多只ETF的 as-of 收盘价，用于一日的组合估值
+        """
+        key = pd.Timestamp(date).value
+        out = np.full(len(etf_codes), np.nan)
+        for n, code in enumerate(etf_codes):
+            i = int(np.searchsorted(self._keys[code], key, side='right')) - 1
+            if i >= 0:
+                out[n] = self._values[code][i]
+        return out
+
+    def batch(self, etf_code: str, dates) -> np.ndarray:
+        """
+        单只ETF在多个日期的 as-of 收盘价，一次 searchsorted 完成
+        """
+        rows = np.searchsorted(self._keys[etf_code], date_keys(dates), side='right') - 1
+        out = np.full(len(rows), np.nan)
+        found = rows >= 0
+        out[found] = self._values[etf_code][rows[found]]
+        return out
+
+    def matrix(self, etf_codes: Sequence[str], dates) -> np.ndarray:
+        """
+        日期×ETF 的 as-of 收盘价矩阵，整段回测的估值价格一次取出
+        """
+        keys = date_keys(dates)
+        out = np.full((len(keys), len(etf_codes)), np.nan)
+        for n, code in enumerate(etf_codes):
+            rows = np.searchsorted(self._keys[code], keys, side='right') - 1
+            found = rows >= 0
+            out[found, n] = self._values[code][rows[found]]
+        return out
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+内存映射存储基准
+在临时目录构建不同代码数的合成 日期×代码 存储，每种规模在新的子进程中附加存储、
+取某日之前 m_days 的全市场窗口并计算动量评分上界，报告附加耗时、窗口耗时与进程常驻内存（VmRSS，Linux）；
+作为对照，同一子进程再把整个字段文件读入内存一次。
+
+用法: python3 bench_memmap.py [--symbols 500 2000 8000] [--days 2500] [--window 25]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .memmap_store import MemmapPriceStore
+except ImportError:
+    from memmap_store import MemmapPriceStore
+
+_PROBE = r'''
+import json, sys, time
+import numpy as np
+sys.path.insert(0, {module_dir!r})
+from memmap_store import MemmapPriceStore
+from topk import momentum_score_bound
+
+def rss_mb():
+    # 当前常驻内存（含已载入的映射页）
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmRSS')) / 1024
+
+base = rss_mb()
+start = time.perf_counter()
+store = MemmapPriceStore({root!r})
+attach = time.perf_counter() - start
+
+start = time.perf_counter()
+window = store.window_before(store.dates[-1], {window})
+closes, ready = store.windows_before(store.codes, store.dates[-1], {window})
+bounds = momentum_score_bound(np.log(closes[ready]), weighted=True)
+scan = time.perf_counter() - start
+view = np.shares_memory(window, store.array('close'))
+mapped = rss_mb()
+
+eager = 0.0
+if {eager}:
+    loaded = np.fromfile(store.root + '/close.f64')
+    eager = rss_mb() - base
+print(json.dumps(dict(attach=attach, scan=scan, view=bool(view), ready=int(ready.sum()),
+                      mapped=mapped - base, eager=eager)))
+'''
+
+
+def write_store(root: str, symbols: int, days: int) -> None:
+    dates = pd.bdate_range('2015-01-05', periods=days)
+
+    def load(code: str) -> pd.DataFrame:
+        # 按代码固定随机种子，构建时两次调用得到相同数据
+        rng = np.random.default_rng(int(code))
+        return pd.DataFrame({'close': np.exp(np.cumsum(rng.normal(0, 0.01, days)))}, index=dates)
+
+    MemmapPriceStore.build(root, [f'{100000 + j:06d}' for j in range(symbols)], load)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='内存映射存储基准')
+    parser.add_argument('--symbols', type=int, nargs='+', default=[500, 2000, 8000])
+    parser.add_argument('--days', type=int, default=2500)
+    parser.add_argument('--window', type=int, default=25)
+    parser.add_argument('--no-eager', action='store_true', help='不做整文件读入的对照')
+    args = parser.parse_args()
+
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    print(f'{"代码数":>8} {"文件MB":>8} {"附加ms":>8} {"窗口ms":>8} {"零拷贝":>6} {"映射RSS MB":>11} {"读入RSS MB":>11}')
+    for symbols in args.symbols:
+        with tempfile.TemporaryDirectory() as root:
+            write_store(root, symbols, args.days)
+            size = os.path.getsize(os.path.join(root, 'close.f64')) / 1e6
+            probe = _PROBE.format(module_dir=module_dir, root=root, window=args.window, eager=not args.no_eager)
+            out = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True, check=True).stdout
+            r = json.loads(out)
+            eager = f'{r["eager"]:11.1f}' if not args.no_eager else f'{"-":>11}'
+            print(
+                f'{symbols:>8} {size:8.1f} {r["attach"] * 1e3:8.2f} {r["scan"] * 1e3:8.2f} '
+                f'{str(r["view"]):>6} {r["mapped"]:11.1f} {eager}'
+            )
+
+
+if __name__ == '__main__':
+    main()
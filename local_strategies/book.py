@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+事件循环的组合账本
+现金、持仓与交易保存在带 __slots__ 的对象中，ETF 以整数编号（codes 中的位置）索引；
+持有份额 > 0 的编号随买卖增量维护，不再每日扫描全部持仓；交易日期在导出前保持为 epoch 天数。
+
+回测之外 strategy.portfolio 字典仍是组合状态的正式形式：Book.open 由它建立账本，
+Book.close 把现金、市值与各持仓原地写回原有的持仓字典，交易按原格式追加到 portfolio['trades']。
+"""
+
+from bisect import insort
+from typing import List, Sequence, Tuple
+
+try:
+    from .trading_calendar import to_timestamps
+except ImportError:
+    from trading_calendar import to_timestamps
+
+
+class Position:
+    __slots__ = ('shares', 'value')
+
+    def __init__(self, shares, value) -> None:
+        self.shares = shares
+        self.value = value
+
+
+class Trade:
+    __slots__ = ('day', 'side', 'symbol', 'shares', 'price', 'amount')
+
+    def __init__(self, day: int, side: str, symbol: int, shares, price, amount) -> None:
+        self.day = day
+        self.side = side
+        self.symbol = symbol
+        self.shares = shares
+        self.price = price
+        self.amount = amount
+
+
+class Book:
+    """
+    单一账户的现金、持仓与交易
+
+    zero 为卖出后份额与市值、买入后现金所置的值：两个策略原本分别用 0 与 0.0，
+    沿用各自的值，导出的历史与交易记录类型不变。
+    """
+
+    __slots__ = ('codes', 'symbols', 'cash', 'total_value', 'positions', 'held', 'trades', 'zero')
+
+    def __init__(self, codes: Sequence[str], cash, total_value=None, zero=0) -> None:
+        self.codes = list(codes)
+        self.symbols = {code: i for i, code in enumerate(self.codes)}
+        self.cash = cash
+        self.total_value = cash if total_value is None else total_value
+        self.positions = [Position(zero, zero) for _ in self.codes]
+        self.held: List[int] = []  # 份额 > 0 的编号，升序（即 portfolio['positions'] 的顺序）
+        self.trades: List[Trade] = []
+        self.zero = zero
+
+    @classmethod
+    def open(cls, portfolio: dict, zero=0) -> 'Book':
+        """
+        由策略的 portfolio 字典建立账本（已有的交易记录留在字典中）
+        """
+        positions = portfolio['positions']
+        book = cls(positions, portfolio['cash'], portfolio['total_value'], zero)
+        for symbol, position in enumerate(positions.values()):
+            book.positions[symbol] = Position(position['shares'], position['value'])
+            if position['shares'] > 0:
+                book.held.append(symbol)
+        return book
+
+    def sell(self, symbol: int, day: int, price) -> Trade:
+        """
+        全部卖出 symbol，所得计入现金
+        """
+        position = self.positions[symbol]
+        shares = position.shares
+        amount = shares * price
+        self.cash += amount
+        position.shares = self.zero
+        position.value = self.zero
+        self.held.remove(symbol)
+        trade = Trade(day, 'sell', symbol, shares, price, amount)
+        self.trades.append(trade)
+        return trade
+
+    def buy(self, symbol: int, day: int, price) -> Trade:
+        """
+        用全部现金买入 symbol
+        """
+        trade = self._open(symbol, day, price, self.cash)
+        self.cash = self.zero
+        return trade
+
+    def buy_equally(self, orders: Sequence[Tuple[int, float]], day: int) -> List[Trade]:
+        """
+        现金在 orders（[(编号, 价格)]）间平均分配买入，只有一只时与 buy 相同
+        """
+        budget = self.cash / len(orders)
+        trades = [self._open(symbol, day, price, budget) for symbol, price in orders]
+        self.cash = self.zero
+        return trades
+
+    def _open(self, symbol: int, day: int, price, amount) -> Trade:
+        shares = amount / price
+        position = self.positions[symbol]
+        position.shares = shares
+        position.value = amount
+        if shares > 0 and symbol not in self.held:
+            insort(self.held, symbol)
+        trade = Trade(day, 'buy', symbol, shares, price, amount)
+        self.trades.append(trade)
+        return trade
+
+    def trade_records(self, names: Sequence[str]) -> List[dict]:
+        """
+        交易记录转为策略原有的格式，names 为各编号的ETF名称
+        """
+        dates = to_timestamps([trade.day for trade in self.trades]).strftime('%Y-%m-%d')
+        return [
+            {
+                'date': date,
+                'type': trade.side,
+                'code': self.codes[trade.symbol],
+                'name': names[trade.symbol],
+                'shares': trade.shares,
+                'price': trade.price,
+                'amount': trade.amount,
+            }
+            for date, trade in zip(dates, self.trades)
+        ]
+
+    def close(self, portfolio: dict, names: Sequence[str]) -> None:
+        """
+        写回 portfolio：持仓字典原地更新（历史记录中引用的同一批字典随之更新），交易追加后清空账本中的交易
+        """
+        portfolio['cash'] = self.cash
+        portfolio['total_value'] = self.total_value
+        positions = portfolio['positions']
+        for code, position in zip(self.codes, self.positions):
+            positions[code]['shares'] = position.shares
+            positions[code]['value'] = position.value
+        portfolio['trades'].extend(self.trade_records(names))
+        self.trades = []
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+盘中换仓临界价
+复用增量回归（RollingRegression）中缓存的各阶矩，把下一次排名的窗口写成
+“已知的 n-1 个收盘价 + 今日价格 p”，评分就成为 y=ln(p) 的显式函数：
+斜率、截距关于 y 线性，残差平方和与总平方和关于 y 二次。
+据此用带区间保护的牛顿法求出使两只ETF排名互换的精确价格，单次求解只需数十微秒。
+"""
+
+import math
+from typing import Callable, Mapping, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .rolling_regression import RollingRegression
+except ImportError:
+    from rolling_regression import RollingRegression
+
+
+def _padd(*polys: tuple) -> tuple:
+    return tuple(sum(c) for c in zip(*polys))
+
+
+def _pscale(poly: tuple, k: float) -> tuple:
+    return tuple(k * c for c in poly)
+
+
+def _pmul(a: tuple, b: tuple) -> tuple:
+    # 只会出现一次式 × 一次式，二次以上的系数恒为 0
+    out = [0.0, 0.0, 0.0]
+    for i, ca in enumerate(a[:2]):
+        for j, cb in enumerate(b[:2]):
+            out[i + j] += ca * cb
+    return tuple(out)
+
+
+def _peval(poly: tuple, y: float) -> Tuple[float, float]:
+    c0, c1, c2 = poly
+    return c0 + (c1 + c2 * y) * y, c1 + 2 * c2 * y
+
+
+class NextWindowTrend:
+    """
+    下一个回归窗口的评分函数：窗口为当前窗口去掉最早一个价格，再在末尾加入今日价格
+
+    评分口径与 RollingRegression.result() 相同（MOM 或普通最小二乘），
+    at(log_price) 返回 (评分, d评分/dln(p))，slope_at 返回 (斜率, d斜率/dln(p))。
+    """
+
+    def __init__(self, reg: RollingRegression) -> None:
+        if not reg.is_ready:
+            raise ValueError('回归窗口尚未填满，无法推算下一窗口')
+
+        n = reg.window
+        last_k = n - 1
+        sums = reg.window_sums()
+        self.weighted = reg.weighted
+        self.anchor = sums.anchor
+        dropped = math.log(reg.closes[0]) - self.anchor
+
+        # 与 _shift_moments 相同的平移，只是新值 y 留作未知数：M_p = base_p + last_k^p·y
+        def shifted(moments, dropped_value):
+            base = []
+            for p in range(len(moments)):
+                total = math.fsum(
+                    math.comb(p, q) * (-1) ** (p - q) * moments[q] for q in range(p + 1)
+                )
+                base.append(total - (-1) ** p * dropped_value)
+            return base
+
+        m_base = shifted(sums.y_moments, dropped)
+        q_base = shifted(sums.y2_moments, dropped * dropped)
+        m = [(m_base[p], float(last_k ** p), 0.0) for p in range(len(m_base))]
+        q = [(q_base[p], 0.0, float(last_k ** p)) for p in range(len(q_base))]
+
+        def with_y(poly, power):
+            return _padd(*[_pscale(m[i + power], a) for i, a in enumerate(poly)])
+
+        fit_poly, r2_poly = sums.fit_poly, sums.r2_poly
+        sw, swx, swxx = sums.fit_const
+        swy, swxy = with_y(fit_poly, 0), with_y(fit_poly, 1)
+        det = sw * swxx - swx * swx
+        self.slope = _padd(_pscale(swxy, sw / det), _pscale(swy, -swx / det))
+        intercept = _padd(_pscale(swy, 1 / sw), _pscale(self.slope, -swx / sw))
+
+        rw, rwx, rwxx = sums.r2_const
+        rwy, rwxy = with_y(r2_poly, 0), with_y(r2_poly, 1)
+        rwyy = _padd(*[_pscale(q[i], a) for i, a in enumerate(r2_poly)])
+        y_mean = _pscale(m[0], 1 / n)
+
+        self.ss_tot = _padd(rwyy, _pscale(_pmul(y_mean, rwy), -2), _pscale(_pmul(y_mean, y_mean), rw))
+        self.ss_res = _padd(
+            rwyy,
+            _pscale(_pmul(intercept, rwy), -2),
+            _pscale(_pmul(self.slope, rwxy), -2),
+            _pscale(_pmul(intercept, intercept), rw),
+            _pscale(_pmul(intercept, self.slope), 2 * rwx),
+            _pscale(_pmul(self.slope, self.slope), rwxx),
+        )
+
+    def slope_at(self, log_price: float) -> Tuple[float, float]:
+        return self.slope[0] + self.slope[1] * (log_price - self.anchor), self.slope[1]
+
+    def at(self, log_price: float) -> Tuple[float, float]:
+        y = log_price - self.anchor
+        slope, d_slope = self.slope[0] + self.slope[1] * y, self.slope[1]
+        ss_res, d_res = _peval(self.ss_res, y)
+        ss_tot, d_tot = _peval(self.ss_tot, y)
+        if ss_tot == 0:
+            r_squared, d_r2 = (float('nan') if self.weighted else 0.0), 0.0
+        else:
+            r_squared = 1 - ss_res / ss_tot
+            d_r2 = -(d_res * ss_tot - ss_res * d_tot) / (ss_tot * ss_tot)
+
+        growth = math.exp(250 * slope)
+        annualized_returns = growth - 1
+        d_ann = 250 * d_slope * growth
+        return annualized_returns * r_squared, d_ann * r_squared + annualized_returns * d_r2
+
+
+def rank_score_function(
+    long_trend: NextWindowTrend, short_trend: NextWindowTrend
+) -> Callable[[float], Tuple[float, float]]:
+    """
+    LocalRankStrategy 综合得分关于 ln(p) 的函数：sigmoid(长周期得分) × sigmoid(短周期斜率)，双负翻转
+    """
+
+    def score(log_price: float) -> Tuple[float, float]:
+        long_raw, d_long = long_trend.at(log_price)
+        short_raw, d_short = short_trend.slope_at(log_price)
+        long_sig = 1.0 / (1.0 + math.exp(-long_raw))
+        short_sig = 1.0 / (1.0 + math.exp(-short_raw))
+        value = long_sig * short_sig
+        deriv = long_sig * (1 - long_sig) * d_long * short_sig + long_sig * short_sig * (1 - short_sig) * d_short
+        if long_raw < 0 and short_raw < 0:
+            return -value, -deriv
+        return value, deriv
+
+    return score
+
+
+def solve_flip_log_price(
+    score: Callable[[float], Tuple[float, float]],
+    target: float,
+    log_price: float,
+    max_log_move: float = 0.25,
+    tol: float = 1e-12,
+) -> float:
+    """
+    求距当前价格最近、使 score(y) = target 的 y=ln(p)
+
+    先以 0.5% 起倍增的步长向两侧交替搜索变号区间（最远 ±max_log_move），
+    再从区间内的弦截点出发做牛顿迭代，迭代点越界时退回二分；无解时返回 NaN。
+    评分在双负翻转处不连续时，收敛到跳变点，即排名实际发生变化的价格。
+    """
+
+    def f(y):
+        value, deriv = score(y)
+        return value - target, deriv
+
+    f0 = f(log_price)[0]
+    if f0 == 0:
+        return log_price
+
+    # 向两侧交替扩展 [inner, radius] 环带，复用上一环的外侧端点
+    bracket = None
+    inner, radius = 0.0, 0.005
+    edge_values = {1: f0, -1: f0}
+    while bracket is None and inner < max_log_move:
+        radius = min(radius, max_log_move)
+        for sign in (1, -1):
+            fa = edge_values[sign]
+            b = log_price + sign * radius
+            fb = f(b)[0]
+            if fb == 0:
+                return b
+            if fa * fb < 0:
+                bracket = (log_price + sign * inner, fa, b, fb)
+                break
+            edge_values[sign] = fb
+        inner, radius = radius, radius * 2
+
+    if bracket is None:
+        return float('nan')
+
+    a, fa, b, fb = bracket
+    (lo, f_lo), (hi, f_hi) = sorted([(a, fa), (b, fb)])
+
+    # 从弦截点出发做牛顿迭代，越界时退回二分
+    y = lo - f_lo * (hi - lo) / (f_hi - f_lo)
+    for _ in range(100):
+        value, deriv = f(y)
+        if value == 0:
+            return y
+        if (value < 0) == (f_lo < 0):
+            lo, f_lo = y, value
+        else:
+            hi = y
+        step = value / deriv if deriv != 0 and math.isfinite(deriv) else float('inf')
+        if abs(step) <= tol * max(1.0, abs(y)):
+            return y - step
+        y_next = y - step
+        if not lo < y_next < hi:
+            y_next = 0.5 * (lo + hi)
+        if hi - lo <= tol * max(1.0, abs(y)):
+            return y_next
+        y = y_next
+    return y
+
+
+def pairwise_flip_prices(
+    score_funcs: Mapping[str, Callable[[float], Tuple[float, float]]],
+    prices: Mapping[str, float],
+    max_log_move: float = 0.25,
+) -> pd.DataFrame:
+    """
+    两两换仓临界价：第 i 行第 j 列为 ETF i 今日价格变到多少时，其得分恰好等于 ETF j（按 prices[j]）的得分
+
+    行为持仓ETF时即“跌到多少会被 j 超过”，行为挑战者时即“涨到多少能超过 j”。
+    """
+    codes = list(score_funcs)
+    current = {code: score_funcs[code](math.log(prices[code]))[0] for code in codes}
+    out = np.full((len(codes), len(codes)), np.nan)
+    for i, code in enumerate(codes):
+        y0 = math.log(prices[code])
+        for j, other in enumerate(codes):
+            if i == j or math.isnan(current[other]):
+                continue
+            y = solve_flip_log_price(score_funcs[code], current[other], y0, max_log_move)
+            out[i, j] = math.exp(y) if not math.isnan(y) else np.nan
+    return pd.DataFrame(out, index=codes, columns=codes)
+
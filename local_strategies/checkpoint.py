@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+回测检查点
+一次回测结束后保存组合状态、最后处理的交易日、该日各ETF的收盘价与逐日历史列；
+下次以相同参数、相同起始日回测时载入，只处理之后新增的交易日，每日任务的耗时只与新增天数有关。
+
+文件为单个 .npz：历史记录器的各列按原 dtype 存为数组，其余状态为 JSON 文本，读取不需要 pickle。
+参数、ETF池或起始日不同，或最后处理日的收盘价、各ETF截至该日最近一个评分窗口的收盘价与当前数据不一致（数据被修订）时
+不能续跑，由调用方从头重建：之后各日的评分都取自这段窗口，只比对最后一日会漏掉窗口内较早日期的修订。
+
+write_history_csv 让导出的历史表同样只追加新增的行：逐日导出的每一行只取决于当日记录，
+文件仍是上次写出的内容、列与类型也未变时，追加的结果与整表重写逐字节相同。
+"""
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .history_recorder import HistoryRecorder
+except ImportError:
+    from history_recorder import HistoryRecorder
+
+CHECKPOINT_VERSION = 2
+
+
+@dataclass
+class Checkpoint:
+    key: dict               # 策略参数、ETF池（有序）与回测起始日，与本次回测不同则不能续跑
+    last_date: pd.Timestamp
+    closes: List[float]     # last_date 各ETF（顺序同 key['etfs']）的 as-of 收盘价
+    window_digest: str      # 各ETF截至 last_date 最近 max(窗口) 个收盘价的摘要，见 closes_digest
+    portfolio: dict         # cash / positions / total_value / trades
+    history: HistoryRecorder
+    extra: dict             # 策略自行保存的状态，如最后一日的评分
+
+    def matches(self, key: dict, closes, window_digest: str) -> bool:
+        """
+        本次回测能否接着该检查点继续：参数与ETF池相同，且最后处理日的收盘价与最近一个评分窗口的收盘价均未被修订
+        """
+        return (
+            self.key == key
+            and self.window_digest == window_digest
+            and np.array_equal(
+                np.asarray(self.closes, dtype=np.float64), np.asarray(closes, dtype=np.float64), equal_nan=True
+            )
+        )
+
+
+def closes_digest(windows: Mapping[str, np.ndarray]) -> str:
+    """
+    {代码: 一段收盘价} 的 SHA-256 摘要：依次写入代码、长度与 float64 字节，任一代码、价格或长度变化摘要都不同
+    """
+    digest = hashlib.sha256()
+    for code, window in windows.items():
+        window = np.ascontiguousarray(window, dtype=np.float64)
+        digest.update(code.encode())
+        digest.update(np.int64(len(window)).tobytes())
+        digest.update(window.tobytes())
+    return digest.hexdigest()
+
+
+def _to_builtin(value):
+    # 持仓与交易中的 numpy 标量按 Python 数值写出
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'无法写入检查点: {type(value).__name__}')
+
+
+def save_checkpoint(path, checkpoint: Checkpoint) -> None:
+    """
+    写入检查点（先写临时文件再替换，中途失败不会留下半个文件）
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    history_meta, arrays = checkpoint.history.to_arrays()
+    state = {
+        'version': CHECKPOINT_VERSION,
+        'key': checkpoint.key,
+        'last_date': checkpoint.last_date.strftime('%Y-%m-%d'),
+        'closes': checkpoint.closes,
+        'window_digest': checkpoint.window_digest,
+        'portfolio': checkpoint.portfolio,
+        'history': history_meta,
+        'extra': checkpoint.extra,
+    }
+    arrays['state'] = np.array(json.dumps(state, ensure_ascii=False, default=_to_builtin))
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    tmp_path.replace(path)
+
+
+def load_checkpoint(path) -> Optional[Checkpoint]:
+    """
+    读取检查点；文件格式版本不同时返回 None
+    """
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {name: data[name] for name in data.files}
+    state = json.loads(str(arrays.pop('state')))
+    if state.get('version') != CHECKPOINT_VERSION:
+        return None
+    return Checkpoint(
+        key=state['key'],
+        last_date=pd.Timestamp(state['last_date']),
+        closes=state['closes'],
+        window_digest=state['window_digest'],
+        portfolio=state['portfolio'],
+        history=HistoryRecorder.from_arrays(state['history'], arrays),
+        extra=state['extra'],
+    )
+
+
+def write_history_csv(
+    export: Callable[[int], pd.DataFrame], rows: int, path: str, encoding: str, previous: Optional[dict] = None
+) -> dict:
+    """
+    写出历史导出表，export(start) 返回第 start 行起的导出格式；previous 为上次写出时返回的记录。
+    文件大小与上次写出时相同、且新行的列与类型不变时只追加 previous['rows'] 之后的行，否则整表重写；
+    返回本次写出的记录 {'path', 'rows', 'size', 'columns', 'dtypes'}
+    """
+    if (
+        previous
+        and previous['path'] == path
+        and previous['rows'] <= rows
+        and os.path.exists(path)
+        and os.path.getsize(path) == previous['size']
+    ):
+        tail = export(previous['rows'])
+        if list(tail.columns) == previous['columns'] and tail.dtypes.astype(str).tolist() == previous['dtypes']:
+            # 追加部分不再写 BOM 与表头
+            tail.to_csv(path, index=False, header=False, mode='a', encoding='utf-8')
+            return dict(previous, rows=rows, size=os.path.getsize(path))
+
+    export_df = export(0)
+    export_df.to_csv(path, index=False, encoding=encoding)
+    return {
+        'path': path,
+        'rows': rows,
+        'size': os.path.getsize(path),
+        'columns': list(export_df.columns),
+        'dtypes': export_df.dtypes.astype(str).tolist(),
+    }
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按日期分块的外存回测
+行情取自 MemmapPriceStore（日期×代码 的内存映射文件），按 chunk_days 行一块顺序读取：
+每块只在内存中保留本块的收盘价、各ETF上一块留下的回看尾部与组合状态，
+评分矩阵、as-of 价格只按块构建，历史记录与交易记录逐块追加写入 CSV。
+内存占用只与 块长×ETF数 有关，不随回测年数增长。
+
+评分口径同 LocalETFStrategy 的 score_mode='matrix'：每只ETF的回看尾部从 kernel_block 的整数倍处截取，
+块内前缀和内核与在完整序列上构建的逐位相同，导出的 CSV 与内存回测一致。
+
+用法: python3 chunked_backtest.py <存储目录> [--start 2015-01-01] [--end 2024-12-31] [--chunk-days 250]
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .asof_index import AsOfIndex, date_keys
+    from .local_strategy import LocalETFStrategy
+    from .memmap_store import MemmapPriceStore
+    from .momentum_kernel import MOM_FIELDS, WindowSumKernel, kernel_block
+    from .trading_calendar import epoch_days, to_timestamps
+except ImportError:
+    from asof_index import AsOfIndex, date_keys
+    from local_strategy import LocalETFStrategy
+    from memmap_store import MemmapPriceStore
+    from momentum_kernel import MOM_FIELDS, WindowSumKernel, kernel_block
+    from trading_calendar import epoch_days, to_timestamps
+
+
+class ChunkedETFStrategy(LocalETFStrategy):
+    """
+    分块外存执行的 LocalETFStrategy
+
+    交易、估值、历史记录沿用父类的 trade / update_portfolio_value / _record_history，
+    只把评分矩阵与 as-of 价格换成按块构建的版本；portfolio['history'] 不在内存中累积，
+    回测结束时 portfolio['trades'] 只含最后一块尚未写出的交易（即为空）。
+    etf_config 缺省为存储中的全部代码（名称即代码）。
+    """
+
+    def __init__(self, store, etf_config=None, chunk_days=250):
+        self.store = store if isinstance(store, MemmapPriceStore) else MemmapPriceStore(store)
+        self.chunk_days = chunk_days
+        if etf_config is None:
+            etf_config = {code: {'name': code, 'file': f'{code}_data.csv'} for code in self.store.codes}
+        super().__init__(data_dir=self.store.root, score_mode='matrix', etf_config=etf_config)
+
+    def load_data(self):
+        """
+        附加行情存储（不读入数据），初始化持仓
+        """
+        print("正在附加行情存储...")
+        self.codes = [code for code in self.etf_config if code in self.store]
+        for etf_code in self.etf_config:
+            if etf_code not in self.store:
+                print(f"✗ 存储中没有 {self.etf_config[etf_code]['name']}({etf_code})")
+        self._columns = self.store.columns(self.codes)
+        for etf_code in self.codes:
+            self.portfolio['positions'][etf_code] = {'shares': 0, 'value': 0}
+        print(f"存储附加完成，共 {len(self.codes)} 只ETF × {len(self.store)} 个日期")
+
+    def _block(self, start, stop):
+        """
+        存储第 [start, stop) 行、本策略各ETF的收盘价（复制到内存）
+        """
+        return np.array(self.store.array('close')[start:stop][:, self._columns], dtype=np.float64)
+
+    def _row_blocks(self, stop):
+        for start in range(0, stop, self.chunk_days):
+            yield start, self._block(start, min(start + self.chunk_days, stop))
+
+    def get_trading_dates(self):
+        """
+        所有ETF都有数据的日期（逐块扫描），从第 m_days 个开始
+        """
+        if not self.codes:
+            return []
+        rows = [
+            start + np.flatnonzero(~np.isnan(block).any(axis=1))
+            for start, block in self._row_blocks(len(self.store))
+        ]
+        common_dates = list(to_timestamps(self.store.days[np.concatenate(rows)]))
+        if len(common_dates) > self.m_days:
+            return common_dates[self.m_days:]
+        print(f"警告：共同交易日期不足，需要至少{self.m_days}天历史数据")
+        return []
+
+    def _set_chunk_scores(self, dates, before, series, base):
+        """
+        本块交易日的评分矩阵，before[i, j] 为第 i 个交易日之前第 j 只ETF已有的数据条数
+        """
+        matrix = {name: np.full(before.shape, np.nan) for name in MOM_FIELDS}
+        for j, values in enumerate(series):
+            if not before[:, j].any():
+                continue
+            table = WindowSumKernel(values).table(self.m_days, weighted=True)
+            positions = before[:, j] - base[j]
+            for name in MOM_FIELDS:
+                matrix[name][:, j] = table[name][positions]
+        matrix['score'] = np.where(before >= self.m_days, matrix['score'], -999.0)
+
+        self.score_dates = pd.DatetimeIndex(dates)
+        self.score_codes = list(self.codes)
+        self.score_matrix = matrix
+        self._score_rows = {date: i for i, date in enumerate(dates)}
+
+    def _set_chunk_prices(self, keys_of_rows, block, valid, last_key, last_close):
+        """
+        本块的 as-of 价格索引，块首之前最近一个收盘价作为第一个键
+        """
+        keys, values = {}, {}
+        for j, etf_code in enumerate(self.codes):
+            rows = valid[:, j]
+            if np.isnan(last_close[j]):
+                keys[etf_code], values[etf_code] = keys_of_rows[rows], block[rows, j]
+            else:
+                keys[etf_code] = np.concatenate([[last_key[j]], keys_of_rows[rows]])
+                values[etf_code] = np.concatenate([[last_close[j]], block[rows, j]])
+        self.asof_prices = AsOfIndex(keys, values)
+
+    def run_backtest(
+        self,
+        start_date=None,
+        end_date=None,
+        results_path='analysis_results/backtest_results.csv',
+        trades_path='analysis_results/trades_record.csv',
+    ):
+        """
+        分块运行回测，结果逐块写入 results_path / trades_path
+        """
+        print("\n" + "="*60)
+        print("开始分块回测...")
+        print("="*60)
+
+        trading_dates = self.get_trading_dates()
+        if start_date:
+            start_date = pd.to_datetime(start_date)
+            trading_dates = [d for d in trading_dates if d >= start_date]
+        if end_date:
+            end_date = pd.to_datetime(end_date)
+            trading_dates = [d for d in trading_dates if d <= end_date]
+        if not trading_dates:
+            print("错误：没有足够的交易数据")
+            return
+
+        print(f"回测期间: {trading_dates[0].strftime('%Y-%m-%d')} 到 {trading_dates[-1].strftime('%Y-%m-%d')}")
+        print(f"交易日数: {len(trading_dates)}天, 每块 {self.chunk_days} 个日期")
+        print(f"初始资金: {self.initial_capital:,.0f}元")
+
+        trading_rows = np.searchsorted(self.store.days, epoch_days(trading_dates))
+        n = len(self.codes)
+        block_size = kernel_block(self.m_days)
+
+        # 跨块携带的状态：已有数据条数、回看尾部（自 base 起的压缩收盘价）、最近一个收盘价
+        count = np.zeros(n, dtype=np.int64)
+        base = np.zeros(n, dtype=np.int64)
+        tails = [np.empty(0) for _ in range(n)]
+        last_key = np.zeros(n, dtype=np.int64)
+        last_close = np.full(n, np.nan)
+
+        curve_dates, curve_values = [], []
+        written = {results_path: False, trades_path: False}
+        n_trades = 0
+
+        def append_csv(df, path, encoding):
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            if written[path]:
+                df.to_csv(path, index=False, header=False, mode='a', encoding='utf-8')
+            else:
+                df.to_csv(path, index=False, encoding=encoding)
+                written[path] = True
+
+        for start, block in self._row_blocks(int(trading_rows[-1]) + 1):
+            valid = ~np.isnan(block)
+            keys_of_rows = date_keys(to_timestamps(self.store.days[start:start + len(block)]))
+            series = [np.concatenate([tails[j], block[valid[:, j], j]]) for j in range(n)]
+            in_block = np.flatnonzero((trading_rows >= start) & (trading_rows < start + len(block)))
+
+            if len(in_block):
+                dates = [trading_dates[i] for i in in_block]
+                counts_before = np.vstack([np.zeros((1, n), dtype=np.int64), np.cumsum(valid, axis=0)])
+                before = count + counts_before[trading_rows[in_block] - start]
+                self._set_chunk_scores(dates, before, series, base)
+                self._set_chunk_prices(keys_of_rows, block, valid, last_key, last_close)
+
+                # 每块一个按块内交易日预分配的历史记录器，导出后即丢弃
+                history = self._new_history(dates, self.codes)
+                for i, date in enumerate(dates):
+                    self.trade(date)
+                    portfolio_value = self.update_portfolio_value(date)
+                    self._record_history(history, i, portfolio_value)
+                    curve_dates.append(date)
+                    curve_values.append(portfolio_value)
+                # 账本写回 portfolio，本块的交易进入 portfolio['trades']
+                self._close_book()
+
+                append_csv(self.export_history(history.frame()), results_path, 'utf-8-sig')
+                if self.portfolio['trades']:
+                    n_trades += len(self.portfolio['trades'])
+                    # 初始资金为整数，块内只有首笔买入时金额列会被推断为整数；统一为浮点，与整表导出一致
+                    trades = pd.DataFrame(self.portfolio['trades'])
+                    trades = trades.astype({'shares': float, 'price': float, 'amount': float})
+                    append_csv(trades, trades_path, 'utf-8')
+                    self.portfolio['trades'] = []
+
+            # 下一块的窗口最早从 count - m_days 开始，尾部从其所在内核块的块首保留
+            count = count + valid.sum(axis=0)
+            for j in range(n):
+                keep_from = max(int(count[j]) - self.m_days, 0) // block_size * block_size
+                tails[j] = series[j][keep_from - base[j]:].copy()
+                base[j] = keep_from
+            has_data = valid.any(axis=0)
+            last_row = len(block) - 1 - np.argmax(valid[::-1], axis=0)
+            last_close[has_data] = block[last_row[has_data], np.flatnonzero(has_data)]
+            last_key[has_data] = keys_of_rows[last_row[has_data]]
+
+        self._print_summary(pd.Series(curve_dates), pd.Series(curve_values))
+        print(f"\n详细结果已保存到: {results_path}")
+        if n_trades:
+            print(f"交易记录已保存到: {trades_path}")
+            print(f"共记录 {n_trades} 笔交易")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='按日期分块的外存回测')
+    parser.add_argument('store_dir')
+    parser.add_argument('--start', default=None)
+    parser.add_argument('--end', default=None)
+    parser.add_argument('--chunk-days', type=int, default=250)
+    parser.add_argument('--output-dir', default='analysis_results')
+    args = parser.parse_args()
+
+    strategy = ChunkedETFStrategy(args.store_dir, chunk_days=args.chunk_days)
+    strategy.run_backtest(
+        start_date=args.start,
+        end_date=args.end,
+        results_path=os.path.join(args.output_dir, 'backtest_results.csv'),
+        trades_path=os.path.join(args.output_dir, 'trades_record.csv'),
+    )
+
+
+if __name__ == '__main__':
+    main()
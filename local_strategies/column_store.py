@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+列式行情存储
+按代码分目录、每列一个 .npy 文件（<root>/<code>/date.npy、open.npy、close.npy ...），
+保存东方财富日K线的完整字段（开、收、高、低、成交量、成交额、振幅），数值按接口原始精度存为 float64。
+读取时只打开调用方要求的列（可用内存映射），只用收盘价的策略不必解析其余字段；
+有开盘价后也可按 9:30 开盘价成交来回测。
+
+用法: python3 column_store.py <CSV目录> [--store <存储目录>]   把已有 *_data.csv 的收盘价导入存储
+"""
+
+import argparse
+import os
+import re
+import shutil
+from typing import Dict, Iterable, List, Mapping, Sequence
+
+import numpy as np
+import pandas as pd
+
+# 与数据目录中 CSV 并列存放：data/columns/<code>/
+STORE_DIRNAME = 'columns'
+
+# 日K线 fields2=f51..f58 依次为日期、开盘、收盘、最高、最低、成交量、成交额、振幅
+KLINE_COLUMNS = ('open', 'close', 'high', 'low', 'volume', 'amount', 'amplitude')
+
+# 与 pd.to_datetime 解析字符串时的默认精度一致，读出的索引与 CSV 加载结果相同
+_DATE_DTYPE = pd.to_datetime(pd.Series(['2000-01-01'])).dtype
+
+_PRICE_FILE = re.compile(r'^(\d{6})_data\.csv$')
+
+
+def parse_klines(klines: Iterable[str]) -> Dict[str, np.ndarray]:
+    """
+    解析K线接口返回的 "日期,开,收,高,低,量,额,振幅" 字符串列表，返回按日期升序的各列数组
+
+    字段不全或含非数值的行跳过；数值不做舍入。
+    """
+    dates, rows = [], []
+    for item in klines:
+        parts = item.split(',')
+        if len(parts) < len(KLINE_COLUMNS) + 1:
+            continue
+        try:
+            values = [float(part) for part in parts[1:len(KLINE_COLUMNS) + 1]]
+        except ValueError:
+            continue
+        dates.append(parts[0].strip())
+        rows.append(values)
+
+    date_array = np.asarray(dates, dtype='datetime64[D]')
+    values = np.asarray(rows, dtype=np.float64).reshape(len(rows), len(KLINE_COLUMNS))
+    order = date_array.argsort(kind='stable')
+    columns = {'date': date_array[order]}
+    for k, name in enumerate(KLINE_COLUMNS):
+        columns[name] = np.ascontiguousarray(values[order, k])
+    return columns
+
+
+class ColumnStore:
+    """
+    按代码分区的列式存储
+
+    每个分区必有 date 列（datetime64[D]），其余列与之等长；写入时整个分区先写到临时目录再替换，
+    读取方不会看到只写了一半的分区。
+    """
+
+    def __init__(self, root) -> None:
+        self.root = str(root)
+
+    def path(self, code: str) -> str:
+        return os.path.join(self.root, code)
+
+    def codes(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name for name in os.listdir(self.root)
+            if os.path.isfile(os.path.join(self.root, name, 'date.npy'))
+        )
+
+    def columns(self, code: str) -> List[str]:
+        """
+        分区中已有的列（不含 date）
+        """
+        directory = self.path(code)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-4] for name in os.listdir(directory) if name.endswith('.npy') and name != 'date.npy')
+
+    def has(self, code: str, columns: Sequence[str] = ('close',)) -> bool:
+        directory = self.path(code)
+        return all(os.path.isfile(os.path.join(directory, f'{name}.npy')) for name in ('date',) + tuple(columns))
+
+    def write(self, code: str, columns: Mapping[str, np.ndarray]) -> None:
+        """
+        写入（覆盖）一个分区；columns 须含 date，各列长度一致。追加新数据用 update
+        """
+        dates = np.asarray(columns['date']).astype('datetime64[D]')
+        for name, values in columns.items():
+            if len(values) != len(dates):
+                raise ValueError(f'{code} 的 {name} 列长度 {len(values)} 与日期数 {len(dates)} 不一致')
+
+        os.makedirs(self.root, exist_ok=True)
+        target = self.path(code)
+        staging = f'{target}.tmp'
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        np.save(os.path.join(staging, 'date.npy'), dates)
+        for name, values in columns.items():
+            if name != 'date':
+                np.save(os.path.join(staging, f'{name}.npy'), np.asarray(values, dtype=np.float64))
+
+        if os.path.isdir(target):
+            retired = f'{target}.old'
+            shutil.rmtree(retired, ignore_errors=True)
+            os.replace(target, retired)
+            os.replace(staging, target)
+            shutil.rmtree(retired, ignore_errors=True)
+        else:
+            os.replace(staging, target)
+
+    def update(self, code: str, columns: Mapping[str, np.ndarray]) -> int:
+        """
+        把新抓取的各列并入已有分区（按日期去重，同一日期以新数据为准）后整体写回，返回写入后的总行数
+
+        接口每次只返回最近一段K线，直接 write 会丢掉更早的历史；双方缺少的列在对应行填 NaN。
+        """
+        if not self.has(code, ()):
+            self.write(code, columns)
+            return len(columns['date'])
+
+        stored = self.read(code, self.columns(code), mmap=False)
+        incoming = pd.DataFrame(
+            {name: np.asarray(values, dtype=np.float64) for name, values in columns.items() if name != 'date'},
+            index=pd.DatetimeIndex(np.asarray(columns['date']).astype(_DATE_DTYPE), name='date'),
+        )
+        merged = pd.concat([stored, incoming])
+        merged = merged[~merged.index.duplicated(keep='last')].sort_index()
+        self.import_frame(code, merged)
+        return len(merged)
+
+    def read_column(self, code: str, name: str, mmap: bool = True) -> np.ndarray:
+        """
+        单列原始数组；mmap 为 True 时按需从磁盘映射，不整列读入
+        """
+        return np.load(os.path.join(self.path(code), f'{name}.npy'), mmap_mode='r' if mmap else None)
+
+    def read(self, code: str, columns: Sequence[str] = ('close',), mmap: bool = True) -> pd.DataFrame:
+        """
+        以 date 为索引、只含所要求列的 DataFrame（格式与 load_price_data 相同）；未要求的列文件不会被打开
+        """
+        missing = [name for name in columns if not os.path.isfile(os.path.join(self.path(code), f'{name}.npy'))]
+        if missing:
+            raise KeyError(f'{code} 缺少列: {", ".join(missing)}')
+        index = pd.DatetimeIndex(self.read_column(code, 'date', mmap).astype(_DATE_DTYPE), name='date')
+        return pd.DataFrame({name: np.array(self.read_column(code, name, mmap)) for name in columns}, index=index)
+
+    def read_many(self, codes: Iterable[str], columns: Sequence[str] = ('close',)) -> Dict[str, pd.DataFrame]:
+        return {code: self.read(code, columns) for code in codes}
+
+    def import_frame(self, code: str, df: pd.DataFrame) -> None:
+        """
+        把以日期为索引的 DataFrame（如 load_price_data 的结果）写为分区，已有列原样保存
+        """
+        columns = {'date': df.index.values}
+        columns.update({name: df[name].to_numpy(dtype=np.float64) for name in df.columns})
+        self.write(code, columns)
+
+
+def main() -> None:
+    try:
+        from .data_loader import load_price_data
+    except ImportError:
+        from data_loader import load_price_data
+
+    parser = argparse.ArgumentParser(description='把 CSV 行情导入列式存储')
+    parser.add_argument('data_dir')
+    parser.add_argument('--store', default=None, help=f'存储目录，缺省为 <CSV目录>/{STORE_DIRNAME}')
+    args = parser.parse_args()
+
+    store = ColumnStore(args.store or os.path.join(args.data_dir, STORE_DIRNAME))
+    for name in sorted(os.listdir(args.data_dir)):
+        match = _PRICE_FILE.match(name)
+        if match:
+            df = load_price_data(os.path.join(args.data_dir, name))
+            store.import_frame(match.group(1), df)
+            print(f'{match.group(1)}: {len(df)} 条 -> {store.path(match.group(1))}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+紧凑数据表示
+策略以 compact=True 构建时：收盘价（加载的 DataFrame、PricePanel、as-of 索引）按 float32 存放，
+评分矩阵按 float32 保存并释放因子引擎中的 float64 中间结果。
+计算本身仍在 float64 上进行，误差只来自价格与评分的单精度舍入，对比见 compact_report.py。
+
+另提供定宽的表示：日期为 int32 的 epoch 天数，代码为 int16 编号或 category，
+用于汇总行情表与回测历史的存放。
+"""
+
+from typing import Dict, Sequence
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .history_recorder import HistoryRecorder, history_frame
+    from .trading_calendar import epoch_days
+except ImportError:
+    from history_recorder import HistoryRecorder, history_frame
+    from trading_calendar import epoch_days
+
+PRICE_DTYPE = np.float32
+SCORE_DTYPE = np.float32
+DAY_DTYPE = np.int32
+CODE_DTYPE = np.int16
+
+# 历史记录中金额列保持 float64：组合市值在 1e5 量级，float32 只能精确到约 0.01 元
+_MONEY_COLUMNS = ('total_value', 'cash')
+
+
+def compact_long_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    汇总行情表（date, net_value, code，如 all_funds_data.csv 或 PartitionedPriceStore.combined()）的紧凑形式：
+    day 为 int32 epoch 天数，net_value 为 float32，code 为 category
+    """
+    return pd.DataFrame({
+        'day': epoch_days(pd.to_datetime(df['date'])).astype(DAY_DTYPE),
+        'net_value': df['net_value'].to_numpy(dtype=PRICE_DTYPE),
+        'code': df['code'].astype(str).astype('category'),
+    })
+
+
+def compact_history(history_df: pd.DataFrame, codes: Sequence[str]) -> pd.DataFrame:
+    """
+    回测历史转为定宽列：day（int32）、total_value / cash（float64）、held（int16，codes 中的编号，现金为 -1）、
+    各评分明细列（float32）；每日持仓字典等对象列不保留
+    """
+    code_ids = {code: i for i, code in enumerate(codes)}
+
+    def held_id(position: str) -> int:
+        # current_position 形如 “名称(代码)” 或 “现金”
+        return code_ids.get(position.rsplit('(', 1)[-1].rstrip(')'), -1) if position.endswith(')') else -1
+
+    out = {
+        'day': epoch_days(pd.DatetimeIndex(history_df['date'])).astype(DAY_DTYPE),
+        'total_value': history_df['total_value'].to_numpy(dtype=np.float64),
+        'cash': history_df['cash'].to_numpy(dtype=np.float64),
+        'held': np.array([held_id(p) for p in history_df['current_position']], dtype=CODE_DTYPE),
+    }
+    for column in history_df.columns:
+        if column in out or column in ('date', 'current_position', 'positions') or column in _MONEY_COLUMNS:
+            continue
+        out[column] = pd.to_numeric(history_df[column], errors='coerce').to_numpy(dtype=SCORE_DTYPE)
+    return pd.DataFrame(out)
+
+
+def strategy_nbytes(strategy) -> Dict[str, int]:
+    """
+    策略各部分数据占用的字节数：加载的行情、价格面板、as-of 索引、因子缓存、评分、历史记录
+    """
+    if hasattr(strategy, 'score_panel'):
+        scores = strategy.score_panel.nbytes
+    else:
+        scores = sum(values.nbytes for values in strategy.score_matrix.values())
+    history = strategy.portfolio['history']
+    if isinstance(history, HistoryRecorder):
+        history_bytes = history.nbytes
+    else:
+        history_bytes = int(history_frame(history).memory_usage(deep=True).sum()) if len(history) else 0
+    return {
+        'etf_data': int(sum(df.memory_usage(deep=True).sum() for df in strategy.etf_data.values())),
+        'price_panel': strategy.price_panel.nbytes,
+        'asof_prices': strategy.asof_prices.nbytes,
+        'factor_cache': strategy.factor_engine.nbytes,
+        'scores': int(scores),
+        'history': history_bytes,
+    }
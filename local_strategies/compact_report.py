@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+紧凑模式的精度与内存报告
+同一数据、同一区间分别以 float64 与 compact=True 运行 LocalETFStrategy 与 LocalRankStrategy（score_mode='matrix'），
+对比评分、每日首选、交易日期与代码、资金曲线与最终市值，以及各部分数据占用的内存。
+回测输出写到临时目录，不覆盖 analysis_results。
+
+用法: python3 compact_report.py [数据目录] [--start 2024-01-01] [--end 2025-10-27]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+from typing import Dict
+
+import numpy as np
+
+try:
+    from .compact import compact_history, strategy_nbytes
+    from .history_recorder import history_frame
+    from .local_rank_strategy import LocalRankStrategy
+    from .local_strategy import LocalETFStrategy
+except ImportError:
+    from compact import compact_history, strategy_nbytes
+    from history_recorder import history_frame
+    from local_rank_strategy import LocalRankStrategy
+    from local_strategy import LocalETFStrategy
+
+
+def _run(cls, data_dir: str, start: str, end: str, compact: bool, workdir: str):
+    # LocalETFStrategy 的结果写到当前目录下的 analysis_results，在临时目录中运行
+    os.makedirs(os.path.join(workdir, 'analysis_results'), exist_ok=True)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            if cls is LocalRankStrategy:
+                strategy = cls(data_dir=data_dir, output_dir=os.path.join(workdir, 'rank'), compact=compact)
+            else:
+                strategy = cls(data_dir=data_dir, compact=compact)
+            strategy.run_backtest(start_date=start, end_date=end)
+    finally:
+        os.chdir(cwd)
+    return strategy
+
+
+def _scores(strategy) -> np.ndarray:
+    if isinstance(strategy, LocalRankStrategy):
+        return strategy.score_panel['combined_score'].astype(np.float64)
+    return strategy.score_matrix['score'].astype(np.float64)
+
+
+def compare(full, compact) -> Dict[str, object]:
+    """
+    对比 float64 与紧凑模式两次回测的结果
+    """
+    scores, compact_scores = _scores(full), _scores(compact)
+    valid = (scores != -999) & ~np.isnan(scores) & (compact_scores != -999) & ~np.isnan(compact_scores)
+    errors = np.abs(scores[valid] - compact_scores[valid])
+    relative = errors / np.maximum(np.abs(scores[valid]), 1e-12)
+
+    trades = [(t['date'], t['type'], t['code']) for t in full.portfolio['trades']]
+    compact_trades = [(t['date'], t['type'], t['code']) for t in compact.portfolio['trades']]
+    first_diff = next(
+        (i for i, (a, b) in enumerate(zip(trades, compact_trades)) if a != b),
+        None if len(trades) == len(compact_trades) else min(len(trades), len(compact_trades)),
+    )
+
+    history, compact_history_df = history_frame(full.portfolio['history']), history_frame(compact.portfolio['history'])
+    equity = history['total_value'].to_numpy(dtype=np.float64)
+    compact_equity = compact_history_df['total_value'].to_numpy(dtype=np.float64)
+    curve = np.abs(compact_equity - equity) / equity if len(equity) == len(compact_equity) else np.array([np.inf])
+
+    memory = {'float64': strategy_nbytes(full), 'compact': strategy_nbytes(compact)}
+    codes = list(compact.etf_config)
+    memory['compact']['history'] = int(compact_history(compact_history_df, codes).memory_usage(deep=True).sum())
+
+    return {
+        'days': len(equity),
+        'scores': int(valid.sum()),
+        'max_abs_error': float(errors.max()) if len(errors) else 0.0,
+        'max_rel_error': float(relative.max()) if len(relative) else 0.0,
+        'pick_diff_days': int((np.argmax(scores, axis=1) != np.argmax(compact_scores, axis=1)).sum()),
+        'trades': (len(trades), len(compact_trades)),
+        'first_trade_diff': first_diff,
+        'final_value': (float(equity[-1]), float(compact_equity[-1])),
+        'max_curve_rel_error': float(curve.max()),
+        'memory': memory,
+    }
+
+
+def print_report(name: str, result: Dict[str, object]) -> None:
+    full_value, compact_value = result['final_value']
+    print(f"\n== {name}（{result['days']} 个交易日）==")
+    print(f"评分: 最大绝对误差 {result['max_abs_error']:.3e}, 最大相对误差 {result['max_rel_error']:.3e}（共 {result['scores']} 个有效评分）")
+    print(f"每日首选: {result['pick_diff_days']} 日不同")
+    n_full, n_compact = result['trades']
+    if result['first_trade_diff'] is None:
+        print(f"交易: {n_full} 笔，日期、方向与代码全部一致")
+    else:
+        print(f"交易: float64 {n_full} 笔, 紧凑 {n_compact} 笔，第 {result['first_trade_diff'] + 1} 笔起不同")
+    print(
+        f"最终市值: float64 {full_value:,.2f} 元, 紧凑 {compact_value:,.2f} 元, "
+        f"相对误差 {abs(compact_value - full_value) / full_value:.3e}; 资金曲线最大相对误差 {result['max_curve_rel_error']:.3e}"
+    )
+    full, compact = result['memory']['float64'], result['memory']['compact']
+    print(f"  {'部分':<14}{'float64 字节':>14}{'紧凑 字节':>14}")
+    for part in full:
+        print(f"  {part:<14}{full[part]:>14,}{compact[part]:>14,}")
+    print(f"  {'合计':<14}{sum(full.values()):>14,}{sum(compact.values()):>14,}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='紧凑模式与 float64 的精度、内存对比')
+    parser.add_argument('data_dir', nargs='?', default='data')
+    parser.add_argument('--start', default='2024-01-01')
+    parser.add_argument('--end', default=None)
+    args = parser.parse_args()
+    data_dir = os.path.abspath(args.data_dir)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for cls in (LocalETFStrategy, LocalRankStrategy):
+            full = _run(cls, data_dir, args.start, args.end, False, os.path.join(workdir, 'float64'))
+            compact = _run(cls, data_dir, args.start, args.end, True, os.path.join(workdir, 'compact'))
+            print_report(cls.__name__, compare(full, compact))
+
+
+if __name__ == '__main__':
+    main()
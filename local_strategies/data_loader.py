@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+行情数据加载
+各脚本读取 data/*_data.csv 时共用同一套列名标准化（net_value / 单位净值、净值日期 -> close / date），
+解析结果按 (文件路径, 修改时间) 缓存在进程内的 LRU 中，并受内存上限约束；
+同一进程里的回测、分析脚本反复读取同一文件时只解析一次。
+
+解析时先读表头确定列名，只取日期、收盘价两列并直接转为 datetime64 / float64（大文件用 read_csv 并声明列与类型，
+有 pyarrow 时用其引擎），省去类型推断与事后的 to_datetime / to_numeric 两遍转换；
+遇到格式不符的文件退回逐列转换的宽松解析。文件较多时 prefetch 用线程池并行解析。
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# 不超过该大小的文件逐行切分后直接做类型转换，更大的文件交给 read_csv
+SMALL_FILE_BYTES = 1024 * 1024
+
+# 有 pyarrow 时使用其多线程 CSV 引擎，否则使用 pandas 的 C 引擎
+CSV_ENGINE = 'pyarrow' if find_spec('pyarrow') is not None else 'c'
+
+# 文件数不少于该值时 prefetch 才启用线程池
+PARALLEL_MIN_FILES = 8
+
+_CLOSE_COLUMNS = ('net_value', '单位净值')
+
+# 与 pd.to_datetime 解析字符串时的默认精度一致
+_DATE_DTYPE = pd.to_datetime(pd.Series(['2000-01-01'])).dtype
+
+
+def normalize_price_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    统一列名为 date / close，按日期排序设为索引，收盘价转数值并剔除缺失
+    """
+    if 'close' not in df.columns:
+        for column in _CLOSE_COLUMNS:
+            if column in df.columns:
+                df = df.rename(columns={column: 'close'})
+                break
+    if 'date' not in df.columns and '净值日期' in df.columns:
+        df = df.rename(columns={'净值日期': 'date'})
+
+    df['date'] = pd.to_datetime(df['date'])
+    df = df.sort_values('date').set_index('date')
+    df['close'] = pd.to_numeric(df['close'], errors='coerce')
+    return df.dropna(subset=['close'])
+
+
+def _read_header(path: str) -> list:
+    with open(path, encoding='utf-8-sig') as f:
+        return [name.strip().strip('"') for name in f.readline().rstrip('\r\n').split(',')]
+
+
+def _split_columns(path: str, date_index: int, close_index: int) -> Tuple[list, list]:
+    # 小文件逐行切分比 read_csv 的固定开销更省时
+    maxsplit = max(date_index, close_index) + 1
+    with open(path, encoding='utf-8-sig') as f:
+        f.readline()
+        rows = [line.rstrip('\r\n').split(',', maxsplit) for line in f if line.strip()]
+    return [row[date_index] for row in rows], [row[close_index] for row in rows]
+
+
+def _engine_columns(path: str, date_column: str, close_column: str) -> Tuple[np.ndarray, np.ndarray]:
+    df = pd.read_csv(
+        path,
+        usecols=[date_column, close_column],
+        dtype={date_column: str, close_column: np.float64},
+        encoding='utf-8-sig',
+        engine=CSV_ENGINE,
+    )
+    return df[date_column].to_numpy(), df[close_column].to_numpy()
+
+
+def _price_frame(dates: np.ndarray, closes: np.ndarray) -> pd.DataFrame:
+    # 与 sort_values('date') 相同的排序方式，同一日期多行时顺序也与原实现一致
+    dates = dates.astype(_DATE_DTYPE)
+    order = dates.argsort(kind='quicksort')
+    order = order[~np.isnan(closes[order])]
+    index = pd.DatetimeIndex(dates[order], name='date')
+    return pd.DataFrame({'close': closes[order]}, index=index)
+
+
+def read_price_csv(path: str) -> pd.DataFrame:
+    """
+    解析单个行情文件，返回以 date 为索引、只含 close 列的 DataFrame
+
+    按表头只取日期、收盘价两列，日期按 YYYY-MM-DD 直接转为 datetime64[D]，收盘价直接转为 float64；
+    小文件逐行切分，大文件用 read_csv（声明列与类型）。
+    """
+    header = _read_header(path)
+    close_column = next((c for c in ('close',) + _CLOSE_COLUMNS if c in header), None)
+    date_column = 'date' if 'date' in header else '净值日期'
+
+    if close_column is not None and date_column in header:
+        try:
+            if os.path.getsize(path) <= SMALL_FILE_BYTES:
+                dates, closes = _split_columns(path, header.index(date_column), header.index(close_column))
+            else:
+                dates, closes = _engine_columns(path, date_column, close_column)
+            return _price_frame(np.asarray(dates, dtype='datetime64[D]'), np.asarray(closes, dtype=np.float64))
+        except (ValueError, TypeError, IndexError):
+            pass
+
+    # 收盘价含非数值、日期格式不一致等情况：读入全部列后逐列宽松转换
+    return normalize_price_frame(pd.read_csv(path, encoding='utf-8-sig'))[['close']]
+
+
+class PriceDataLoader:
+    """
+    带 LRU 缓存的行情文件加载器
+
+    键为 (绝对路径, 修改时间)，文件被改写后自动重新解析；缓存总占用超过 max_bytes 时淘汰最久未用的文件。
+    返回的是缓存帧的浅拷贝：调用方对其改写（写时复制）不会影响缓存中的数据。
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, max_workers: Optional[int] = None) -> None:
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._cache: 'OrderedDict[Tuple[str, int], Tuple[pd.DataFrame, int]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(path) -> Tuple[str, int]:
+        path = os.path.abspath(str(path))
+        return path, os.stat(path).st_mtime_ns
+
+    def _lookup(self, key: Tuple[str, int]) -> Optional[pd.DataFrame]:
+        with self._lock:
+            if key not in self._cache:
+                return None
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return self._cache[key][0]
+
+    def _store(self, key: Tuple[str, int], df: pd.DataFrame) -> None:
+        size = int(df.index.nbytes + df.to_numpy().nbytes)
+        with self._lock:
+            self.misses += 1
+            # 同一文件的旧版本直接丢弃
+            for stale in [k for k in self._cache if k[0] == key[0]]:
+                self._evict(stale)
+            if size <= self.max_bytes:
+                self._cache[key] = (df, size)
+                self.nbytes += size
+                while self.nbytes > self.max_bytes:
+                    self._evict(next(iter(self._cache)))
+
+    def load(self, path) -> pd.DataFrame:
+        key = self._key(path)
+        df = self._lookup(key)
+        if df is None:
+            df = read_price_csv(key[0])
+            self._store(key, df)
+        return df.copy(deep=False)
+
+    def prefetch(self, paths: Iterable, max_workers: Optional[int] = None) -> int:
+        """
+        解析尚未缓存的文件放入缓存，返回新解析的文件数
+
+        文件数不少于 PARALLEL_MIN_FILES 且有多个CPU时用线程池并行解析（单核上线程只增加开销）；
+        不存在或解析失败的文件跳过，留给 load 时报告。
+        """
+        pending = {}
+        for path in paths:
+            try:
+                key = self._key(path)
+            except OSError:
+                continue
+            if key not in self._cache:
+                pending[key[0]] = key
+
+        def parse(key):
+            try:
+                return key, read_price_csv(key[0])
+            except Exception:
+                return key, None
+
+        keys = list(pending.values())
+        workers = max_workers or self.max_workers or min(32, (os.cpu_count() or 1) + 4)
+        if len(keys) >= PARALLEL_MIN_FILES and workers > 1 and (os.cpu_count() or 1) > 1:
+            with ThreadPoolExecutor(workers) as pool:
+                results = list(pool.map(parse, keys))
+        else:
+            results = [parse(key) for key in keys]
+
+        parsed = 0
+        for key, df in results:
+            if df is not None:
+                self._store(key, df)
+                parsed += 1
+        return parsed
+
+    def _evict(self, key: Tuple[str, int]) -> None:
+        _, size = self._cache.pop(key)
+        self.nbytes -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self.nbytes = 0
+
+
+# 进程内共用的加载器，内存上限可通过 default_loader.max_bytes 调整
+default_loader = PriceDataLoader()
+
+
+def load_price_data(path) -> pd.DataFrame:
+    return default_loader.load(path)
+
+
+def prefetch_price_data(paths: Iterable, max_workers: Optional[int] = None) -> int:
+    return default_loader.prefetch(paths, max_workers)
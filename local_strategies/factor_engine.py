@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+因子引擎
+把对数收益、滚动回归斜率、R²、波动率、回撤、均线等声明为带显式依赖的节点，
+每个节点按 (数据版本, 参数) 在整张 日期×ETF 面板上只计算一次，并以 LRU 缓存复用。
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .momentum_kernel import WindowSumKernel
+    from .price_panel import PricePanel
+except ImportError:
+    from momentum_kernel import WindowSumKernel
+    from price_panel import PricePanel
+
+
+@dataclass(frozen=True)
+class FactorNode:
+    name: str
+    func: Callable
+    deps: Tuple[str, ...] = ()
+    params: Tuple[str, ...] = ()
+
+
+FACTOR_NODES: Dict[str, FactorNode] = {}
+
+
+def factor(name: str, deps: Tuple[str, ...] = (), params: Tuple[str, ...] = ()):
+    """
+    注册因子节点：func(engine, *依赖值, **参数) -> 与面板同形状的矩阵（或内核等中间结果）
+
+    依赖节点使用本节点参数中与其声明同名的那部分参数。
+    """
+
+    def decorator(func: Callable) -> Callable:
+        FACTOR_NODES[name] = FactorNode(name, func, tuple(deps), tuple(params))
+        return func
+
+    return decorator
+
+
+class FactorEngine:
+    """
+    日期×ETF 面板上的因子计算与缓存
+
+    面板日期为各ETF日期的并集，某只ETF当天无数据时为 NaN。所有节点都在每只ETF
+    自身的有效行上计算（窗口按该ETF的交易日滑动），第 t 行的值只用到 t 及之前的数据。
+    """
+
+    def __init__(self, closes: pd.DataFrame, max_entries: int = 128) -> None:
+        self.max_entries = max_entries
+        self.data_version = 0
+        self.hits = 0
+        self.misses = 0
+        self._cache: 'OrderedDict[tuple, object]' = OrderedDict()
+        self._set_panel(closes)
+
+    @classmethod
+    def from_frames(cls, etf_data: Dict[str, pd.DataFrame], max_entries: int = 128) -> 'FactorEngine':
+        return cls(cls.frames_to_panel(etf_data), max_entries=max_entries)
+
+    @classmethod
+    def from_panel(cls, panel: 'PricePanel', max_entries: int = 128) -> 'FactorEngine':
+        """
+        由已对齐的 PricePanel 构建，与策略共用同一份收盘价数组
+        """
+        return cls(panel.frame(), max_entries=max_entries)
+
+    @staticmethod
+    def frames_to_panel(etf_data: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+        return pd.DataFrame({code: df['close'] for code, df in etf_data.items()}).sort_index()
+
+    def _set_panel(self, closes: pd.DataFrame) -> None:
+        self.dates = pd.DatetimeIndex(closes.index)
+        self.codes = list(closes.columns)
+        # 紧凑模式的 float32 面板按原 dtype 引用（与 PricePanel 共用内存），其余按 float64；
+        # 各因子计算时逐列转为 float64，结果与 float64 面板相同
+        compact = len(self.codes) > 0 and all(dtype == np.float32 for dtype in closes.dtypes)
+        self.closes = closes.to_numpy(dtype=np.float32 if compact else np.float64)
+        self.valid = ~np.isnan(self.closes)
+
+    def update(self, closes: pd.DataFrame) -> None:
+        """
+        替换面板数据并提升数据版本，旧版本的缓存随 LRU 自然淘汰
+        """
+        self._set_panel(closes)
+        self.data_version += 1
+
+    def get(self, name: str, **params):
+        """
+        取因子值：命中缓存直接返回，否则先递归计算依赖再计算本节点
+        """
+        node = FACTOR_NODES[name]
+        unknown = set(params) - set(node.params)
+        if unknown:
+            raise ValueError(f"因子 {name} 不接受参数: {sorted(unknown)}")
+
+        key = (name, self.data_version, tuple(sorted(params.items())))
+
+        def compute():
+            dep_values = []
+            for dep in node.deps:
+                dep_params = {k: v for k, v in params.items() if k in FACTOR_NODES[dep].params}
+                dep_values.append(self.get(dep, **dep_params))
+            return node.func(self, *dep_values, **params)
+
+        return self._cached(key, compute)
+
+    def _cached(self, key: tuple, compute: Callable):
+        if key in self._cache:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        self.misses += 1
+        value = compute()
+        self._cache[key] = value
+        if len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return value
+
+    @property
+    def nbytes(self) -> int:
+        """
+        面板与缓存中矩阵占用的字节数（内核等非数组的缓存项不计，close 节点即面板本身）
+        """
+        cached = sum(
+            value.nbytes for value in self._cache.values()
+            if isinstance(value, np.ndarray) and value is not self.closes
+        )
+        return int(self.closes.nbytes + self.valid.nbytes + cached)
+
+    def preload(self, name: str, value, forward_filled: bool = False, **params) -> None:
+        """
+        放入在别处算好的因子值（如共享内存中的矩阵），之后 get 直接命中
+
+        forward_filled=True 时放入的是 lookup_before 使用的向前填充矩阵。
+        """
+        key = ('ffill:' + name if forward_filled else name, self.data_version, tuple(sorted(params.items())))
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def per_column(self, matrix: np.ndarray, func: Callable[[np.ndarray], np.ndarray]) -> np.ndarray:
+        """
+        对每只ETF的有效行（按时间顺序压缩后，转为 float64）应用一维函数，再放回面板位置
+        """
+        out = np.full(matrix.shape, np.nan)
+        for col in range(matrix.shape[1]):
+            rows = self.valid[:, col]
+            if rows.any():
+                out[rows, col] = func(matrix[rows, col].astype(np.float64, copy=False))
+        return out
+
+    def forward_filled(self, matrix: np.ndarray) -> np.ndarray:
+        """
+        沿日期向前填充每只ETF无数据的行，使每行代表“截至当日最近一次有数据”的值
+
+        按每只ETF最近一个有数据的行号取值，而不是按值填充：有数据那天的因子本身为 NaN
+        （如价格恒定窗口的 R²）时仍为 NaN，不会被更早的值替代。
+        """
+        rows = np.arange(len(self.dates))[:, None]
+        last = np.maximum.accumulate(np.where(self.valid, rows, -1), axis=0)
+        out = matrix[np.maximum(last, 0), np.arange(len(self.codes))]
+        out[last < 0] = np.nan
+        return out
+
+    def lookup_before(self, name: str, dates, **params) -> np.ndarray:
+        """
+        取各日期“之前”（不含当日）每只ETF最近一个交易日的因子值
+
+        对应策略中 df.index < date 的窗口口径；日期之前没有数据时为 NaN。
+        """
+        dates = pd.DatetimeIndex(pd.to_datetime(dates))
+        key = ('ffill:' + name, self.data_version, tuple(sorted(params.items())))
+        matrix = self._cached(key, lambda: self.forward_filled(self.get(name, **params)))
+        rows = self.dates.searchsorted(dates, side='left') - 1
+        out = np.full((len(dates), len(self.codes)), np.nan)
+        has_row = rows >= 0
+        out[has_row] = matrix[rows[has_row]]
+        return out
+
+    def history_count_before(self, dates) -> np.ndarray:
+        """
+        各日期之前每只ETF已有的数据条数
+        """
+        dates = pd.DatetimeIndex(pd.to_datetime(dates))
+        counts = np.vstack([np.zeros(len(self.codes)), np.cumsum(self.valid, axis=0)])
+        return counts[self.dates.searchsorted(dates, side='left')]
+
+
+# ---------------------------------------------------------------------------
+# 基础节点
+# ---------------------------------------------------------------------------
+
+@factor('close')
+def _close(engine: FactorEngine) -> np.ndarray:
+    return engine.closes
+
+
+@factor('log_price', deps=('close',))
+def _log_price(engine: FactorEngine, close: np.ndarray) -> np.ndarray:
+    return np.log(close, dtype=np.float64)
+
+
+@factor('log_return', deps=('log_price',))
+def _log_return(engine: FactorEngine, log_price: np.ndarray) -> np.ndarray:
+    return engine.per_column(log_price, lambda y: np.concatenate([[np.nan], np.diff(y)]))
+
+
+@factor('moving_average', deps=('close',), params=('window',))
+def _moving_average(engine: FactorEngine, close: np.ndarray, window: int) -> np.ndarray:
+    def rolling_mean(values: np.ndarray) -> np.ndarray:
+        out = np.full(len(values), np.nan)
+        if len(values) >= window:
+            cums = np.concatenate([[0.0], np.cumsum(values)])
+            out[window - 1:] = (cums[window:] - cums[:-window]) / window
+        return out
+
+    return engine.per_column(close, rolling_mean)
+
+
+@factor('volatility', deps=('log_return',), params=('window',))
+def _volatility(engine: FactorEngine, log_return: np.ndarray, window: int) -> np.ndarray:
+    """
+    最近 window 个对数收益的年化标准差（ddof=1，年化系数 √250）
+    """
+    def rolling_std(values: np.ndarray) -> np.ndarray:
+        return pd.Series(values).rolling(window).std(ddof=1).to_numpy() * np.sqrt(250)
+
+    return engine.per_column(log_return, rolling_std)
+
+
+@factor('drawdown', deps=('close',), params=('window',))
+def _drawdown(engine: FactorEngine, close: np.ndarray, window: Optional[int] = None) -> np.ndarray:
+    """
+    相对历史最高点（或最近 window 日最高点）的回撤，取值 ≤ 0
+    """
+    def drawdown(values: np.ndarray) -> np.ndarray:
+        if window is None:
+            peak = np.maximum.accumulate(values)
+        else:
+            peak = pd.Series(values).rolling(window, min_periods=1).max().to_numpy()
+        return values / peak - 1
+
+    return engine.per_column(close, drawdown)
+
+
+# ---------------------------------------------------------------------------
+# 滚动回归节点（与 LocalETFStrategy.MOM / LocalRankStrategy.get_rank 口径一致）
+# ---------------------------------------------------------------------------
+
+@factor('window_kernel', deps=('close',))
+def _window_kernel(engine: FactorEngine, close: np.ndarray) -> Dict[int, WindowSumKernel]:
+    """
+    每只ETF一个前缀和内核，所有窗口长度共用
+    """
+    return {
+        col: WindowSumKernel(close[engine.valid[:, col], col])
+        for col in range(close.shape[1])
+    }
+
+
+@factor('trend', deps=('window_kernel',), params=('window', 'weighted'))
+def _trend(
+    engine: FactorEngine, kernels: Dict[int, WindowSumKernel], window: int, weighted: bool
+) -> Dict[str, np.ndarray]:
+    """
+    以当日为窗口最后一天的对数价格回归，返回 slope/intercept/r_squared/annualized_returns/score
+    """
+    fields = ('slope', 'intercept', 'r_squared', 'annualized_returns', 'score')
+    out = {field: np.full(engine.closes.shape, np.nan) for field in fields}
+    for col, kernel in kernels.items():
+        rows = engine.valid[:, col]
+        # 内核表下标 pos 表示窗口结束于第 pos-1 行，这里对齐到“包含当日”
+        table = kernel.table(window, weighted)
+        for field in fields:
+            out[field][rows, col] = table[field][1:]
+    return out
+
+
+@factor('slope', deps=('trend',), params=('window', 'weighted'))
+def _slope(engine: FactorEngine, trend: Dict[str, np.ndarray], window: int, weighted: bool) -> np.ndarray:
+    return trend['slope']
+
+
+@factor('intercept', deps=('trend',), params=('window', 'weighted'))
+def _intercept(engine: FactorEngine, trend: Dict[str, np.ndarray], window: int, weighted: bool) -> np.ndarray:
+    return trend['intercept']
+
+
+@factor('r_squared', deps=('trend',), params=('window', 'weighted'))
+def _r_squared(engine: FactorEngine, trend: Dict[str, np.ndarray], window: int, weighted: bool) -> np.ndarray:
+    return trend['r_squared']
+
+
+@factor('annualized_returns', deps=('trend',), params=('window', 'weighted'))
+def _annualized_returns(
+    engine: FactorEngine, trend: Dict[str, np.ndarray], window: int, weighted: bool
+) -> np.ndarray:
+    return trend['annualized_returns']
+
+
+@factor('momentum_score', deps=('trend',), params=('window', 'weighted'))
+def _momentum_score(
+    engine: FactorEngine, trend: Dict[str, np.ndarray], window: int, weighted: bool
+) -> np.ndarray:
+    """
+    年化收益 × R²，历史不足 window 天时为 NaN
+    """
+    return trend['score']
+
+
+@factor('window_start_price', deps=('close',), params=('window',))
+def _window_start_price(engine: FactorEngine, close: np.ndarray, window: int) -> np.ndarray:
+    """
+    以当日为最后一天的 window 日窗口的起始价格，历史不足时取第一条数据
+    """
+    def start_price(values: np.ndarray) -> np.ndarray:
+        idx = np.maximum(np.arange(len(values)) - window + 1, 0)
+        return values[idx]
+
+    return engine.per_column(close, start_price)
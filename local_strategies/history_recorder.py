@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+回测逐日历史的列式记录器
+按交易日历预分配定型的 NumPy 列：日期、总市值、现金、持仓编号（-1 为现金），
+每个评分明细字段一个 交易日×ETF 的二维块。事件循环按行号写入当日的一行，向量化回测按整段写入。
+frame() 由这些列零拷贝地构建 DataFrame，列名同原先逐日字典组成的 DataFrame：
+date, total_value, cash, current_position，之后每只ETF依次为各字段的 “名称_字段” 列；
+与原先一样，从未写入过评分明细的ETF不出现在列中。
+to_arrays / from_arrays 把已记录的行连同列定义转为 (描述, 数组) 并还原，供回测检查点保存（见 checkpoint.py）。
+"""
+
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+CASH_LABEL = '现金'
+
+
+class HistoryRecorder:
+    """
+    codes / names: 评分明细列对应的ETF及其名称；position_labels: 各持仓编号的 “名称(代码)”，可由 position_index 追加；
+    fields: [(列名后缀, dtype)]，每个字段一个 交易日×ETF 的块，未写入的位置为 NaN
+    """
+
+    def __init__(
+        self,
+        dates,
+        codes: Sequence[str],
+        names: Sequence[str],
+        position_labels: Sequence[str],
+        fields: Sequence[Tuple[str, object]],
+    ) -> None:
+        self.codes = list(codes)
+        self.names = list(names)
+        self.fields = [(suffix, np.dtype(dtype)) for suffix, dtype in fields]
+        self.position_labels = np.array(list(position_labels) + [CASH_LABEL], dtype=object)
+        self.size = 0
+        self.present = np.zeros(len(self.codes), dtype=bool)
+        self._allocate(pd.DatetimeIndex(dates).values)
+        # 金额按 float64 存放；写入的全是整数时按 int64 导出，与由整数组成的列推断出的类型相同
+        self._integral = {'total_value': True, 'cash': True}
+
+    def position_index(self, label: str) -> int:
+        """
+        持仓文本对应的编号，现金为 -1；未出现过的文本（如同时持有多只ETF的组合）追加为新编号
+        """
+        if label == CASH_LABEL:
+            return -1
+        labels = self.position_labels[:-1].tolist()
+        if label not in labels:
+            self.position_labels = np.array(labels + [label, CASH_LABEL], dtype=object)
+            return len(labels)
+        return labels.index(label)
+
+    def _allocate(self, dates: np.ndarray) -> None:
+        n = len(dates)
+        self.dates = dates
+        self.total_value = np.full(n, np.nan)
+        self.cash = np.full(n, np.nan)
+        self.held = np.full(n, -1, dtype=np.int32)
+        self.blocks = [np.full((n, len(self.codes)), np.nan, dtype=dtype) for _, dtype in self.fields]
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.dates, self.total_value, self.cash, self.held] + self.blocks
+        return int(sum(array.nbytes for array in arrays))
+
+    def reserve(self, dates) -> int:
+        """
+        在已记录的行之后接上一段交易日（容量不足时重新分配），返回这段的起始行号
+        """
+        dates = pd.DatetimeIndex(dates).values
+        start = self.size
+        if start + len(dates) > len(self.dates):
+            total_value, cash, held, blocks = self.total_value, self.cash, self.held, self.blocks
+            self._allocate(np.concatenate([self.dates[:start], dates]))
+            self.total_value[:start] = total_value[:start]
+            self.cash[:start] = cash[:start]
+            self.held[:start] = held[:start]
+            for block, previous in zip(self.blocks, blocks):
+                block[:start] = previous[:start]
+        else:
+            self.dates[start:start + len(dates)] = dates
+        return start
+
+    def record(self, row: int, total_value, cash, held: int, values: Sequence = None, columns=None) -> None:
+        """
+        写入第 row 行；values 依次为各字段当日各ETF的值（一维，顺序同 codes），None 表示当日没有评分明细；
+        columns 为当日有评分明细的ETF列号，None 表示全部
+        """
+        self.total_value[row] = total_value
+        self.cash[row] = cash
+        self.held[row] = held
+        if self._integral['total_value'] and not isinstance(total_value, (int, np.integer)):
+            self._integral['total_value'] = False
+        if self._integral['cash'] and not isinstance(cash, (int, np.integer)):
+            self._integral['cash'] = False
+        if values is not None:
+            for block, value in zip(self.blocks, values):
+                block[row] = value
+            self.present[slice(None) if columns is None else columns] = True
+        if row >= self.size:
+            self.size = row + 1
+
+    def record_span(self, start: int, total_value, cash, held, values: Sequence) -> None:
+        """
+        整段写入自 start 起的行：total_value / cash / held 为一维数组，values 为各字段的 交易日×ETF 数组
+        """
+        stop = start + len(held)
+        self.total_value[start:stop] = total_value
+        self.cash[start:stop] = cash
+        self.held[start:stop] = held
+        for key, array in (('total_value', total_value), ('cash', cash)):
+            if not np.issubdtype(np.asarray(array).dtype, np.integer):
+                self._integral[key] = False
+        for block, value in zip(self.blocks, values):
+            block[start:stop] = value
+        self.present[:] = True
+        self.size = max(self.size, stop)
+
+    def to_arrays(self) -> Tuple[dict, Dict[str, np.ndarray]]:
+        """
+        已记录的行：列定义等可 JSON 序列化的描述，以及按原 dtype 截取的各列数组
+        """
+        n = self.size
+        meta = {
+            'codes': self.codes,
+            'names': self.names,
+            'position_labels': self.position_labels[:-1].tolist(),
+            'fields': [(suffix, dtype.str) for suffix, dtype in self.fields],
+            'integral': self._integral,
+        }
+        arrays = {
+            'dates': self.dates[:n],
+            'total_value': self.total_value[:n],
+            'cash': self.cash[:n],
+            'held': self.held[:n],
+            'present': self.present,
+        }
+        for k, block in enumerate(self.blocks):
+            arrays[f'block_{k}'] = block[:n]
+        return meta, arrays
+
+    @classmethod
+    def from_arrays(cls, meta: dict, arrays: Dict[str, np.ndarray]) -> 'HistoryRecorder':
+        history = cls(arrays['dates'], meta['codes'], meta['names'], meta['position_labels'], meta['fields'])
+        history.total_value[:] = arrays['total_value']
+        history.cash[:] = arrays['cash']
+        history.held[:] = arrays['held']
+        history.present[:] = arrays['present']
+        for k, block in enumerate(history.blocks):
+            block[:] = arrays[f'block_{k}']
+        history._integral = dict(meta['integral'])
+        history.size = len(history.dates)
+        return history
+
+    def frame(self) -> pd.DataFrame:
+        """
+        已记录的行组成的 DataFrame；数值列是记录数组的视图（不复制），current_position 由持仓编号映射为文本
+        """
+        n = self.size
+        columns = {'date': self.dates[:n]}
+        for key in ('total_value', 'cash'):
+            values = getattr(self, key)[:n]
+            columns[key] = values.astype(np.int64) if self._integral[key] and n else values
+        columns['current_position'] = self.position_labels[self.held[:n]]
+        for j in np.flatnonzero(self.present):
+            for (suffix, _), block in zip(self.fields, self.blocks):
+                columns[f'{self.names[j]}_{suffix}'] = block[:n, j]
+        return pd.DataFrame(columns, copy=False)
+
+
+def history_frame(history) -> pd.DataFrame:
+    """
+    portfolio['history'] 的 DataFrame：HistoryRecorder 取 frame()，逐日字典列表直接构建
+    """
+    return history.frame() if isinstance(history, HistoryRecorder) else pd.DataFrame(history)
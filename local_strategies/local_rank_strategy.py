@@ -6,16 +6,51 @@
 
 """
 
+import argparse
+import contextlib
+import copy
+import io
 import math
 import os
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, List, Tuple
+from typing import Callable, Dict, List, Mapping, Tuple
 
 import numpy as np
 import pandas as pd
 from pathlib import Path
 
+try:
+    from .asof_index import AsOfIndex
+    from .book import Book
+    from .checkpoint import Checkpoint, closes_digest, load_checkpoint, save_checkpoint, write_history_csv
+    from .compact import PRICE_DTYPE, SCORE_DTYPE
+    from .factor_engine import FactorEngine
+    from .history_recorder import HistoryRecorder, history_frame
+    from .price_panel import PricePanel
+    from .price_sources import PriceSources
+    from .rolling_regression import RollingScoreBook
+    from .score_formula import evaluate_formulas
+    from .topk import bounded_top_k, combined_score_bound
+    from .breakeven import NextWindowTrend, pairwise_flip_prices, rank_score_function
+    from .trading_calendar import epoch_day
+    from .vectorized import assert_same_backtest, rotation_path, rotation_trades
+except ImportError:
+    from asof_index import AsOfIndex
+    from book import Book
+    from checkpoint import Checkpoint, closes_digest, load_checkpoint, save_checkpoint, write_history_csv
+    from compact import PRICE_DTYPE, SCORE_DTYPE
+    from factor_engine import FactorEngine
+    from history_recorder import HistoryRecorder, history_frame
+    from price_panel import PricePanel
+    from price_sources import PriceSources
+    from rolling_regression import RollingScoreBook
+    from score_formula import evaluate_formulas
+    from topk import bounded_top_k, combined_score_bound
+    from breakeven import NextWindowTrend, pairwise_flip_prices, rank_score_function
+    from trading_calendar import epoch_day
+    from vectorized import assert_same_backtest, rotation_path, rotation_trades
+
 
 @dataclass
 class ScoreDetail:
@@ -34,17 +69,97 @@ class ScoreDetail:
     short_end_price: float
 
 
+# 评分面板中与 ScoreDetail 一一对应的字段
+SCORE_PANEL_FIELDS = tuple(ScoreDetail.__dataclass_fields__)
+
+# 一条评分明细记录（字段顺序同 SCORE_PANEL_FIELDS）；评分面板额外带 double_negative 标记
+SCORE_DETAIL_DTYPE = np.dtype([(name, np.float64) for name in SCORE_PANEL_FIELDS])
+SCORE_PANEL_DTYPE = np.dtype(SCORE_DETAIL_DTYPE.descr + [('double_negative', np.bool_)])
+# 紧凑模式下的评分面板：各字段按单精度存放
+COMPACT_SCORE_PANEL_DTYPE = np.dtype(
+    [(name, SCORE_DTYPE) for name in SCORE_PANEL_FIELDS] + [('double_negative', np.bool_)]
+)
+
+# 历史不足时的记录：综合得分 -999，其余为 NaN
+MISSING_SCORE_RECORD = (-999.0,) + (float('nan'),) * (len(SCORE_PANEL_FIELDS) - 1)
+
+
+class ScoreDetailView:
+    """
+    评分明细数组中一条记录的只读视图，属性与 ScoreDetail 相同，需要对象时再 materialize
+    """
+
+    __slots__ = ('_records', '_index')
+
+    def __init__(self, records: np.ndarray, index: int) -> None:
+        self._records = records
+        self._index = index
+
+    def __getattr__(self, name: str) -> float:
+        if name in SCORE_DETAIL_DTYPE.names:
+            return float(self._records[name][self._index])
+        raise AttributeError(name)
+
+    def materialize(self) -> ScoreDetail:
+        record = self._records[self._index]
+        return ScoreDetail(**{name: float(record[name]) for name in SCORE_PANEL_FIELDS})
+
+
+class ScoreDetailTable(Mapping[str, ScoreDetailView]):
+    """
+    按ETF代码索引的一组评分明细，底层为一维结构化数组（矩阵模式下直接是评分面板某一行的视图）
+
+    取单只ETF时只创建轻量视图，不复制数据；ETF代码到下标的映射可在多日之间共用。
+    """
+
+    __slots__ = ('codes', 'records', '_positions')
+
+    def __init__(
+        self, codes: List[str], records: np.ndarray, positions: Dict[str, int] | None = None
+    ) -> None:
+        self.codes = codes
+        self.records = records
+        self._positions = positions if positions is not None else {code: i for i, code in enumerate(codes)}
+
+    @classmethod
+    def from_records(cls, codes: List[str], rows: List[tuple]) -> 'ScoreDetailTable':
+        return cls(codes, np.array(rows, dtype=SCORE_DETAIL_DTYPE).reshape(len(rows)))
+
+    def __getitem__(self, etf_code: str) -> ScoreDetailView:
+        return ScoreDetailView(self.records, self._positions[etf_code])
+
+    def __iter__(self):
+        return iter(self.codes)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def field(self, name: str) -> np.ndarray:
+        return self.records[name]
+
+    def materialize(self) -> Dict[str, ScoreDetail]:
+        return {etf_code: self[etf_code].materialize() for etf_code in self.codes}
+
+
 class LocalRankStrategy:
     def __init__(
         self,
         data_dir: str = '/home/suwei/回测策略/data',
         output_dir: str = '/home/suwei/回测策略/analysis_results_rank',
+        score_mode: str = 'matrix',
+        compact: bool = False,
     ) -> None:
         """
         初始化策略
+
+        score_mode 为 'matrix' 时回测前一次性计算 日期×ETF 的评分面板，
+        'loop' 时每日逐只回归（原始实现）。
+        compact 为 True 时收盘价与评分面板按 float32 存放（见 compact.py）。
         """
         self.data_dir = data_dir
         self.output_dir = output_dir
+        self.score_mode = score_mode
+        self.compact = compact
 
         # ETF池配置 - 对应聚宽rank.py中的ETF
         self.etf_config = {
@@ -65,15 +180,39 @@ class LocalRankStrategy:
             'cash': self.initial_capital,
             'positions': {code: {'shares': 0.0, 'value': 0.0} for code in self.etf_config},
             'total_value': self.initial_capital,
-            'history': [],
+            'history': [],  # 回测后为 HistoryRecorder（见 history_recorder.py），取 DataFrame 用 history_frame
             'trades': [],
         }
 
+        # 事件循环中的组合账本（见 book.py），回测结束时写回 self.portfolio
+        self.book: Book | None = None
+
         # 每日排名及打分明细
         self.daily_scores: Dict[str, float] = {}
-        self.daily_score_details: Dict[str, ScoreDetail] = {}
+        self.daily_score_details: Mapping[str, ScoreDetailView] = {}
+        # 当日评分取自评分面板时的行号：循环中只记行号，得分字典在回测结束时再生成
+        self._daily_row: int | None = None
+        # 上次写出历史 CSV 的记录（见 checkpoint.write_history_csv），续跑时只追加新增的行
+        self._history_export: dict | None = None
+
+        # 评分面板（score_mode='matrix' 时由 build_score_panel 填充）
+        self.score_dates: pd.DatetimeIndex | None = None
+        self.score_codes: List[str] = []
+        self.score_panel: np.ndarray = np.empty((0, 0), dtype=SCORE_PANEL_DTYPE)
+        self._score_rows: Dict[pd.Timestamp, int] = {}
+        self._score_positions: Dict[str, int] = {}
+
+        # get_rank(top_k=...) 的逐日剪枝统计：{日期: {'candidates', 'evaluated', 'pruned'}}
+        self.prune_stats: Dict[pd.Timestamp, Dict[str, int]] = {}
+
+        # 换仓临界价的评分函数（prepare_breakeven 填充）
+        self.flip_functions: Dict[str, Callable[[float], Tuple[float, float]]] = {}
+        self.flip_last_closes: Dict[str, float] = {}
 
         os.makedirs(self.output_dir, exist_ok=True)
+        self.price_panel: PricePanel | None = None
+        self.asof_prices: AsOfIndex | None = None
+        self.factor_engine: FactorEngine | None = None
         self.load_data()
 
     def load_data(self) -> None:
@@ -82,22 +221,16 @@ class LocalRankStrategy:
         """
         print('正在加载ETF数据...')
 
-        for etf_code, config in self.etf_config.items():
-            file_path = os.path.join(self.data_dir, config['file'])
+        # 行情来源的优先级见 price_sources.py（按年分区存储、列式存储、CSV）；要读 CSV 的ETF较多时先用线程池并行解析，下面逐只加载直接命中缓存
+        sources = PriceSources(self.data_dir)
+        sources.prefetch({etf_code: config['file'] for etf_code, config in self.etf_config.items()})
 
+        for etf_code, config in self.etf_config.items():
             try:
-                df = pd.read_csv(file_path)
-
-                # 标准化列名
-                if 'net_value' in df.columns:
-                    df = df.rename(columns={'net_value': 'close'})
-                elif '单位净值' in df.columns:
-                    df = df.rename(columns={'单位净值': 'close', '净值日期': 'date'})
-
-                df['date'] = pd.to_datetime(df['date'])
-                df = df.sort_values('date').set_index('date')
-                df['close'] = pd.to_numeric(df['close'], errors='coerce')
-                df = df.dropna(subset=['close'])
+                # 列名标准化、日期索引与数值化由共用的加载器完成，同一文件在进程内只解析一次
+                df = sources.load(etf_code, config['file'])
+                if self.compact:
+                    df = df.astype({'close': PRICE_DTYPE})
 
                 self.etf_data[etf_code] = df
                 print(
@@ -110,209 +243,503 @@ class LocalRankStrategy:
 
         print(f"数据加载完成，共 {len(self.etf_data)} 只ETF")
 
+        # 对齐的收盘价面板：逐只回归的长短周期窗口按整数位置切片
+        self.price_panel = PricePanel.from_frames(self.etf_data, dtype=PRICE_DTYPE if self.compact else np.float64)
+        # as-of 价格索引：估值、成交价按日期二分查找当日或之前最近的收盘价
+        self.asof_prices = AsOfIndex.from_panel(self.price_panel)
+        # 因子引擎：长短周期回归、起止净值等矩阵在整张面板上只算一次并缓存
+        self.factor_engine = FactorEngine.from_panel(self.price_panel)
+
     @staticmethod
     def sigmoid(x: float) -> float:
         return 1.0 / (1.0 + math.exp(-float(x)))
 
+    def combine_scores(self, long_raw: float, short_raw: float) -> Tuple[float, float, float]:
+        """
+        长短周期原始分数 → (综合得分, 长周期 Sigmoid, 短周期 Sigmoid)
+        """
+        long_sigmoid = self.sigmoid(long_raw)
+        short_sigmoid = self.sigmoid(short_raw)
+        combined_score = long_sigmoid * short_sigmoid
+        if long_raw < 0 and short_raw < 0:
+            combined_score *= -1
+        return combined_score, long_sigmoid, short_sigmoid
+
+    @staticmethod
+    def combine_score_arrays(
+        long_raw: np.ndarray, short_raw: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        combine_scores 的数组版本，返回 (综合得分, 长周期 Sigmoid, 短周期 Sigmoid, 双负标记)
+
+        任一原始分数为 NaN（历史不足）时综合得分为 -999。
+        """
+        valid = ~np.isnan(long_raw) & ~np.isnan(short_raw)
+        long_sigmoid = 1.0 / (1.0 + np.exp(-long_raw))
+        short_sigmoid = 1.0 / (1.0 + np.exp(-short_raw))
+        double_negative = valid & (long_raw < 0) & (short_raw < 0)
+        combined = np.where(double_negative, -1.0, 1.0) * long_sigmoid * short_sigmoid
+        return np.where(valid, combined, -999.0), long_sigmoid, short_sigmoid, double_negative
+
+    def scan_windows(
+        self,
+        long_windows,
+        short_windows,
+        dates=None,
+    ) -> Dict[Tuple[int, int], pd.DataFrame]:
+        """
+        一次性计算多组 (m_days, m_days_short) 下的综合得分
+
+        每个窗口长度只做一次 O(天数) 的回归，组合之间复用；返回
+        {(长周期, 短周期): DataFrame(日期×ETF)}，历史不足处为 -999。
+        """
+        if dates is None:
+            dates = self.get_trading_dates()
+        dates = pd.DatetimeIndex(pd.to_datetime(dates))
+        engine = self.factor_engine
+        codes = list(engine.codes)
+        long_scores = {
+            window: engine.lookup_before('momentum_score', dates, window=window, weighted=False)
+            for window in long_windows
+        }
+        short_slopes = {
+            window: engine.lookup_before('slope', dates, window=window, weighted=False)
+            for window in short_windows
+        }
+
+        results: Dict[Tuple[int, int], pd.DataFrame] = {}
+        for long_window, long_raw in long_scores.items():
+            for short_window, short_raw in short_slopes.items():
+                combined = self.combine_score_arrays(long_raw, short_raw)[0]
+                results[(long_window, short_window)] = pd.DataFrame(combined, index=dates, columns=codes)
+        return results
+
+    def scan_formulas(self, formulas, dates=None) -> Dict[str, pd.DataFrame]:
+        """
+        批量计算评分公式（语法见 score_formula.py），公共子表达式只算一次
+
+        本策略的综合得分即 KNOWN_VARIANTS['rank']；返回 {名称: DataFrame(日期×ETF)}，
+        历史不足处为 NaN。
+        """
+        if dates is None:
+            dates = self.get_trading_dates()
+        return evaluate_formulas(self.factor_engine, formulas, dates)
+
     def get_trading_dates(self) -> List[pd.Timestamp]:
         if not self.etf_data:
             return []
 
-        date_sets = [set(df.index) for df in self.etf_data.values()]
-        common_dates = sorted(set.intersection(*date_sets))
+        common_dates = self.price_panel.common_dates()
         if len(common_dates) > self.m_days:
             return common_dates[self.m_days:]
 
         print(f"警告：共同交易日期不足，需要至少 {self.m_days} 天历史数据")
         return []
 
+    def build_score_panel(self, dates) -> None:
+        """
+        一次性计算所有日期、所有ETF的长短周期得分
+
+        长短周期回归结果取自因子引擎（每只ETF每个窗口长度只做一次向量化回归），
+        按日期定位到“当日之前”的窗口后得到与 ScoreDetail 各字段对齐的 日期×ETF 数组，
+        另有 double_negative 标记符号翻转。
+        """
+        dates = pd.DatetimeIndex(pd.to_datetime(dates))
+        engine = self.factor_engine
+        codes = list(engine.codes)
+        long_params = {'window': self.m_days, 'weighted': False}
+        short_params = {'window': self.m_days_short, 'weighted': False}
+
+        long_raw = engine.lookup_before('momentum_score', dates, **long_params)
+        short_raw = engine.lookup_before('slope', dates, **short_params)
+        end_price = engine.lookup_before('close', dates)
+        panel = {
+            'annualized_returns': engine.lookup_before('annualized_returns', dates, **long_params),
+            'r_squared': engine.lookup_before('r_squared', dates, **long_params),
+            'long_term_slope': engine.lookup_before('slope', dates, **long_params),
+            'short_term_slope': short_raw.copy(),
+            'long_start_price': engine.lookup_before('window_start_price', dates, window=self.m_days),
+            'long_end_price': end_price,
+            'short_start_price': engine.lookup_before('window_start_price', dates, window=self.m_days_short),
+            'short_end_price': end_price.copy(),
+        }
+
+        combined, long_sigmoid, short_sigmoid, double_negative = self.combine_score_arrays(long_raw, short_raw)
+        valid = ~np.isnan(long_raw) & ~np.isnan(short_raw)
+
+        panel['combined_score'] = combined
+        panel['long_term_raw'] = long_raw
+        panel['long_term_sigmoid'] = long_sigmoid
+        panel['short_term_raw'] = short_raw
+        panel['short_term_sigmoid'] = short_sigmoid
+        # 历史不足时与逐日实现一致，除综合得分外全部为 NaN
+        for name in SCORE_PANEL_FIELDS:
+            if name != 'combined_score':
+                panel[name][~valid] = np.nan
+        panel['double_negative'] = double_negative
+
+        # 打包为 日期×ETF 的结构化数组：每日一行即为当天全部ETF的明细记录
+        dtype = COMPACT_SCORE_PANEL_DTYPE if self.compact else SCORE_PANEL_DTYPE
+        packed = np.empty((len(dates), len(codes)), dtype=dtype)
+        for name in dtype.names:
+            packed[name] = panel[name]
+        if self.compact:
+            # 因子引擎中的 float64 中间结果随即释放
+            engine.clear()
+
+        self.score_dates = dates
+        self.score_codes = codes
+        self.score_panel = packed
+        self._score_rows = {date: i for i, date in enumerate(dates)}
+        self._score_positions = {code: i for i, code in enumerate(codes)}
+
+    def panel_details(self, row: int) -> ScoreDetailTable:
+        """
+        评分面板第 row 行（某一日）所有ETF的明细视图，不复制数据
+        """
+        return ScoreDetailTable(self.score_codes, self.score_panel[row], self._score_positions)
+
+    def row_scores(self, row: int) -> Dict[str, float]:
+        """
+        评分面板第 row 行各ETF的综合得分
+        """
+        return dict(zip(self.score_codes, self.score_panel['combined_score'][row].tolist()))
+
+    def panel_detail(self, row: int, col: int) -> ScoreDetail:
+        """
+        从评分面板取出单只ETF单日的 ScoreDetail
+        """
+        return ScoreDetailView(self.score_panel[row], col).materialize()
+
+    def score_record(self, etf_code: str, date: pd.Timestamp) -> tuple:
+        """
+        逐只回归计算单只ETF在 date 之前窗口上的评分明细（原始实现）
+
+        返回按 SCORE_PANEL_FIELDS 排列的元组，第一项为综合得分。
+        """
+        long_prices = self.price_panel.window_before(etf_code, date, self.m_days)
+        short_prices = self.price_panel.window_before(etf_code, date, self.m_days_short)
+
+        if len(long_prices) < self.m_days or len(short_prices) < self.m_days_short:
+            return MISSING_SCORE_RECORD
+
+        # 长周期动量得分
+        y_long = np.log(long_prices)
+        x_long = np.arange(len(y_long))
+        slope_long, intercept_long = np.polyfit(x_long, y_long, 1)
+        annualized_returns = math.pow(math.exp(slope_long), 250) - 1
+
+        residuals_long = y_long - (slope_long * x_long + intercept_long)
+        denominator = (len(y_long) - 1) * np.var(y_long, ddof=1)
+        r_squared = 1 - (np.sum(residuals_long**2) / denominator) if denominator != 0 else 0.0
+        long_raw = annualized_returns * r_squared
+
+        # 短周期趋势过滤
+        y_short = np.log(short_prices)
+        x_short = np.arange(len(y_short))
+        slope_short, _ = np.polyfit(x_short, y_short, 1)
+        short_raw = slope_short
+
+        combined_score, long_sigmoid, short_sigmoid = self.combine_scores(long_raw, short_raw)
+
+        return (
+            combined_score,
+            long_raw,
+            long_sigmoid,
+            short_raw,
+            short_sigmoid,
+            annualized_returns,
+            r_squared,
+            slope_long,
+            slope_short,
+            float(long_prices[0]),
+            float(long_prices[-1]),
+            float(short_prices[0]),
+            float(short_prices[-1]),
+        )
+
     def get_rank(
-        self, date: pd.Timestamp
-    ) -> Tuple[List[str], Dict[str, float], Dict[str, ScoreDetail]]:
+        self, date: pd.Timestamp, top_k: int | None = None
+    ) -> Tuple[List[str], Dict[str, float], ScoreDetailTable]:
+        """
+        ETF排名；给定 top_k 且需要逐只回归时，先用上界剪枝，只对可能进入前 top_k 的ETF完整打分，
+        此时返回的排名只含前 top_k 只，得分与明细只含实际计算过的ETF。
+
+        明细以 ScoreDetailTable 返回（按代码取到的是数组记录的视图），需要对象时调用 materialize()。
+        """
         scores: Dict[str, float] = {}
-        details: Dict[str, ScoreDetail] = {}
-
-        for etf_code, df in self.etf_data.items():
-            past_mask = df.index < date
-            long_prices = df.loc[past_mask, 'close'].tail(self.m_days)
-            short_prices = df.loc[past_mask, 'close'].tail(self.m_days_short)
-
-            if len(long_prices) < self.m_days or len(short_prices) < self.m_days_short:
-                scores[etf_code] = -999.0
-                details[etf_code] = ScoreDetail(
-                    combined_score=-999.0,
-                    long_term_raw=float('nan'),
-                    long_term_sigmoid=float('nan'),
-                    short_term_raw=float('nan'),
-                    short_term_sigmoid=float('nan'),
-                    annualized_returns=float('nan'),
-                    r_squared=float('nan'),
-                    long_term_slope=float('nan'),
-                    short_term_slope=float('nan'),
-                    long_start_price=float('nan'),
-                    long_end_price=float('nan'),
-                    short_start_price=float('nan'),
-                    short_end_price=float('nan'),
-                )
-                continue
 
-            # 长周期动量得分
-            y_long = np.log(long_prices.values)
-            x_long = np.arange(len(y_long))
-            slope_long, intercept_long = np.polyfit(x_long, y_long, 1)
-            annualized_returns = math.pow(math.exp(slope_long), 250) - 1
-
-            residuals_long = y_long - (slope_long * x_long + intercept_long)
-            denominator = (len(y_long) - 1) * np.var(y_long, ddof=1)
-            r_squared = 1 - (np.sum(residuals_long**2) / denominator) if denominator != 0 else 0.0
-            long_raw = annualized_returns * r_squared
-            long_sigmoid = self.sigmoid(long_raw)
-
-            # 短周期趋势过滤
-            y_short = np.log(short_prices.values)
-            x_short = np.arange(len(y_short))
-            slope_short, _ = np.polyfit(x_short, y_short, 1)
-            short_raw = slope_short
-            short_sigmoid = self.sigmoid(short_raw)
-
-            combined_score = long_sigmoid * short_sigmoid
-            if long_raw < 0 and short_raw < 0:
-                combined_score *= -1
+        row = self._score_rows.get(date) if self.score_mode == 'matrix' else None
+        if row is not None:
+            scores = self.row_scores(row)
+            details = self.panel_details(row)
+            ranked_etfs = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            ranked_list = [etf_code for etf_code, _ in ranked_etfs]
+            return (ranked_list if top_k is None else ranked_list[:top_k]), scores, details
 
-            scores[etf_code] = combined_score
-            details[etf_code] = ScoreDetail(
-                combined_score=combined_score,
-                long_term_raw=long_raw,
-                long_term_sigmoid=long_sigmoid,
-                short_term_raw=short_raw,
-                short_term_sigmoid=short_sigmoid,
-                annualized_returns=annualized_returns,
-                r_squared=r_squared,
-                long_term_slope=slope_long,
-                short_term_slope=slope_short,
-                long_start_price=float(long_prices.iloc[0]),
-                long_end_price=float(long_prices.iloc[-1]),
-                short_start_price=float(short_prices.iloc[0]),
-                short_end_price=float(short_prices.iloc[-1]),
-            )
+        if top_k is not None:
+            return self.bounded_rank(date, top_k)
+
+        codes = list(self.etf_data)
+        records = [self.score_record(etf_code, date) for etf_code in codes]
+        for etf_code, record in zip(codes, records):
+            scores[etf_code] = record[0]
+        details = ScoreDetailTable.from_records(codes, records)
 
         ranked_etfs = sorted(scores.items(), key=lambda item: item[1], reverse=True)
         ranked_list = [etf_code for etf_code, _ in ranked_etfs]
         return ranked_list, scores, details
 
-    def get_current_price(self, etf_code: str, date: pd.Timestamp) -> float:
-        df = self.etf_data[etf_code]
-        if date in df.index:
-            return float(df.loc[date, 'close'])
+    def bounded_rank(
+        self, date: pd.Timestamp, top_k: int
+    ) -> Tuple[List[str], Dict[str, float], ScoreDetailTable]:
+        """
+        有界 Top-K：综合得分上界取 sigmoid(max(长周期年化收益, 0)) × sigmoid(短周期斜率)（R² ≤ 1），
+        按上界从高到低完整打分，剪枝数记入 prune_stats[date]
+        """
+        codes = list(self.etf_data)
+        long_closes, long_ready = self.price_panel.windows_before(codes, date, self.m_days)
+        short_closes, short_ready = self.price_panel.windows_before(codes, date, self.m_days_short)
+        ready = long_ready & short_ready
+
+        # 历史不足的ETF得分固定为 -999，上界即为其真实得分
+        bounds = np.full(len(codes), -999.0)
+        if ready.any():
+            bounds[ready] = combined_score_bound(np.log(long_closes[ready]), np.log(short_closes[ready]))
+
+        records: Dict[str, tuple] = {}
+
+        def evaluate(etf_code: str) -> float:
+            records[etf_code] = self.score_record(etf_code, date)
+            return records[etf_code][0]
+
+        result = bounded_top_k(codes, bounds, evaluate, top_k)
+        self.prune_stats[date] = {
+            'candidates': len(codes),
+            'evaluated': result.evaluated,
+            'pruned': result.pruned,
+        }
+        details = ScoreDetailTable.from_records(list(records), list(records.values()))
+        return result.selected, result.scores, details
 
-        available_dates = df.index[df.index <= date]
-        if len(available_dates) == 0:
-            return float('nan')
-        latest_date = available_dates[-1]
-        return float(df.loc[latest_date, 'close'])
+    def load_live_book(self, state_path: str | None = None, rebuild: bool = False) -> RollingScoreBook:
+        """
+        恢复 25 日/3 日增量回归状态并推入新到的收盘价，窗口参数变化或 rebuild=True 时从头重建
+        """
+        state_path = state_path or os.path.join(self.output_dir, 'live_rank_state.json')
+        windows = (self.m_days, self.m_days_short)
+
+        book = None
+        if not rebuild and os.path.exists(state_path):
+            book = RollingScoreBook.load(state_path)
+            if book.windows != windows or book.weighted:
+                book = None
+        if book is None:
+            book = RollingScoreBook(windows, weighted=False)
+
+        pushed = book.update_from_data(self.etf_data)
+        book.save(state_path)
+        print(f"增量评分状态已更新: 新增 {pushed} 条收盘价 -> {state_path}")
+        return book
+
+    def live_rank(
+        self, state_path: str | None = None, rebuild: bool = False
+    ) -> Tuple[List[str], Dict[str, float], ScoreDetailTable]:
+        """
+        每日早盘打分：恢复 25 日/3 日增量回归状态，只推入新到的收盘价后排名
+        """
+        book = self.load_live_book(state_path, rebuild)
+        long_results = book.results(self.m_days)
+        short_results = book.results(self.m_days_short)
+        scores: Dict[str, float] = {}
+        records: Dict[str, tuple] = {}
+        for etf_code in self.etf_data:
+            if etf_code not in long_results or etf_code not in short_results:
+                continue
+            long_res = long_results[etf_code]
+            short_res = short_results[etf_code]
+            combined_score, long_sigmoid, short_sigmoid = self.combine_scores(
+                long_res['score'], short_res['slope']
+            )
+            scores[etf_code] = combined_score
+            records[etf_code] = (
+                combined_score,
+                long_res['score'],
+                long_sigmoid,
+                short_res['slope'],
+                short_sigmoid,
+                long_res['annualized_returns'],
+                long_res['r_squared'],
+                long_res['slope'],
+                short_res['slope'],
+                long_res['start_price'],
+                long_res['end_price'],
+                short_res['start_price'],
+                short_res['end_price'],
+            )
+        details = ScoreDetailTable.from_records(list(records), list(records.values()))
 
-    def update_portfolio_value(self, date: pd.Timestamp) -> float:
-        total_value = self.portfolio['cash']
-        for etf_code, position in self.portfolio['positions'].items():
-            if position['shares'] <= 0:
+        ranked_etfs = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return [etf_code for etf_code, _ in ranked_etfs], scores, details
+
+    def prepare_breakeven(self, state_path: str | None = None, rebuild: bool = False) -> None:
+        """
+        开盘前调用一次：由增量回归状态构建每只ETF下一次排名的综合得分函数（今日价格为自变量）
+        """
+        book = self.load_live_book(state_path, rebuild)
+        self.flip_functions = {}
+        self.flip_last_closes = {}
+        for etf_code in self.etf_data:
+            regressions = book.regressions.get(etf_code, {})
+            long_reg = regressions.get(self.m_days)
+            short_reg = regressions.get(self.m_days_short)
+            if long_reg is None or not long_reg.is_ready or not short_reg.is_ready:
                 continue
+            self.flip_functions[etf_code] = rank_score_function(
+                NextWindowTrend(long_reg), NextWindowTrend(short_reg)
+            )
+            self.flip_last_closes[etf_code] = long_reg.closes[-1]
 
-            current_price = self.get_current_price(etf_code, date)
-            if not np.isnan(current_price):
-                position_value = position['shares'] * current_price
-                position['value'] = position_value
-                total_value += position_value
+    def breakeven_prices(
+        self, quotes: Dict[str, float] | None = None, max_log_move: float = 0.25
+    ) -> pd.DataFrame:
+        """
+        两两换仓临界价：第 i 行第 j 列为ETF i 今日价格到多少时与ETF j 综合得分相同
 
-        self.portfolio['total_value'] = total_value
+        quotes 缺省的ETF按今日价格等于最新收盘价计算；首次调用时自动 prepare_breakeven。
+        """
+        if not self.flip_functions:
+            self.prepare_breakeven()
+        prices = dict(self.flip_last_closes)
+        prices.update({code: price for code, price in (quotes or {}).items() if code in prices})
+        return pairwise_flip_prices(self.flip_functions, prices, max_log_move)
+
+    def get_current_price(self, etf_code: str, date: pd.Timestamp) -> float:
+        return self.asof_prices.price(etf_code, date)
+
+    def _open_book(self) -> Book:
+        """
+        由 self.portfolio 建立组合账本（已建立时直接返回），之后的交易与估值在账本上进行
+        """
+        if self.book is None:
+            self.book = Book.open(self.portfolio, zero=0.0)
+        return self.book
+
+    def _close_book(self) -> None:
+        """
+        账本写回 self.portfolio；当日评分取自评分面板时，生成最后一日的得分与明细
+        """
+        if self.book is not None:
+            names = [self.etf_config[etf_code]['name'] for etf_code in self.book.codes]
+            self.book.close(self.portfolio, names)
+            self.book = None
+        if self._daily_row is not None:
+            self.daily_scores = self.row_scores(self._daily_row)
+            self.daily_score_details = self.panel_details(self._daily_row)
+            self._daily_row = None
+
+    def update_portfolio_value(self, date: pd.Timestamp) -> float:
+        book = self._open_book()
+        total_value = book.cash
+        # 当日所有持仓的价格一次查出
+        if book.held:
+            held_codes = [book.codes[symbol] for symbol in book.held]
+            for symbol, current_price in zip(book.held, self.asof_prices.prices(held_codes, date)):
+                if not np.isnan(current_price):
+                    position = book.positions[symbol]
+                    position.value = position.shares * current_price
+                    total_value += position.value
+
+        book.total_value = total_value
         return total_value
 
-    def trade(self, date: pd.Timestamp) -> None:
-        ranked_etfs, scores, details = self.get_rank(date)
+    def _matrix_target(self, date: pd.Timestamp) -> str | None:
+        """
+        矩阵模式下直接取评分面板当日行综合得分最高的ETF（与排序后取第一只相同，平分时取列序靠前者）并记下行号；
+        日期不在面板中、或该行有 NaN（排序结果不再等同于 argmax）时返回 None，由 get_rank 处理
+        """
+        if self.score_mode != 'matrix' or not self.score_codes:
+            return None
+        row = self._score_rows.get(date)
+        if row is None:
+            return None
+        combined_row = self.score_panel['combined_score'][row]
+        col = int(np.argmax(combined_row))
+        if np.isnan(combined_row[col]):
+            return None
+        self._daily_row = row
+        return self.score_codes[col]
 
-        if not ranked_etfs:
-            print(f"{date.strftime('%Y-%m-%d')} 无可用ETF评分，跳过交易")
-            return
+    def trade(self, date: pd.Timestamp) -> None:
+        book = self._open_book()
 
-        self.daily_scores = scores
-        self.daily_score_details = details
+        target_etf = self._matrix_target(date)
+        if target_etf is None:
+            ranked_etfs, scores, details = self.get_rank(date)
 
-        target_etf = ranked_etfs[0]
-        current_holdings = [
-            code for code, pos in self.portfolio['positions'].items() if pos['shares'] > 0
-        ]
+            if not ranked_etfs:
+                print(f"{date.strftime('%Y-%m-%d')} 无可用ETF评分，跳过交易")
+                return
 
-        need_trade = False
-        if not current_holdings:
-            need_trade = True
-        elif target_etf not in current_holdings:
-            need_trade = True
+            self.daily_scores = scores
+            self.daily_score_details = details
+            self._daily_row = None
+            target_etf = ranked_etfs[0]
 
-        if not need_trade:
+        # 没有持仓或持仓不含目标时换仓
+        target = book.symbols[target_etf]
+        if target in book.held:
             return
 
+        day = epoch_day(date)
+        scores = self.daily_scores if self._daily_row is None else self.row_scores(self._daily_row)
         print(f"\n{date.strftime('%Y-%m-%d')} 交易信号:")
         for etf_code, score in sorted(scores.items(), key=lambda item: item[1], reverse=True):
             etf_name = self.etf_config[etf_code]['name']
             print(f"  {etf_name}({etf_code}) 综合得分: {score:.6f}")
 
         # 卖出非目标持仓
-        for etf_code in current_holdings:
-            if etf_code == target_etf:
-                continue
-
+        for symbol in list(book.held):
+            etf_code = book.codes[symbol]
             current_price = self.get_current_price(etf_code, date)
-            shares = self.portfolio['positions'][etf_code]['shares']
-            if shares <= 0 or np.isnan(current_price):
+            if np.isnan(current_price):
                 continue
 
-            sell_value = shares * current_price
-            self.portfolio['cash'] += sell_value
-            self.portfolio['positions'][etf_code]['shares'] = 0.0
-            self.portfolio['positions'][etf_code]['value'] = 0.0
-
-            self.portfolio['trades'].append(
-                {
-                    'date': date.strftime('%Y-%m-%d'),
-                    'type': 'sell',
-                    'code': etf_code,
-                    'name': self.etf_config[etf_code]['name'],
-                    'shares': shares,
-                    'price': current_price,
-                    'amount': sell_value,
-                }
-            )
-
+            sold = book.sell(symbol, day, current_price)
             etf_name = self.etf_config[etf_code]['name']
-            print(f"  ✗ 卖出 {etf_name}({etf_code}): {shares:.0f}股, 价值{sell_value:.2f}元")
+            print(f"  ✗ 卖出 {etf_name}({etf_code}): {sold.shares:.0f}股, 价值{sold.amount:.2f}元")
 
         # 买入目标ETF
-        if self.portfolio['cash'] > 0:
+        if book.cash > 0:
             current_price = self.get_current_price(target_etf, date)
             if np.isnan(current_price) or current_price <= 0:
                 return
 
-            buy_value = self.portfolio['cash']
-            shares = buy_value / current_price
-            self.portfolio['cash'] = 0.0
-            self.portfolio['positions'][target_etf]['shares'] = shares
-            self.portfolio['positions'][target_etf]['value'] = buy_value
-
-            self.portfolio['trades'].append(
-                {
-                    'date': date.strftime('%Y-%m-%d'),
-                    'type': 'buy',
-                    'code': target_etf,
-                    'name': self.etf_config[target_etf]['name'],
-                    'shares': shares,
-                    'price': current_price,
-                    'amount': buy_value,
-                }
-            )
-
+            bought = book.buy(target, day, current_price)
             etf_name = self.etf_config[target_etf]['name']
-            print(f"  ✓ 买入 {etf_name}({target_etf}): {shares:.0f}股, 价值{buy_value:.2f}元")
+            print(f"  ✓ 买入 {etf_name}({target_etf}): {bought.shares:.0f}股, 价值{bought.amount:.2f}元")
+
+    def run_backtest(
+        self,
+        start_date: str | None = None,
+        end_date: str | None = None,
+        mode: str = 'loop',
+        check_parity: bool = False,
+        checkpoint_path: str | None = None,
+        rebuild: bool = False,
+    ) -> None:
+        """
+        运行回测
+
+        mode 为 'loop' 时逐日调用 trade（事件循环），'vectorized' 时由评分面板整段算出持仓、换仓与市值
+        （见 vectorized.py），不逐笔打印交易信号；check_parity 为 True 时另以事件循环重跑并逐项比对，
+        不一致抛出 ParityError。
+        给出 checkpoint_path 时，检查点（见 checkpoint.py）存在且与本次回测一致则从中恢复组合与历史，
+        只对之后新增的交易日运行事件循环，结束后写回检查点；rebuild 为 True 时忽略已有检查点从头回测。
+        """
+        if mode not in ('loop', 'vectorized'):
+            raise ValueError(f'未知的回测模式: {mode}')
 
-    def run_backtest(self, start_date: str | None = None, end_date: str | None = None) -> None:
         print('\n' + '=' * 60)
         print('开始回测...')
         print('=' * 60)
@@ -340,50 +767,229 @@ class LocalRankStrategy:
         print(f"交易日数: {len(trading_dates)} 天")
         print(f"初始资金: {self.initial_capital:,.0f} 元")
 
-        for date in trading_dates:
+        first_date, resumed = trading_dates[0], False
+        if checkpoint_path:
+            trading_dates, resumed = self._resume_checkpoint(checkpoint_path, trading_dates, rebuild)
+
+        if not trading_dates:
+            print('检查点已处理到最后一个交易日，没有新增交易日')
+        elif mode == 'vectorized' and not resumed:
+            self.run_vectorized(trading_dates, check_parity=check_parity)
+        else:
+            # 续跑时组合已有持仓，新增交易日总是走事件循环（结果与向量化相同）
+            if self.score_mode == 'matrix':
+                self.build_score_panel(trading_dates)
+            self._run_loop(trading_dates)
+
+        self.print_backtest_results()
+
+        if checkpoint_path and trading_dates:
+            self._save_checkpoint(checkpoint_path, first_date, trading_dates[-1])
+
+    def _checkpoint_key(self, first_date: pd.Timestamp) -> dict:
+        """
+        决定检查点能否续跑的参数：策略、评分方式、ETF池、长短周期天数、初始资金与回测起始日
+        """
+        return {
+            'strategy': type(self).__name__,
+            'score_mode': self.score_mode,
+            'compact': self.compact,
+            'etfs': [[etf_code, self.etf_config[etf_code]['name']] for etf_code in self.portfolio['positions']],
+            'm_days': self.m_days,
+            'm_days_short': self.m_days_short,
+            'initial_capital': self.initial_capital,
+            'start_date': first_date.strftime('%Y-%m-%d'),
+        }
+
+    def _window_digest(self, last_date: pd.Timestamp) -> str:
+        """
+        各ETF截至 last_date（含）最近 max(长周期, 短周期) 个收盘价的摘要：之后各日的评分窗口都与这段重叠
+        """
+        after = last_date + pd.Timedelta(days=1)
+        window = max(self.m_days, self.m_days_short)
+        return closes_digest({
+            etf_code: self.price_panel.window_before(etf_code, after, window) for etf_code in self.etf_data
+        })
+
+    def _resume_checkpoint(
+        self, checkpoint_path: str, trading_dates: List[pd.Timestamp], rebuild: bool = False
+    ) -> Tuple[List[pd.Timestamp], bool]:
+        """
+        从检查点恢复组合、历史与最后一日的评分，返回 (之后尚未处理的交易日, 是否已恢复)；
+        rebuild 为 True、没有检查点或检查点与本次回测不一致时返回全部交易日
+        """
+        if rebuild or not os.path.exists(checkpoint_path):
+            return trading_dates, False
+
+        checkpoint = load_checkpoint(checkpoint_path)
+        codes = list(self.portfolio['positions'])
+        if (
+            checkpoint is None
+            or checkpoint.last_date not in trading_dates
+            or not checkpoint.matches(
+                self._checkpoint_key(trading_dates[0]),
+                self.asof_prices.prices(codes, checkpoint.last_date),
+                self._window_digest(checkpoint.last_date),
+            )
+        ):
+            print('检查点与本次回测的参数或数据不一致，从头回测')
+            return trading_dates, False
+
+        for key, value in checkpoint.portfolio.items():
+            self.portfolio[key] = value
+        self.portfolio['history'] = checkpoint.history
+        self.daily_scores = checkpoint.extra['daily_scores']
+        details = checkpoint.extra['daily_score_details']
+        self.daily_score_details = ScoreDetailTable.from_records(
+            details['codes'], [tuple(row) for row in details['records']]
+        )
+        self._history_export = checkpoint.extra['history_export']
+
+        remaining = [date for date in trading_dates if date > checkpoint.last_date]
+        print(f"从检查点恢复: 已回测到 {checkpoint.last_date.strftime('%Y-%m-%d')}，新增 {len(remaining)} 个交易日")
+        return remaining, True
+
+    def _save_checkpoint(self, checkpoint_path: str, first_date: pd.Timestamp, last_date: pd.Timestamp) -> None:
+        """
+        保存回测到 last_date 为止的组合、历史、最后一日的评分与历史 CSV 的写出记录（明细按 SCORE_DETAIL_DTYPE 的字段写出）
+        """
+        codes = list(self.portfolio['positions'])
+        details = self.daily_score_details
+        detail_codes = list(details)
+        records = [tuple(getattr(details[etf_code], name) for name in SCORE_PANEL_FIELDS) for etf_code in detail_codes]
+        checkpoint = Checkpoint(
+            key=self._checkpoint_key(first_date),
+            last_date=last_date,
+            closes=self.asof_prices.prices(codes, last_date).tolist(),
+            window_digest=self._window_digest(last_date),
+            portfolio={key: self.portfolio[key] for key in ('cash', 'positions', 'total_value', 'trades')},
+            history=self.portfolio['history'],
+            extra={
+                'daily_scores': self.daily_scores,
+                'daily_score_details': {'codes': detail_codes, 'records': records},
+                'history_export': self._history_export,
+            },
+        )
+        save_checkpoint(checkpoint_path, checkpoint)
+        print(f'检查点已保存到: {checkpoint_path}')
+
+    def _run_loop(self, trading_dates: List[pd.Timestamp]) -> None:
+        """
+        事件循环：逐日交易、估值并记录历史
+        """
+        history, start = self._open_history(trading_dates)
+        if self.score_mode == 'matrix':
+            # 每日记录的收盘价整段一次查出
+            close_matrix = self.asof_prices.matrix(self.score_codes, trading_dates)
+        columns = {etf_code: j for j, etf_code in enumerate(history.codes)}
+
+        book = self._open_book()
+        for day, date in enumerate(trading_dates):
             self.trade(date)
             portfolio_value = self.update_portfolio_value(date)
+            held = book.held[0] if book.held else -1
 
-            current_position_name = '现金'
-            for etf_code, position in self.portfolio['positions'].items():
-                if position['shares'] > 0:
-                    current_position_name = f"{self.etf_config[etf_code]['name']}({etf_code})"
-                    break
-
-            history_record = {
-                'date': date,
-                'total_value': portfolio_value,
-                'cash': self.portfolio['cash'],
-                'current_position': current_position_name,
-            }
+            row = self._score_rows.get(date) if self.score_mode == 'matrix' else None
+            if row is not None:
+                # 当日行：综合得分、收盘价、长周期结束净值，列序即记录器的ETF顺序
+                values = (
+                    self.score_panel['combined_score'][row], close_matrix[day], self.score_panel['long_end_price'][row]
+                )
+                history.record(start + day, portfolio_value, book.cash, held, values)
+                continue
 
-            for etf_code, detail in self.daily_score_details.items():
-                etf_name = self.etf_config[etf_code]['name']
-                history_record[f'{etf_name}_综合得分'] = detail.combined_score
-                history_record[f'{etf_name}_收盘价'] = self.get_current_price(etf_code, date)
-                # history_record[f'{etf_name}_长周期原始得分'] = detail.long_term_raw
-                # history_record[f'{etf_name}_长周期Sigmoid'] = detail.long_term_sigmoid
-                # history_record[f'{etf_name}_短周期原始得分'] = detail.short_term_raw
-                # history_record[f'{etf_name}_短周期Sigmoid'] = detail.short_term_sigmoid
-                # history_record[f'{etf_name}_年化收益率'] = detail.annualized_returns
-                # history_record[f'{etf_name}_R平方'] = detail.r_squared
-                # history_record[f'{etf_name}_长周期斜率'] = detail.long_term_slope
-                # history_record[f'{etf_name}_短周期斜率'] = detail.short_term_slope
-                # history_record[f'{etf_name}_长周期起始净值'] = detail.long_start_price
-                history_record[f'{etf_name}_长周期结束净值'] = detail.long_end_price
-                # history_record[f'{etf_name}_短周期起始净值'] = detail.short_start_price
-                # history_record[f'{etf_name}_短周期结束净值'] = detail.short_end_price
-
-            self.portfolio['history'].append(history_record)
+            values = [np.full(len(history.codes), np.nan) for _ in range(3)]
+            written = [columns[etf_code] for etf_code in self.daily_score_details]
+            for j, (etf_code, detail) in zip(written, self.daily_score_details.items()):
+                values[0][j] = detail.combined_score
+                values[1][j] = self.get_current_price(etf_code, date)
+                values[2][j] = detail.long_end_price
+            history.record(start + day, portfolio_value, book.cash, held, values if written else None, written)
 
-        self.print_backtest_results()
+        self._close_book()
+
+    def run_vectorized(self, trading_dates: List[pd.Timestamp], check_parity: bool = False) -> None:
+        """
+        向量化回测：持仓为评分面板逐行综合得分最高的ETF，交易、逐日历史与最终持仓写入 self.portfolio，与事件循环相同；
+        综合得分含 NaN 时整段改走事件循环
+        """
+        initial_portfolio = copy.deepcopy(self.portfolio) if check_parity else None
+        self.build_score_panel(trading_dates)
+        codes = self.score_codes
+        names = [self.etf_config[etf_code]['name'] for etf_code in codes]
+        combined = self.score_panel['combined_score']
+        if np.isnan(combined).any():
+            # 含 NaN 的行事件循环按 get_rank 排序选取，不等同于逐行 argmax
+            print('评分面板含 NaN，改用事件循环回测')
+            self._run_loop(trading_dates)
+            return
+        prices = self.asof_prices.matrix(codes, trading_dates)
+        path = rotation_path(combined, prices, self.initial_capital)
+
+        self.portfolio['trades'].extend(
+            rotation_trades(path, prices, trading_dates, codes, names, self.initial_capital)
+        )
+        # 事件循环中买入后现金置为 0.0，持仓市值为份额 × 当日收盘价
+        held = codes[int(path.held[-1])]
+        self.portfolio['cash'] = 0.0
+        self.portfolio['positions'][held]['shares'] = float(path.shares[-1])
+        self.portfolio['positions'][held]['value'] = path.values[-1]
+        self.portfolio['total_value'] = path.values[-1]
+        last_row = len(trading_dates) - 1
+        self.daily_scores = self.row_scores(last_row)
+        self.daily_score_details = self.panel_details(last_row)
+
+        # 逐日历史整段写入：现金为 0.0，持仓编号按 portfolio['positions'] 的顺序，列与矩阵模式下事件循环的记录相同
+        history, start = self._open_history(trading_dates)
+        symbols = {etf_code: i for i, etf_code in enumerate(self.portfolio['positions'])}
+        history.record_span(
+            start,
+            path.values,
+            np.zeros(len(trading_dates)),
+            np.array([symbols[etf_code] for etf_code in codes])[path.held],
+            (combined, prices, self.score_panel['long_end_price']),
+        )
+
+        if check_parity:
+            # 事件循环按同一评分矩阵重跑，比对的是交易执行、估值与历史记录
+            vectorized, score_mode = self.portfolio, self.score_mode
+            self.portfolio, self.score_mode = initial_portfolio, 'matrix'
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    self._run_loop(trading_dates)
+                assert_same_backtest(vectorized, self.portfolio)
+            finally:
+                self.score_mode = score_mode
+            self.portfolio = vectorized
+            print(f'向量化结果与事件循环一致：{len(trading_dates)} 个交易日，{len(vectorized["trades"])} 笔交易')
+
+    def _open_history(self, trading_dates: List[pd.Timestamp]) -> Tuple[HistoryRecorder, int]:
+        """
+        本次回测写入的历史记录器及起始行号；portfolio['history'] 已是记录器时接在已有的行之后。
+        每只ETF记录 综合得分、收盘价、长周期结束净值，评分面板模式下沿用面板与价格矩阵的 dtype
+        """
+        history = self.portfolio['history']
+        if isinstance(history, HistoryRecorder):
+            return history, history.reserve(trading_dates)
+        codes, dtypes = list(self.etf_data), (np.float64, np.float64, np.float64)
+        if self.score_mode == 'matrix':
+            # 列序同评分面板，当日行可整行写入；收盘价取自 as-of 价格矩阵，为 float64
+            panel_dtype = self.score_panel.dtype
+            codes = self.score_codes
+            dtypes = (panel_dtype['combined_score'], np.float64, panel_dtype['long_end_price'])
+        names = [self.etf_config[etf_code]['name'] for etf_code in codes]
+        labels = [f"{self.etf_config[etf_code]['name']}({etf_code})" for etf_code in self.portfolio['positions']]
+        fields = list(zip(('综合得分', '收盘价', '长周期结束净值'), dtypes))
+        history = HistoryRecorder(trading_dates, codes, names, labels, fields)
+        self.portfolio['history'] = history
+        return history, 0
 
     def print_backtest_results(self) -> None:
         if not self.portfolio['history']:
             print('没有回测数据')
             return
 
-        history_df = pd.DataFrame(self.portfolio['history'])
+        history_df = history_frame(self.portfolio['history'])
         initial_value = history_df['total_value'].iloc[0]
         final_value = history_df['total_value'].iloc[-1]
         total_return = (final_value / initial_value - 1) * 100
@@ -416,6 +1022,30 @@ class LocalRankStrategy:
             print(f"  {etf_name}({etf_code}): {position['shares']:.0f}股, 价值{position['value']:.2f}元")
         print(f"  现金: {self.portfolio['cash']:.2f}元")
 
+        results_path = os.path.join(self.output_dir, 'rank_backtest_results.csv')
+        self._history_export = write_history_csv(
+            lambda start: self.export_history(history_df.iloc[start:]),
+            len(history_df),
+            results_path,
+            'utf-8-sig',
+            self._history_export,
+        )
+        print(f"\n详细结果已保存到: {results_path}")
+
+        self.export_latest_score_markdown(history_df)
+
+        if self.portfolio['trades']:
+            trades_df = pd.DataFrame(self.portfolio['trades'])
+            trades_path = os.path.join(self.output_dir, 'rank_trades_record.csv')
+            trades_df.to_csv(trades_path, index=False, encoding='utf-8-sig')
+            print(f"交易记录已保存到: {trades_path}")
+            print(f"共记录 {len(trades_df)} 笔交易")
+
+
+    def export_history(self, history_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        历史记录转为导出格式：只保留需要的列，使用中文列名并统一小数位（逐行处理，可只导出新增的行）
+        """
         base_pairs = [
             ('date', '日期'),
             ('total_value', '总市值'),
@@ -468,30 +1098,30 @@ class LocalRankStrategy:
             elif column.endswith(('净值', '收盘价')):
                 export_df[column] = pd.to_numeric(export_df[column], errors='coerce').round(4)
 
-        results_path = os.path.join(self.output_dir, 'rank_backtest_results.csv')
-        export_df.to_csv(results_path, index=False, encoding='utf-8-sig')
-        print(f"\n详细结果已保存到: {results_path}")
-
-        self.export_latest_score_markdown(history_df)
-
-        if self.portfolio['trades']:
-            trades_df = pd.DataFrame(self.portfolio['trades'])
-            trades_path = os.path.join(self.output_dir, 'rank_trades_record.csv')
-            trades_df.to_csv(trades_path, index=False, encoding='utf-8-sig')
-            print(f"交易记录已保存到: {trades_path}")
-            print(f"共记录 {len(trades_df)} 笔交易")
-
+        return export_df
 
     def export_latest_score_markdown(self, history_df: pd.DataFrame) -> None:
-        if not self.daily_scores or not self.daily_score_details:
-            return
-
         latest_date = history_df['date'].iloc[-1]
         latest_date_str = (
             latest_date.strftime('%Y-%m-%d') if hasattr(latest_date, 'strftime') else str(latest_date)
         )
 
-        ranked_etfs = sorted(self.daily_scores.items(), key=lambda item: item[1], reverse=True)
+        # 矩阵模式直接读取评分面板的最后一行，否则使用最后一次 trade 保存的明细
+        row = self._score_rows.get(latest_date) if self.score_mode == 'matrix' else None
+        if row is not None:
+            latest_scores = {
+                etf_code: float(self.score_panel['combined_score'][row, col])
+                for col, etf_code in enumerate(self.score_codes)
+            }
+            latest_details = self.panel_details(row)
+        else:
+            latest_scores = self.daily_scores
+            latest_details = self.daily_score_details
+
+        if not latest_scores or not latest_details:
+            return
+
+        ranked_etfs = sorted(latest_scores.items(), key=lambda item: item[1], reverse=True)
         if not ranked_etfs:
             return
 
@@ -504,9 +1134,9 @@ class LocalRankStrategy:
         lines.append("")
 
         for etf_code, _ in ranked_etfs:
-            if etf_code not in self.daily_score_details:
+            if etf_code not in latest_details:
                 continue
-            detail = self.daily_score_details[etf_code]
+            detail = latest_details[etf_code].materialize()
             name = self.etf_config[etf_code]['name']
 
             lines.append(f"## {name}({etf_code})")
@@ -545,9 +1175,19 @@ class LocalRankStrategy:
 
 
 def main() -> None:
+    parser = argparse.ArgumentParser(description='本地ETF排名轮动回测')
+    parser.add_argument('--rebuild', action='store_true', help='忽略检查点，从起始日重新回测')
+    args = parser.parse_args()
+
     strategy = LocalRankStrategy()
     today = datetime.now().strftime('%Y-%m-%d')
-    strategy.run_backtest(start_date='2024-01-01', end_date=today)
+    # 检查点已回测过的交易日不再重复计算
+    strategy.run_backtest(
+        start_date='2024-01-01',
+        end_date=today,
+        checkpoint_path=os.path.join(strategy.output_dir, 'rank_backtest_checkpoint.npz'),
+        rebuild=args.rebuild,
+    )
 
 
 if __name__ == '__main__':
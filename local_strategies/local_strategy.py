@@ -8,18 +8,69 @@
 
 import numpy as np
 import pandas as pd
+import argparse
+import contextlib
+import copy
+import io
 import math
 import os
 from datetime import datetime, timedelta
 import warnings
 warnings.filterwarnings('ignore')
 
+try:
+    from .asof_index import AsOfIndex
+    from .book import Book
+    from .checkpoint import Checkpoint, closes_digest, load_checkpoint, save_checkpoint, write_history_csv
+    from .compact import PRICE_DTYPE, SCORE_DTYPE
+    from .factor_engine import FactorEngine
+    from .history_recorder import HistoryRecorder, history_frame
+    from .price_panel import PricePanel
+    from .price_sources import PriceSources
+    from .momentum_kernel import MOM_FIELDS
+    from .rolling_regression import RollingScoreBook
+    from .score_formula import evaluate_formulas
+    from .topk import bounded_top_k, momentum_score_bound
+    from .breakeven import NextWindowTrend, pairwise_flip_prices
+    from .trading_calendar import epoch_day
+    from .vectorized import assert_same_backtest, py_round, rotation_path, rotation_trades
+except ImportError:
+    from asof_index import AsOfIndex
+    from book import Book
+    from checkpoint import Checkpoint, closes_digest, load_checkpoint, save_checkpoint, write_history_csv
+    from compact import PRICE_DTYPE, SCORE_DTYPE
+    from factor_engine import FactorEngine
+    from history_recorder import HistoryRecorder, history_frame
+    from price_panel import PricePanel
+    from price_sources import PriceSources
+    from momentum_kernel import MOM_FIELDS
+    from rolling_regression import RollingScoreBook
+    from score_formula import evaluate_formulas
+    from topk import bounded_top_k, momentum_score_bound
+    from breakeven import NextWindowTrend, pairwise_flip_prices
+    from trading_calendar import epoch_day
+    from vectorized import assert_same_backtest, py_round, rotation_path, rotation_trades
+
+# 历史记录中每只ETF的评分明细列：(列名后缀, 评分矩阵字段)
+HISTORY_SCORE_FIELDS = (
+    ('评分', 'score'), ('年化收益率', 'annualized_returns'), ('R平方', 'r_squared'),
+    ('斜率', 'slope'), ('起始净值', 'start_price'), ('结束净值', 'end_price'),
+)
+
 class LocalETFStrategy:
-    def __init__(self, data_dir='/home/suwei/回测策略/data'):
+    def __init__(self, data_dir='/home/suwei/回测策略/data', score_mode='matrix', etf_config=None, compact=False):
         """
         初始化策略
+
+        score_mode:
+            'matrix' - 回测前一次性计算 日期×ETF 的评分矩阵，get_rank 只做查表
+            'loop'   - 每日逐只调用 MOM 重新回归（原始实现，便于对照验证）
+        etf_config: 可选的ETF池 {代码: {'name': 名称, 'file': 文件名}}，缺省使用下方默认池
+        compact: 紧凑模式，收盘价与评分矩阵按 float32 存放（见 compact.py）
         """
         self.data_dir = data_dir
+        self.score_mode = score_mode
+        self.compact = compact
         # ETF池配置 - 对应我们获取的数据
         self.etf_config = {
             '518880': {'name': '黄金ETF', 'file': '518880_data.csv'},
@@ -27,6 +78,8 @@ class LocalETFStrategy:
             # '513500': {'name': '中概ETF', 'file': '513500_data.csv'},
             # '161116': {'name': '易方达黄金ETF', 'file': '161116_data.csv'}
         }
+        if etf_config is not None:
+            self.etf_config = dict(etf_config)
         
         # 策略参数
         self.m_days = 25  # 动量参考天数
@@ -39,14 +92,37 @@ class LocalETFStrategy:
             'cash': self.initial_capital,
             'positions': {},  # {etf_code: {'shares': 0, 'value': 0}}
             'total_value': self.initial_capital,
-            'history': [],  # 记录每日组合价值
+            'history': [],  # 记录每日组合价值，回测时换为列式的 HistoryRecorder
             'trades': []  # 记录交易记录
         }
 
+        # 事件循环中的组合账本（见 book.py），回测结束时写回 self.portfolio
+        self.book = None
+
         # 保存每日得分及拆分明细
         self.daily_scores = {}
         self.daily_score_details = {}
+        # 当日评分取自评分矩阵时的行号：循环中只记行号，明细字典在回测结束时再生成
+        self._daily_row = None
+        # 上次写出历史 CSV 的记录（见 checkpoint.write_history_csv），续跑时只追加新增的行
+        self._history_export = None
+
+        # 评分矩阵（score_mode='matrix' 时由 build_score_matrix 填充）
+        self.score_dates = None
+        self.score_codes = []
+        self.score_matrix = {}
+        self._score_rows = {}
+
+        # get_rank(top_k=...) 的逐日剪枝统计：{日期: {'candidates', 'evaluated', 'pruned'}}
+        self.prune_stats = {}
+
+        # 换仓临界价的评分函数（prepare_breakeven 填充）
+        self.flip_functions = {}
+        self.flip_last_closes = {}
         
+        self.price_panel = None
+        self.asof_prices = None
+        self.factor_engine = None
         self.load_data()
     
     def load_data(self):
@@ -54,26 +130,17 @@ class LocalETFStrategy:
         加载ETF数据
         """
         print("正在加载ETF数据...")
+
+        # 行情来源的优先级见 price_sources.py（按年分区存储、列式存储、CSV）；要读 CSV 的ETF较多时先用线程池并行解析，下面逐只加载直接命中缓存
+        sources = PriceSources(self.data_dir)
+        sources.prefetch({etf_code: config['file'] for etf_code, config in self.etf_config.items()})
         
         for etf_code, config in self.etf_config.items():
-            file_path = os.path.join(self.data_dir, config['file'])
-            
             try:
-                df = pd.read_csv(file_path)
-                # 标准化列名
-                if 'net_value' in df.columns:
-                    df.rename(columns={'net_value': 'close'}, inplace=True)
-                elif '单位净值' in df.columns:
-                    df.rename(columns={'单位净值': 'close', '净值日期': 'date'}, inplace=True)
-                
-                # 确保日期格式正确
-                df['date'] = pd.to_datetime(df['date'])
-                df = df.sort_values('date')
-                df.set_index('date', inplace=True)
-                
-                # 确保数据类型
-                df['close'] = pd.to_numeric(df['close'], errors='coerce')
-                df = df.dropna()
+                # 列名标准化、日期索引与数值化由共用的加载器完成，同一文件在进程内只解析一次
+                df = sources.load(etf_code, config['file'])
+                if self.compact:
+                    df = df.astype({'close': PRICE_DTYPE})
                 
                 self.etf_data[etf_code] = df
                 print(f"✓ {config['name']}({etf_code}): {len(df)} 条数据, 时间范围: {df.index[0].date()} 到 {df.index[-1].date()}")
@@ -85,6 +152,13 @@ class LocalETFStrategy:
                 print(f"✗ 加载 {config['name']}({etf_code}) 数据失败: {e}")
         
         print(f"数据加载完成，共 {len(self.etf_data)} 只ETF")
+
+        # 对齐的收盘价面板：MOM 等窗口取数按整数位置切片
+        self.price_panel = PricePanel.from_frames(self.etf_data, dtype=PRICE_DTYPE if self.compact else np.float64)
+        # as-of 价格索引：估值、成交价按日期二分查找当日或之前最近的收盘价
+        self.asof_prices = AsOfIndex.from_panel(self.price_panel)
+        # 因子引擎：对数价格、滚动回归等中间结果在整张面板上只算一次并缓存
+        self.factor_engine = FactorEngine.from_panel(self.price_panel)
     
     def get_trading_dates(self):
         """
@@ -93,12 +167,8 @@ class LocalETFStrategy:
         if not self.etf_data:
             return []
         
-        # 找到所有ETF的交集日期
-        date_sets = [set(df.index) for df in self.etf_data.values()]
-        common_dates = set.intersection(*date_sets)
-        
-        # 排序并确保有足够的历史数据
-        common_dates = sorted(list(common_dates))
+        # 找到所有ETF都有数据的日期（已按时间排序）
+        common_dates = self.price_panel.common_dates()
         
         # 从第m_days天开始，确保有足够历史数据计算动量
         if len(common_dates) > self.m_days:
@@ -122,14 +192,9 @@ class LocalETFStrategy:
         8. 最终评分：score = annualized_returns * r_squared
         """
         try:
-            df = self.etf_data[etf_code]
-            
-            # 获取指定日期前m_days天的数据
-            end_date = pd.to_datetime(end_date)
-            
             # 模拟聚宽attribute_history: 获取end_date之前的25个交易日（不包括end_date）
-            mask = df.index < end_date  # 注意这里是 < 不是 <=
-            price_data = df.loc[mask, 'close'].tail(self.m_days)
+            # 价格面板按整数位置切片，口径同 df.index < end_date（注意这里是 < 不是 <=）
+            price_data = self.price_panel.window_before(etf_code, end_date, self.m_days)
             
             if len(price_data) < self.m_days:
                 return -999, {
@@ -138,13 +203,13 @@ class LocalETFStrategy:
                     'annualized_returns': np.nan,
                     'r_squared': np.nan,
                     'slope': np.nan,
-                    'start_price': price_data.iloc[0] if len(price_data) > 0 else np.nan,
-                    'end_price': price_data.iloc[-1] if len(price_data) > 0 else np.nan
+                    'start_price': price_data[0] if len(price_data) > 0 else np.nan,
+                    'end_price': price_data[-1] if len(price_data) > 0 else np.nan
                 }
             
             # 【步骤详解】完全按照聚宽stock.py的MOM函数逻辑
             # 步骤1: 对价格取对数
-            y = np.log(price_data.values)
+            y = np.log(price_data)
             n = len(y)  # 应该是25
             
             # 步骤2: 创建时间序列 [0, 1, 2, ..., 24]
@@ -173,8 +238,8 @@ class LocalETFStrategy:
                 'annualized_returns': annualized_returns,
                 'r_squared': r_squared,
                 'slope': slope,
-                'start_price': float(price_data.iloc[0]),
-                'end_price': float(price_data.iloc[-1])
+                'start_price': float(price_data[0]),
+                'end_price': float(price_data[-1])
             }
 
             return score, details
@@ -191,155 +256,364 @@ class LocalETFStrategy:
                 'end_price': np.nan
             }
     
-    def get_rank(self, date):
+    def scan_m_days(self, windows, dates=None):
         """
-        获取ETF排名（按动量得分）
+        一次性计算多个动量窗口长度下的评分，便于比较不同 m_days
+
+        返回 {窗口长度: DataFrame(日期×ETF)}，历史不足处为 NaN；
+        每只ETF的前缀和只构建一次，每增加一个窗口长度只多 O(天数) 的计算。
         """
+        if dates is None:
+            dates = self.get_trading_dates()
+        dates = pd.DatetimeIndex(pd.to_datetime(dates))
+        engine = self.factor_engine
+        return {
+            window: pd.DataFrame(
+                engine.lookup_before('momentum_score', dates, window=window, weighted=True),
+                index=dates,
+                columns=engine.codes,
+            )
+            for window in windows
+        }
+
+    def scan_formulas(self, formulas, dates=None):
+        """
+        批量计算评分公式（语法见 score_formula.py），公共子表达式只算一次
+
+        返回 {名称: DataFrame(日期×ETF)}，历史不足处为 NaN。
+        """
+        if dates is None:
+            dates = self.get_trading_dates()
+        return evaluate_formulas(self.factor_engine, formulas, dates)
+
+    def build_score_matrix(self, dates):
+        """
+        一次性计算给定日期上所有ETF的MOM结果
+
+        评分、R² 等矩阵取自因子引擎（每只ETF只做一次滑动窗口的闭式加权回归），
+        再按日期定位到“当日之前”的窗口，结果与逐日调用 MOM 一致（误差在 1e-10 以内）。
+        """
+        dates = pd.DatetimeIndex(pd.to_datetime(dates))
+        engine = self.factor_engine
+        params = {'window': self.m_days, 'weighted': True}
+
+        matrix = {
+            'annualized_returns': engine.lookup_before('annualized_returns', dates, **params),
+            'r_squared': engine.lookup_before('r_squared', dates, **params),
+            'slope': engine.lookup_before('slope', dates, **params),
+            'intercept': engine.lookup_before('intercept', dates, **params),
+            'start_price': engine.lookup_before('window_start_price', dates, window=self.m_days),
+            'end_price': engine.lookup_before('close', dates),
+        }
+        matrix['score'] = self.momentum_scores(dates)
+        if self.compact:
+            # 评分矩阵按单精度保存，因子引擎中的 float64 中间结果随即释放
+            matrix = {name: values.astype(SCORE_DTYPE) for name, values in matrix.items()}
+            engine.clear()
+
+        self.score_dates = dates
+        self.score_codes = list(engine.codes)
+        self.score_matrix = matrix
+        self._score_rows = {date: i for i, date in enumerate(dates)}
+
+    def momentum_scores(self, dates) -> np.ndarray:
+        """
+        给定日期上所有ETF（列序同因子引擎）的MOM评分，历史不足处为 -999；只计算不保存，评分矩阵不变
+        """
+        dates = pd.DatetimeIndex(pd.to_datetime(dates))
+        engine = self.factor_engine
+        enough_history = engine.history_count_before(dates) >= self.m_days
+        scores = np.where(
+            enough_history,
+            engine.lookup_before('momentum_score', dates, window=self.m_days, weighted=True),
+            -999.0,
+        )
+        return scores.astype(SCORE_DTYPE) if self.compact else scores
+
+    def _lookup_scores(self, date):
+        """
+        从评分矩阵中读取某日的评分，日期不在矩阵中时返回 None
+        """
+        row = self._score_rows.get(pd.to_datetime(date))
+        if row is None:
+            return None
+        return self._row_scores(row)
+
+    def _row_scores(self, row):
+        """
+        评分矩阵第 row 行的评分与明细字典
+        """
+        values = {name: self.score_matrix[name][row].tolist() for name in MOM_FIELDS}
         scores = {}
         score_details = {}
-
-        for etf_code in self.etf_data.keys():
-            score, detail = self.MOM(etf_code, date)
-            scores[etf_code] = score
+        for j, etf_code in enumerate(self.score_codes):
+            detail = {name: values[name][j] for name in MOM_FIELDS}
+            detail.pop('intercept')
+            if detail['score'] == -999:
+                detail['message'] = '历史数据不足'
+            scores[etf_code] = detail['score']
             score_details[etf_code] = detail
+        return scores, score_details
+
+    def get_rank(self, date, top_k=None):
+        """
+        获取ETF排名（按动量得分）
+
+        给定 top_k 且需要逐只调用 MOM 时走有界 Top-K（见 bounded_rank），
+        返回的排名只含前 top_k 只；查表模式下仍返回全部得分，排名截取前 top_k 只。
+        """
+        looked_up = self._lookup_scores(date) if self.score_mode == 'matrix' else None
+
+        if looked_up is not None:
+            scores, score_details = looked_up
+        elif top_k is not None:
+            return self.bounded_rank(date, top_k)
+        else:
+            scores = {}
+            score_details = {}
+
+            for etf_code in self.etf_data.keys():
+                score, detail = self.MOM(etf_code, date)
+                scores[etf_code] = score
+                score_details[etf_code] = detail
 
         # 按得分排序
         ranked_etfs = sorted(scores.items(), key=lambda x: x[1], reverse=True)
 
         # 返回排序后的ETF代码列表
+        ranked_list = [etf for etf, score in ranked_etfs]
+        return (ranked_list if top_k is None else ranked_list[:top_k]), scores, score_details
+
+    def bounded_rank(self, date, top_k):
+        """
+        有界 Top-K 排名：先用闭式斜率算出每只ETF评分的上界（R² 取其可能的最大值），
+        按上界从高到低调用 MOM，上界已低于当前第 top_k 名得分的ETF不再计算
+
+        剪枝统计记入 prune_stats[date]，结果与全部打分后取前 top_k 只一致。
+        """
+        date = pd.to_datetime(date)
+        codes = list(self.etf_data.keys())
+        closes, ready = self.price_panel.windows_before(codes, date, self.m_days)
+
+        # 历史不足的ETF得分固定为 -999，上界即为其真实得分
+        bounds = np.full(len(codes), -999.0)
+        if ready.any():
+            bounds[ready] = momentum_score_bound(np.log(closes[ready]), weighted=True)
+
+        score_details = {}
+
+        def evaluate(etf_code):
+            score, score_details[etf_code] = self.MOM(etf_code, date)
+            return score
+
+        result = bounded_top_k(codes, bounds, evaluate, top_k)
+        self.prune_stats[date] = {
+            'candidates': len(codes),
+            'evaluated': result.evaluated,
+            'pruned': result.pruned,
+        }
+        return result.selected, result.scores, score_details
+    
+    def load_live_book(self, state_path='analysis_results/live_mom_state.json', rebuild=False):
+        """
+        恢复增量回归状态并推入新到的收盘价，窗口参数变化或 rebuild=True 时从头重建
+        """
+        book = None
+        if not rebuild and os.path.exists(state_path):
+            book = RollingScoreBook.load(state_path)
+            if book.windows != (self.m_days,) or not book.weighted:
+                book = None
+        if book is None:
+            book = RollingScoreBook((self.m_days,), weighted=True)
+
+        pushed = book.update_from_data(self.etf_data)
+        book.save(state_path)
+        print(f"增量评分状态已更新: 新增 {pushed} 条收盘价 -> {state_path}")
+        return book
+
+    def live_rank(self, state_path='analysis_results/live_mom_state.json', rebuild=False):
+        """
+        每日早盘打分：恢复增量回归状态，只推入新到的收盘价后排名
+
+        状态文件保存每只ETF最近 m_days 个收盘价及滚动回归的各阶矩，
+        评分口径等同于以“最新数据的下一交易日”调用 MOM。
+        """
+        book = self.load_live_book(state_path, rebuild)
+        results = book.results(self.m_days)
+        scores = {}
+        score_details = {}
+        for etf_code in self.etf_data.keys():
+            if etf_code in results:
+                detail = dict(results[etf_code])
+                detail.pop('intercept')
+            else:
+                detail = {'score': -999, 'message': '历史数据不足'}
+            scores[etf_code] = detail['score']
+            score_details[etf_code] = detail
+
+        ranked_etfs = sorted(scores.items(), key=lambda x: x[1], reverse=True)
         return [etf for etf, score in ranked_etfs], scores, score_details
     
+    def prepare_breakeven(self, state_path='analysis_results/live_mom_state.json', rebuild=False):
+        """
+        开盘前调用一次：由增量回归状态构建每只ETF下一次排名的评分函数（今日价格为自变量）
+        """
+        book = self.load_live_book(state_path, rebuild)
+        self.flip_functions = {}
+        self.flip_last_closes = {}
+        for etf_code in self.etf_data.keys():
+            reg = book.regressions.get(etf_code, {}).get(self.m_days)
+            if reg is not None and reg.is_ready:
+                self.flip_functions[etf_code] = NextWindowTrend(reg).at
+                self.flip_last_closes[etf_code] = reg.closes[-1]
+
+    def breakeven_prices(self, quotes=None, max_log_move=0.25):
+        """
+        两两换仓临界价（DataFrame）：第 i 行第 j 列为ETF i 今日价格到多少时与ETF j 得分相同
+
+        quotes 为 {代码: 实时价格}，缺省的ETF按今日价格等于最新收盘价计算；
+        首次调用时自动 prepare_breakeven，之后每次只做闭式评分与牛顿迭代，可在每个报价跳动时调用。
+        """
+        if not self.flip_functions:
+            self.prepare_breakeven()
+        prices = dict(self.flip_last_closes)
+        prices.update({code: price for code, price in (quotes or {}).items() if code in prices})
+        return pairwise_flip_prices(self.flip_functions, prices, max_log_move)
+
     def get_current_price(self, etf_code, date):
         """
-        获取指定日期的ETF价格
+        获取指定日期的ETF价格，当日无数据时取之前最近一个交易日的收盘价
         """
-        try:
-            df = self.etf_data[etf_code]
-            date = pd.to_datetime(date)
-            
-            if date in df.index:
-                return df.loc[date, 'close']
-            else:
-                # 找最近的交易日
-                available_dates = df.index[df.index <= date]
-                if len(available_dates) > 0:
-                    latest_date = available_dates[-1]
-                    return df.loc[latest_date, 'close']
-                else:
-                    return None
-        except:
+        if etf_code not in self.asof_prices:
             return None
+        price = self.asof_prices.price(etf_code, date)
+        return None if math.isnan(price) else price
     
+    def _open_book(self):
+        """
+        由 self.portfolio 建立组合账本（已建立时直接返回），之后的交易与估值在账本上进行
+        """
+        if self.book is None:
+            self.book = Book.open(self.portfolio, zero=0)
+        return self.book
+
+    def _close_book(self):
+        """
+        账本写回 self.portfolio；当日评分取自评分矩阵时，生成最后一日的评分明细字典
+        """
+        if self.book is not None:
+            names = [self.etf_config[etf_code]['name'] for etf_code in self.book.codes]
+            self.book.close(self.portfolio, names)
+            self.book = None
+        if self._daily_row is not None:
+            self.daily_scores, self.daily_score_details = self._row_scores(self._daily_row)
+            self._daily_row = None
+
     def update_portfolio_value(self, date):
         """
         更新组合总价值
         """
-        total_value = self.portfolio['cash']
-        
-        for etf_code, position in self.portfolio['positions'].items():
-            if position['shares'] > 0:
-                current_price = self.get_current_price(etf_code, date)
-                if current_price:
-                    position_value = position['shares'] * current_price
-                    position['value'] = position_value
-                    total_value += position_value
-        
-        self.portfolio['total_value'] = total_value
+        book = self._open_book()
+        total_value = book.cash
+
+        # 当日所有持仓的价格一次查出
+        if book.held:
+            held_codes = [book.codes[symbol] for symbol in book.held]
+            for symbol, current_price in zip(book.held, self.asof_prices.prices(held_codes, date)):
+                if current_price > 0:
+                    position = book.positions[symbol]
+                    position.value = position.shares * current_price
+                    total_value += position.value
+
+        book.total_value = total_value
         return total_value
-    
+
+    def _matrix_target(self, date):
+        """
+        矩阵模式下直接取评分矩阵当日行的最高分ETF（与排序后取第一只相同，平分时取列序靠前者）并记下行号；
+        日期不在矩阵中、或该行有 NaN（排序结果不再等同于 argmax）时返回 None，由 get_rank 处理
+        """
+        if self.score_mode != 'matrix' or not self.score_codes:
+            return None
+        row = self._score_rows.get(pd.to_datetime(date))
+        if row is None:
+            return None
+        score_row = self.score_matrix['score'][row]
+        col = int(np.argmax(score_row))
+        if np.isnan(score_row[col]):
+            return None
+        self._daily_row = row
+        return self.score_codes[col]
+
     def trade(self, date):
         """
         执行交易逻辑 - 完全模拟聚宽平台逻辑
         """
+        book = self._open_book()
+
         # 获取当前最优ETF（只选择得分最高的1只）
-        ranked_etfs, scores, score_details = self.get_rank(date)
+        target_etf = self._matrix_target(date)
+        if target_etf is None:
+            ranked_etfs, scores, score_details = self.get_rank(date)
+
+            if not ranked_etfs:
+                print(f"{date.strftime('%Y-%m-%d')} 无可用ETF评分，跳过交易")
+                return
+
+            target_etf = ranked_etfs[0]
+
+            # 保存当日的评分数据，用于CSV导出
+            self.daily_scores = scores
+            self.daily_score_details = score_details
+            self._daily_row = None
 
-        if not ranked_etfs:
-            print(f"{date.strftime('%Y-%m-%d')} 无可用ETF评分，跳过交易")
+        # 没有持仓或当前持仓不是最优ETF时换仓
+        target = book.symbols[target_etf]
+        if target in book.held:
             return
 
-        target_etf = ranked_etfs[0]
+        day = epoch_day(date)
+        if self._daily_row is None:
+            scores = self.daily_scores
+        else:
+            scores = dict(zip(self.score_codes, self.score_matrix['score'][self._daily_row].tolist()))
+        print(f"\n{date.strftime('%Y-%m-%d')} 交易信号:")
+        for etf, score in scores.items():
+            name = self.etf_config[etf]['name']
+            print(f"  {name}({etf}): {score:.4f}")
 
-        # 保存当日的评分数据，用于CSV导出
-        self.daily_scores = scores
-        self.daily_score_details = score_details
-        
-        # 获取当前持仓
-        current_holdings = [etf for etf, pos in self.portfolio['positions'].items() 
-                          if pos['shares'] > 0]
-        
-        # 判断是否需要交易
-        need_trade = False
-        if len(current_holdings) == 0:
-            # 没有持仓，需要买入
-            need_trade = True
-        elif len(current_holdings) > 0 and target_etf not in current_holdings:
-            # 当前持仓不是最优ETF，需要切换
-            need_trade = True
-        
-        if need_trade:
-            print(f"\n{date.strftime('%Y-%m-%d')} 交易信号:")
-            for etf, score in scores.items():
-                name = self.etf_config[etf]['name']
-                print(f"  {name}({etf}): {score:.4f}")
-            
-            # 卖出所有当前持仓
-            for etf_code in current_holdings:
-                if etf_code != target_etf:
-                    shares = self.portfolio['positions'][etf_code]['shares']
-                    current_price = self.get_current_price(etf_code, date)
-                    
-                    if current_price and shares > 0:
-                        sell_value = shares * current_price
-                        self.portfolio['cash'] += sell_value
-                        self.portfolio['positions'][etf_code]['shares'] = 0
-                        self.portfolio['positions'][etf_code]['value'] = 0
-                        
-                        # 记录交易
-                        self.portfolio['trades'].append({
-                            'date': date.strftime('%Y-%m-%d'),
-                            'type': 'sell',
-                            'code': etf_code,
-                            'name': self.etf_config[etf_code]['name'],
-                            'shares': shares,
-                            'price': current_price,
-                            'amount': sell_value
-                        })
-                        
-                        name = self.etf_config[etf_code]['name']
-                        print(f"  ✗ 卖出 {name}({etf_code}): {shares:.0f}股, 价值{sell_value:.2f}元")
-            
-            # 买入目标ETF
-            if target_etf not in current_holdings or self.portfolio['positions'][target_etf]['shares'] == 0:
-                current_price = self.get_current_price(target_etf, date)
-                
-                if current_price and self.portfolio['cash'] > 0:
-                    # 用所有现金买入
-                    buy_value = self.portfolio['cash']
-                    shares = buy_value / current_price
-                    
-                    self.portfolio['positions'][target_etf]['shares'] = shares
-                    self.portfolio['positions'][target_etf]['value'] = buy_value
-                    self.portfolio['cash'] = 0
-                    
-                    # 记录交易
-                    self.portfolio['trades'].append({
-                        'date': date.strftime('%Y-%m-%d'),
-                        'type': 'buy',
-                        'code': target_etf,
-                        'name': self.etf_config[target_etf]['name'],
-                        'shares': shares,
-                        'price': current_price,
-                        'amount': buy_value
-                    })
-                    
-                    name = self.etf_config[target_etf]['name']
-                    print(f"  ✓ 买入 {name}({target_etf}): {shares:.0f}股, 价值{buy_value:.2f}元")
-    
-    def run_backtest(self, start_date=None, end_date=None):
+        # 卖出所有当前持仓
+        for symbol in list(book.held):
+            etf_code = book.codes[symbol]
+            current_price = self.get_current_price(etf_code, date)
+            if current_price:
+                sold = book.sell(symbol, day, current_price)
+                name = self.etf_config[etf_code]['name']
+                print(f"  ✗ 卖出 {name}({etf_code}): {sold.shares:.0f}股, 价值{sold.amount:.2f}元")
+
+        # 买入目标ETF：用所有现金买入
+        current_price = self.get_current_price(target_etf, date)
+        if current_price and book.cash > 0:
+            bought = book.buy(target, day, current_price)
+            name = self.etf_config[target_etf]['name']
+            print(f"  ✓ 买入 {name}({target_etf}): {bought.shares:.0f}股, 价值{bought.amount:.2f}元")
+
+    def run_backtest(
+        self, start_date=None, end_date=None, mode='loop', check_parity=False, checkpoint_path=None, rebuild=False
+    ):
         """
         运行回测
+
+        mode:
+            'loop'       - 逐日调用 trade / update_portfolio_value（事件循环）
+            'vectorized' - 由评分矩阵整段算出持仓、换仓与市值（见 vectorized.py），不逐笔打印交易信号
+        check_parity: mode='vectorized' 时另以事件循环重跑一遍并逐项比对，不一致抛出 ParityError
+        checkpoint_path: 检查点文件（见 checkpoint.py）。存在且与本次回测一致时从中恢复组合与历史，
+            只对之后新增的交易日运行事件循环，结束后写回检查点；rebuild=True 时忽略已有检查点从头回测
         """
+        if mode not in ('loop', 'vectorized'):
+            raise ValueError(f"未知的回测模式: {mode}")
+
         print("\n" + "="*60)
         print("开始回测...")
         print("="*60)
@@ -362,7 +636,110 @@ class LocalETFStrategy:
         print(f"回测期间: {trading_dates[0].strftime('%Y-%m-%d')} 到 {trading_dates[-1].strftime('%Y-%m-%d')}")
         print(f"交易日数: {len(trading_dates)}天")
         print(f"初始资金: {self.initial_capital:,.0f}元")
-        
+
+        first_date, resumed = trading_dates[0], False
+        if checkpoint_path:
+            trading_dates, resumed = self._resume_checkpoint(checkpoint_path, trading_dates, rebuild)
+
+        if not trading_dates:
+            print("检查点已处理到最后一个交易日，没有新增交易日")
+        elif mode == 'vectorized' and not resumed:
+            self.run_vectorized(trading_dates, check_parity=check_parity)
+        else:
+            # 续跑时组合已有持仓，新增交易日总是走事件循环（结果与向量化相同）
+            if self.score_mode == 'matrix':
+                self.build_score_matrix(trading_dates)
+            self._run_loop(trading_dates)
+
+        # 输出回测结果
+        self.print_backtest_results()
+
+        if checkpoint_path and trading_dates:
+            self._save_checkpoint(checkpoint_path, first_date, trading_dates[-1])
+
+    def _checkpoint_key(self, first_date):
+        """
+        决定检查点能否续跑的参数：策略、评分方式、ETF池、动量天数、初始资金与回测起始日
+        """
+        return {
+            'strategy': type(self).__name__,
+            'score_mode': self.score_mode,
+            'compact': self.compact,
+            'etfs': [[etf_code, self.etf_config[etf_code]['name']] for etf_code in self.portfolio['positions']],
+            'm_days': self.m_days,
+            'initial_capital': self.initial_capital,
+            'start_date': first_date.strftime('%Y-%m-%d'),
+        }
+
+    def _window_digest(self, last_date):
+        """
+        各ETF截至 last_date（含）最近 m_days 个收盘价的摘要：之后各日的评分窗口都与这段重叠
+        """
+        after = last_date + pd.Timedelta(days=1)
+        return closes_digest({
+            etf_code: self.price_panel.window_before(etf_code, after, self.m_days) for etf_code in self.etf_data
+        })
+
+    def _resume_checkpoint(self, checkpoint_path, trading_dates, rebuild=False):
+        """
+        从检查点恢复组合、历史与最后一日的评分，返回 (之后尚未处理的交易日, 是否已恢复)；
+        rebuild=True、没有检查点或检查点与本次回测不一致时返回全部交易日
+        """
+        if rebuild or not os.path.exists(checkpoint_path):
+            return trading_dates, False
+
+        checkpoint = load_checkpoint(checkpoint_path)
+        codes = list(self.portfolio['positions'])
+        if (
+            checkpoint is None
+            or checkpoint.last_date not in trading_dates
+            or not checkpoint.matches(
+                self._checkpoint_key(trading_dates[0]),
+                self.asof_prices.prices(codes, checkpoint.last_date),
+                self._window_digest(checkpoint.last_date),
+            )
+        ):
+            print("检查点与本次回测的参数或数据不一致，从头回测")
+            return trading_dates, False
+
+        for key, value in checkpoint.portfolio.items():
+            self.portfolio[key] = value
+        self.portfolio['history'] = checkpoint.history
+        self.daily_scores = checkpoint.extra['daily_scores']
+        self.daily_score_details = checkpoint.extra['daily_score_details']
+        self._history_export = checkpoint.extra['history_export']
+
+        remaining = [date for date in trading_dates if date > checkpoint.last_date]
+        print(f"从检查点恢复: 已回测到 {checkpoint.last_date.strftime('%Y-%m-%d')}，新增 {len(remaining)} 个交易日")
+        return remaining, True
+
+    def _save_checkpoint(self, checkpoint_path, first_date, last_date):
+        """
+        保存回测到 last_date 为止的组合、历史、最后一日的评分与历史 CSV 的写出记录
+        """
+        codes = list(self.portfolio['positions'])
+        checkpoint = Checkpoint(
+            key=self._checkpoint_key(first_date),
+            last_date=last_date,
+            closes=self.asof_prices.prices(codes, last_date).tolist(),
+            window_digest=self._window_digest(last_date),
+            portfolio={key: self.portfolio[key] for key in ('cash', 'positions', 'total_value', 'trades')},
+            history=self.portfolio['history'],
+            extra={
+                'daily_scores': self.daily_scores,
+                'daily_score_details': self.daily_score_details,
+                'history_export': self._history_export,
+            },
+        )
+        save_checkpoint(checkpoint_path, checkpoint)
+        print(f"检查点已保存到: {checkpoint_path}")
+
+    def _run_loop(self, trading_dates):
+        """
+        事件循环：逐日交易、估值并记录历史
+        """
+        history, start = self._open_history(trading_dates)
+
         # 执行回测 - 每天运行交易函数（模拟聚宽的run_daily）
         for i, date in enumerate(trading_dates):
             # 每天都运行trade函数，但只在需要时才实际交易
@@ -371,39 +748,108 @@ class LocalETFStrategy:
             # 更新组合价值
             portfolio_value = self.update_portfolio_value(date)
             
-            # 获取当前持仓ETF名称
-            current_position = "现金"
-            for etf_code, position in self.portfolio['positions'].items():
-                if position['shares'] > 0:
-                    current_position = f"{self.etf_config[etf_code]['name']}({etf_code})"
-                    break
-            
-            # 记录历史
-            history_record = {
-                'date': date,
-                'total_value': portfolio_value,
-                'cash': self.portfolio['cash'],
-                'current_position': current_position,
-                'positions': dict(self.portfolio['positions'])
-            }
-            
-            # 添加ETF评分数据
-            if hasattr(self, 'daily_scores'):
-                for etf_code, score in self.daily_scores.items():
-                    etf_name = self.etf_config[etf_code]['name']
-                    history_record[f'{etf_name}_评分'] = round(score, 6)
-                    detail = self.daily_score_details.get(etf_code, {}) if hasattr(self, 'daily_score_details') else {}
-                    history_record[f'{etf_name}_年化收益率'] = round(detail.get('annualized_returns', np.nan), 6)
-                    history_record[f'{etf_name}_R平方'] = round(detail.get('r_squared', np.nan), 6)
-                    history_record[f'{etf_name}_斜率'] = round(detail.get('slope', np.nan), 6)
-                    history_record[f'{etf_name}_起始净值'] = round(detail.get('start_price', np.nan), 6)
-                    history_record[f'{etf_name}_结束净值'] = round(detail.get('end_price', np.nan), 6)
-
-            self.portfolio['history'].append(history_record)
-        
-        # 输出回测结果
-        self.print_backtest_results()
+            self._record_history(history, start + i, portfolio_value)
+
+        self._close_book()
+
+    def run_vectorized(self, trading_dates, check_parity=False):
+        """
+        向量化回测：持仓为评分矩阵逐行的最高分ETF，交易、逐日历史与最终持仓写入 self.portfolio，与事件循环相同；
+        评分矩阵含 NaN 时整段改走事件循环
+        """
+        initial_portfolio = copy.deepcopy(self.portfolio) if check_parity else None
+        self.build_score_matrix(trading_dates)
+        codes = self.score_codes
+        names = [self.etf_config[etf_code]['name'] for etf_code in codes]
+        if np.isnan(self.score_matrix['score']).any():
+            # 含 NaN 的行事件循环按 get_rank 排序选取，不等同于逐行 argmax
+            print("评分矩阵含 NaN，改用事件循环回测")
+            self._run_loop(trading_dates)
+            return
+        prices = self.asof_prices.matrix(codes, trading_dates)
+        path = rotation_path(self.score_matrix['score'], prices, self.initial_capital)
+
+        self.portfolio['trades'].extend(
+            rotation_trades(path, prices, trading_dates, codes, names, self.initial_capital)
+        )
+        # 事件循环中买入后现金置为 0，持仓市值为份额 × 当日收盘价
+        held = codes[int(path.held[-1])]
+        self.portfolio['cash'] = 0
+        self.portfolio['positions'][held]['shares'] = float(path.shares[-1])
+        self.portfolio['positions'][held]['value'] = path.values[-1]
+        self.portfolio['total_value'] = path.values[-1]
+        self.daily_scores, self.daily_score_details = self._lookup_scores(trading_dates[-1])
+
+        # 逐日历史整段写入：现金为整数 0，持仓编号按 portfolio['positions'] 的顺序，评分明细同样保留 6 位
+        history, start = self._open_history(trading_dates)
+        symbols = {etf_code: i for i, etf_code in enumerate(self.portfolio['positions'])}
+        history.record_span(
+            start,
+            path.values,
+            np.zeros(len(trading_dates), dtype=np.int64),
+            np.array([symbols[etf_code] for etf_code in codes])[path.held],
+            [py_round(self.score_matrix[field], 6) for _, field in HISTORY_SCORE_FIELDS],
+        )
+
+        if check_parity:
+            # 事件循环按同一评分矩阵重跑，比对的是交易执行、估值与历史记录
+            vectorized, score_mode = self.portfolio, self.score_mode
+            self.portfolio, self.score_mode = initial_portfolio, 'matrix'
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    self._run_loop(trading_dates)
+                assert_same_backtest(vectorized, self.portfolio)
+            finally:
+                self.score_mode = score_mode
+            self.portfolio = vectorized
+            print(f"向量化结果与事件循环一致：{len(trading_dates)} 个交易日，{len(vectorized['trades'])} 笔交易")
     
+    def _new_history(self, trading_dates, codes):
+        """
+        按交易日历预分配的历史记录器：codes 为评分明细列的ETF，持仓编号按 portfolio['positions'] 的顺序
+        """
+        names = [self.etf_config[etf_code]['name'] for etf_code in codes]
+        labels = [f"{self.etf_config[etf_code]['name']}({etf_code})" for etf_code in self.portfolio['positions']]
+        fields = [(suffix, np.float64) for suffix, _ in HISTORY_SCORE_FIELDS]
+        return HistoryRecorder(trading_dates, codes, names, labels, fields)
+
+    def _open_history(self, trading_dates):
+        """
+        本次回测写入的历史记录器及起始行号；portfolio['history'] 已是记录器时接在已有的行之后
+        """
+        history = self.portfolio['history']
+        if isinstance(history, HistoryRecorder):
+            return history, history.reserve(trading_dates)
+        # 评分矩阵模式下列序同评分矩阵，当日行可整行写入
+        codes = self.score_codes if self.score_mode == 'matrix' and self.score_codes else list(self.etf_data)
+        history = self._new_history(trading_dates, codes)
+        self.portfolio['history'] = history
+        return history, 0
+
+    def _record_history(self, history, row, portfolio_value):
+        """
+        写入当日的历史记录：组合价值、现金、持仓编号与各ETF的评分明细（保留 6 位）
+        """
+        book = self._open_book()
+        held = book.held[0] if book.held else -1
+
+        # 添加ETF评分数据
+        values, columns = None, None
+        if self._daily_row is not None:
+            # 评分矩阵当日行，列序即记录器的ETF顺序
+            values = [py_round(self.score_matrix[field][self._daily_row], 6) for _, field in HISTORY_SCORE_FIELDS]
+        elif self.daily_scores:
+            values = [np.full(len(history.codes), np.nan) for _ in HISTORY_SCORE_FIELDS]
+            positions = {etf_code: j for j, etf_code in enumerate(history.codes)}
+            columns = [positions[etf_code] for etf_code in self.daily_scores]
+            for j, (etf_code, score) in zip(columns, self.daily_scores.items()):
+                detail = self.daily_score_details.get(etf_code, {})
+                values[0][j] = round(score, 6)
+                for k, (_, field) in enumerate(HISTORY_SCORE_FIELDS[1:], start=1):
+                    values[k][j] = round(detail.get(field, np.nan), 6)
+
+        history.record(row, portfolio_value, book.cash, held, values, columns)
+
     def print_backtest_results(self):
         """
         输出回测结果
@@ -412,14 +858,35 @@ class LocalETFStrategy:
             print("没有回测数据")
             return
         
-        history_df = pd.DataFrame(self.portfolio['history'])
-        
-        initial_value = history_df['total_value'].iloc[0]
-        final_value = history_df['total_value'].iloc[-1]
+        history_df = history_frame(self.portfolio['history'])
+        self._print_summary(history_df['date'], history_df['total_value'])
+
+        self._history_export = write_history_csv(
+            lambda start: self.export_history(history_df.iloc[start:]),
+            len(history_df),
+            'analysis_results/backtest_results.csv',
+            'utf-8-sig',
+            self._history_export,
+        )
+        print(f"\n详细结果已保存到: analysis_results/backtest_results.csv")
+
+        # 保存交易记录到CSV
+        if self.portfolio['trades']:
+            trades_df = pd.DataFrame(self.portfolio['trades'])
+            trades_df.to_csv('analysis_results/trades_record.csv', index=False)
+            print(f"交易记录已保存到: analysis_results/trades_record.csv")
+            print(f"共记录 {len(trades_df)} 笔交易")
+
+    def _print_summary(self, dates, values):
+        """
+        输出收益率、最大回撤与最终持仓，dates / values 为逐日的日期与组合总价值（pd.Series）
+        """
+        initial_value = values.iloc[0]
+        final_value = values.iloc[-1]
         total_return = (final_value / initial_value - 1) * 100
         
-        start_date = history_df['date'].iloc[0]
-        end_date = history_df['date'].iloc[-1]
+        start_date = dates.iloc[0]
+        end_date = dates.iloc[-1]
         days = (end_date - start_date).days
         years = days / 365.25
         
@@ -435,8 +902,8 @@ class LocalETFStrategy:
         print(f"回测天数: {days}天 ({years:.2f}年)")
         
         # 最大回撤
-        rolling_max = history_df['total_value'].expanding().max()
-        drawdown = (history_df['total_value'] / rolling_max - 1) * 100
+        rolling_max = values.expanding().max()
+        drawdown = (values / rolling_max - 1) * 100
         max_drawdown = drawdown.min()
         print(f"最大回撤: {max_drawdown:.2f}%")
         
@@ -449,8 +916,12 @@ class LocalETFStrategy:
                 print(f"  {name}({etf_code}): {position['shares']:.0f}股, 价值{position['value']:.2f}元")
         
         print(f"  现金: {self.portfolio['cash']:.2f}元")
-        
-        # 保存详细结果到CSV - 只保留用户需要的列，使用中文列名
+
+    def export_history(self, history_df):
+        """
+        历史记录转为导出格式：只保留需要的列，使用中文列名并统一小数位
+        """
+        # 只保留用户需要的列，使用中文列名
         base_columns = [
             ('date', '日期'),
             ('total_value', '总市值'), 
@@ -497,26 +968,27 @@ class LocalETFStrategy:
             elif col.endswith('净值'):
                 export_df[col] = pd.to_numeric(export_df[col], errors='coerce').round(4)
 
-        export_df.to_csv('analysis_results/backtest_results.csv', index=False, encoding='utf-8-sig')
-        print(f"\n详细结果已保存到: analysis_results/backtest_results.csv")
-
-        # 保存交易记录到CSV
-        if self.portfolio['trades']:
-            trades_df = pd.DataFrame(self.portfolio['trades'])
-            trades_df.to_csv('analysis_results/trades_record.csv', index=False)
-            print(f"交易记录已保存到: analysis_results/trades_record.csv")
-            print(f"共记录 {len(trades_df)} 笔交易")
+        return export_df
 
 def main():
     """
     主函数
     """
+    parser = argparse.ArgumentParser(description='本地ETF动量轮动回测')
+    parser.add_argument('--rebuild', action='store_true', help='忽略检查点，从起始日重新回测')
+    args = parser.parse_args()
+
     # 创建策略实例
     strategy = LocalETFStrategy()
     
-    # 运行回测 - 动态使用当前日期
+    # 运行回测 - 动态使用当前日期；检查点已回测过的交易日不再重复计算
     today = datetime.now().strftime('%Y-%m-%d')
-    strategy.run_backtest(start_date='2024-01-01', end_date=today)
+    strategy.run_backtest(
+        start_date='2024-01-01',
+        end_date=today,
+        checkpoint_path='analysis_results/backtest_checkpoint.npz',
+        rebuild=args.rebuild,
+    )
 
 if __name__ == "__main__":
     main()
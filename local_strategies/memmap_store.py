@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+内存映射的 日期×代码 行情存储
+每个字段（close、open ...）存为一个定长步幅的 float64 二进制文件，按行（日期）优先排列，
+打开时用 np.memmap 映射而不读入：新进程附加数据只读 meta.json 与日期数组，
+启动耗时与常驻内存不随代码数增长，只有实际访问的页才会从磁盘载入。
+某日之前 n 天、连续一段代码的窗口是映射数组的切片视图，不复制数据。
+
+目录结构: <root>/meta.json、<root>/dates.npy（int32 天数）、<root>/<字段>.f64
+用法: python3 memmap_store.py <数据目录> <存储目录> [--fields close]   由数据目录中的行情（见 price_sources）构建
+"""
+
+import argparse
+import json
+import os
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .trading_calendar import epoch_day, epoch_days, to_timestamps
+except ImportError:
+    from trading_calendar import epoch_day, epoch_days, to_timestamps
+
+_META_FILE = 'meta.json'
+_DATES_FILE = 'dates.npy'
+_DTYPE = np.float64
+
+# 构建时每块代码占用的内存上限
+_BUILD_BLOCK_BYTES = 64 * 1024 * 1024
+
+
+def _field_path(root: str, field: str) -> str:
+    return os.path.join(root, f'{field}.f64')
+
+
+class MemmapPriceStore:
+    """
+    只读附加的 日期×代码 存储
+
+    array(field)[i, j] 为 codes[j] 在第 i 个日期的值，当天无数据时为 NaN；字段文件在首次访问时才映射。
+    返回的窗口多为映射数组的视图，调用方不应修改。
+    """
+
+    def __init__(self, root) -> None:
+        self.root = str(root)
+        with open(os.path.join(self.root, _META_FILE), encoding='utf-8') as f:
+            meta = json.load(f)
+        self.codes: List[str] = meta['codes']
+        self.fields: List[str] = meta['fields']
+        self.column_of: Dict[str, int] = {code: j for j, code in enumerate(self.codes)}
+        self.days = np.load(os.path.join(self.root, _DATES_FILE), mmap_mode='r')
+        self.shape = (len(self.days), len(self.codes))
+        self._arrays: Dict[str, np.memmap] = {}
+
+    @classmethod
+    def build(
+        cls,
+        root,
+        codes: Sequence[str],
+        load: Callable[[str], pd.DataFrame],
+        fields: Sequence[str] = ('close',),
+    ) -> 'MemmapPriceStore':
+        """
+        逐个代码调用 load(code)（返回以日期为索引、含所需字段的 DataFrame）写入存储并打开
+
+        日期取各代码日期的并集；按代码分块写入，内存中最多持有一块（约 _BUILD_BLOCK_BYTES）的数据。
+        """
+        root = str(root)
+        os.makedirs(root, exist_ok=True)
+        codes = list(codes)
+        days = np.unique(np.concatenate([epoch_days(load(code).index) for code in codes] or [np.empty(0, np.int32)]))
+        shape = (len(days), len(codes))
+
+        # 按代码分块在内存中拼好 日期×块 的数组再整块写入，映射文件的每一页只写一次
+        block = max(1, _BUILD_BLOCK_BYTES // max(len(days) * np.dtype(_DTYPE).itemsize, 1))
+        outputs = {field: np.memmap(_field_path(root, field), dtype=_DTYPE, mode='w+', shape=shape) for field in fields}
+        for j0 in range(0, len(codes), block):
+            chunk = codes[j0:j0 + block]
+            buffers = {field: np.full((len(days), len(chunk)), np.nan, dtype=_DTYPE) for field in fields}
+            for k, code in enumerate(chunk):
+                df = load(code)
+                rows = np.searchsorted(days, epoch_days(df.index))
+                for field in fields:
+                    buffers[field][rows, k] = df[field].to_numpy(dtype=_DTYPE)
+            for field in fields:
+                outputs[field][:, j0:j0 + len(chunk)] = buffers[field]
+        for out in outputs.values():
+            out.flush()
+        del outputs
+
+        np.save(os.path.join(root, _DATES_FILE), days.astype(np.int32))
+        # meta.json 最后写入，作为存储完整可用的标志
+        with open(os.path.join(root, _META_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'codes': codes, 'fields': list(fields), 'dtype': np.dtype(_DTYPE).str}, f)
+        return cls(root)
+
+    @classmethod
+    def from_frames(
+        cls, root, etf_data: Mapping[str, pd.DataFrame], fields: Sequence[str] = ('close',)
+    ) -> 'MemmapPriceStore':
+        return cls.build(root, list(etf_data), etf_data.__getitem__, fields)
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def __contains__(self, code: str) -> bool:
+        return code in self.column_of
+
+    @property
+    def dates(self) -> pd.DatetimeIndex:
+        return to_timestamps(self.days)
+
+    def array(self, field: str = 'close') -> np.memmap:
+        """
+        字段的 日期×代码 映射数组（只读）
+        """
+        if field not in self._arrays:
+            if field not in self.fields:
+                raise KeyError(f'存储中没有字段 {field}')
+            self._arrays[field] = np.memmap(_field_path(self.root, field), dtype=_DTYPE, mode='r', shape=self.shape)
+        return self._arrays[field]
+
+    def row_before(self, date) -> int:
+        """
+        date 之前（不含当日）的行数
+        """
+        return int(np.searchsorted(self.days, epoch_day(date), side='left'))
+
+    def columns(self, codes: Sequence[str]) -> Union[slice, np.ndarray]:
+        """
+        代码对应的列：在存储中连续排列时返回 slice（取出的是视图），否则返回下标数组
+        """
+        positions = np.fromiter((self.column_of[code] for code in codes), dtype=np.int64, count=len(codes))
+        if len(positions) and np.all(np.diff(positions) == 1):
+            return slice(int(positions[0]), int(positions[-1]) + 1)
+        return positions
+
+    def window_before(self, date, window: int, field: str = 'close', codes: Optional[Sequence[str]] = None) -> np.ndarray:
+        """
+        date 之前最近 window 个日期的 window×N 数组（开头不足时只返回已有行）
+
+        codes 缺省为全部代码；全部或连续一段代码时为零拷贝视图。
+        """
+        end = self.row_before(date)
+        rows = slice(max(end - window, 0), end)
+        if codes is None:
+            return self.array(field)[rows]
+        return self.array(field)[rows, self.columns(codes)]
+
+    def windows_before(
+        self, codes: Sequence[str], date, window: int, field: str = 'close'
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        与 PricePanel.windows_before 相同的返回形式：(N×window 数组, 是否有足够历史)
+
+        窗口按存储的日期行截取，窗口内有缺失（停牌、未上市）的代码视为历史不足。
+        """
+        block = self.window_before(date, window, field, codes)
+        if len(block) < window:
+            return np.full((len(codes), window), np.nan), np.zeros(len(codes), dtype=bool)
+        values = block.T
+        return values, ~np.isnan(values).any(axis=1)
+
+    def series(self, code: str, field: str = 'close') -> pd.Series:
+        """
+        单个代码的完整序列（剔除缺失），供逐只计算的旧接口使用
+        """
+        column = np.asarray(self.array(field)[:, self.column_of[code]])
+        valid = ~np.isnan(column)
+        return pd.Series(column[valid], index=to_timestamps(self.days[valid]), name=field)
+
+
+def main() -> None:
+    try:
+        from .price_sources import PriceSources
+    except ImportError:
+        from price_sources import PriceSources
+
+    parser = argparse.ArgumentParser(description='构建内存映射的 日期×代码 行情存储')
+    parser.add_argument('data_dir')
+    parser.add_argument('store_dir')
+    parser.add_argument('--fields', nargs='+', default=['close'])
+    args = parser.parse_args()
+
+    sources = PriceSources(args.data_dir)
+    codes = [code for code in sources.codes() if sources.source(code, columns=args.fields)]
+    store = MemmapPriceStore.build(args.store_dir, codes, lambda code: sources.load(code, columns=args.fields), args.fields)
+    print(f'{len(store.codes)} 个代码 × {len(store)} 个日期, 字段: {", ".join(store.fields)} -> {store.root}')
+
+
+if __name__ == '__main__':
+    main()
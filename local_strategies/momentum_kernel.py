@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+动量评分向量化内核
+用闭式加权最小二乘公式一次性计算整段历史上每个滚动窗口的回归结果，
+替代逐日 np.polyfit 的写法。前缀和按ETF只构建一次，可同时服务多个窗口长度。
+"""
+
+import math
+from typing import Dict, Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+MOM_FIELDS = (
+    'score',
+    'annualized_returns',
+    'r_squared',
+    'slope',
+    'intercept',
+    'start_price',
+    'end_price',
+)
+
+
+# 需要的前缀和：Σj^p·y (p=0..3) 与 Σj^p·y² (p=0..1)，j 为相对锚点的下标
+_Y_POWERS = 4
+_YY_POWERS = 2
+
+
+def weighted_window_fit(prices: np.ndarray) -> tuple:
+    """
+    单个窗口按 LocalETFStrategy.MOM 的步骤逐一计算，返回 (slope, intercept, r_squared, annualized_returns)
+
+    价格恒定的窗口总平方和为 0，R² 只由 np.polyfit 残差的舍入误差决定（可能是有限值、-inf 或 NaN），
+    闭式公式无法复现，内核对这些窗口改用本函数，结果与 MOM 逐位相同。
+    """
+    y = np.log(prices)
+    n = len(y)
+    x = np.arange(n)
+    weights = np.linspace(1, 2, n)
+    slope, intercept = np.polyfit(x, y, 1, w=weights)
+    annualized_returns = math.pow(math.exp(slope), 250) - 1
+    residuals = y - (slope * x + intercept)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r_squared = 1 - (np.sum(weights * residuals**2) / np.sum(weights * (y - np.mean(y))**2))
+    return slope, intercept, r_squared, annualized_returns
+
+
+def linear_window_fit(prices: np.ndarray) -> tuple:
+    """
+    普通最小二乘版本，按 LocalRankStrategy.score_record 的步骤计算，返回值同 weighted_window_fit
+
+    价格恒定的窗口上 np.polyfit 的斜率与 np.var 都只剩舍入误差，斜率的正负会影响双负判断，
+    内核对这些窗口改用本函数，与逐日实现逐位相同。
+    """
+    y = np.log(prices)
+    x = np.arange(len(y))
+    slope, intercept = np.polyfit(x, y, 1)
+    annualized_returns = math.pow(math.exp(slope), 250) - 1
+    residuals = y - (slope * x + intercept)
+    denominator = (len(y) - 1) * np.var(y, ddof=1)
+    r_squared = 1 - (np.sum(residuals**2) / denominator) if denominator != 0 else 0.0
+    return slope, intercept, r_squared, annualized_returns
+
+
+def kernel_block(window: int) -> int:
+    """
+    窗口长度对应的前缀和块长 B：块首位于压缩序列的 B 的整数倍处
+
+    从 B 的整数倍处截取的子序列上建内核，其后各窗口的结果与在完整序列上逐位相同。
+    """
+    return max(4, 1 << (window - 1).bit_length())
+
+
+class WindowSumKernel:
+    """
+    单只ETF的分块前缀和内核
+
+    对 ln(price) 一次性构建 Σj^p·y、Σj^p·y² 的前缀和，之后任意窗口长度的
+    加权/普通回归都只需 O(天数) 的差分与组合，适合批量扫描 m_days。
+
+    全序列直接累加时 j³·y 的量级随历史长度立方增长，差分后会损失多位有效数字，
+    因此前缀和按块重新锚定：块长 B 取不小于窗口长度的 2 的幂，每块覆盖 [A, A+2B)，
+    下标与对数价格都相对块首 A 计算；同一 B 的各窗口长度共用一组前缀和。
+    """
+
+    def __init__(self, closes: np.ndarray) -> None:
+        self.closes = np.asarray(closes, dtype=np.float64)
+        self.log_prices = np.log(self.closes)
+        self._levels: Dict[int, tuple] = {}
+        # 价格变动次数的前缀和，用于识别窗口内价格恒定（总平方和严格为 0）的情形
+        changes = np.concatenate([[0], np.cumsum(self.closes[1:] != self.closes[:-1])])
+        self._change_count = changes
+
+    def __len__(self) -> int:
+        return len(self.closes)
+
+    def _level(self, block: int) -> tuple:
+        if block in self._levels:
+            return self._levels[block]
+
+        total = len(self.log_prices)
+        n_blocks = max(1, -(-total // block))
+        span = 2 * block
+        padded = np.zeros(n_blocks * block + block)
+        padded[:total] = self.log_prices
+        blocks = sliding_window_view(padded, span)[::block][:n_blocks]
+        anchors = blocks[:, 0].copy()
+        local = blocks - anchors[:, None]
+        j = np.arange(span, dtype=np.float64)
+
+        y_sums = np.zeros((_Y_POWERS, n_blocks, span + 1))
+        yy_sums = np.zeros((_YY_POWERS, n_blocks, span + 1))
+        for p in range(_Y_POWERS):
+            np.cumsum(j ** p * local, axis=1, out=y_sums[p, :, 1:])
+        for p in range(_YY_POWERS):
+            np.cumsum(j ** p * local * local, axis=1, out=yy_sums[p, :, 1:])
+
+        self._levels[block] = (y_sums, yy_sums, anchors)
+        return self._levels[block]
+
+    def window_moments(self, window: int, y_powers: int = _Y_POWERS, yy_powers: int = _YY_POWERS) -> tuple:
+        """
+        返回每个窗口（按起点排列）的位置矩 M_p = Σk^p·y、Q_p = Σk^p·y² 及对应锚点
+
+        k 为窗口内位置 0..window-1，y 为相对锚点的对数价格；只计算前 y_powers / yy_powers 阶。
+        """
+        block = kernel_block(window)
+        y_sums, yy_sums, anchors = self._level(block)
+
+        starts = np.arange(len(self.log_prices) - window + 1)
+        block_idx = starts // block
+        offset = starts - block_idx * block
+        end = offset + window
+        neg_offset_powers = [np.ones(len(starts))]
+        for _ in range(1, max(y_powers, yy_powers)):
+            neg_offset_powers.append(neg_offset_powers[-1] * -offset)
+
+        def shifted(sums, powers):
+            raw = [sums[p, block_idx, end] - sums[p, block_idx, offset] for p in range(powers)]
+            # Σ(j - o)^p·y = Σ_q C(p,q)·(-o)^(p-q)·Σj^q·y
+            moments = [raw[0]]
+            for p in range(1, powers):
+                moments.append(sum(math.comb(p, q) * neg_offset_powers[p - q] * raw[q] for q in range(p)) + raw[p])
+            return moments
+
+        return shifted(y_sums, y_powers), shifted(yy_sums, yy_powers), anchors[block_idx]
+
+    def constant_windows(self, window: int) -> np.ndarray:
+        starts = np.arange(len(self.closes) - window + 1)
+        return self._change_count[starts + window - 1] == self._change_count[starts]
+
+    def table(self, window: int, weighted: bool) -> Dict[str, np.ndarray]:
+        """
+        对每个滚动窗口做对数价格回归
+
+        weighted=True 为 MOM 口径：线性权重 w=1→2，np.polyfit 的 w 作用于未平方残差，
+        回归实际以 w² 加权；R² 中残差与对算术均值的离差以 w 加权，价格恒定的窗口按 weighted_window_fit 逐个计算。
+        weighted=False 为普通最小二乘，价格恒定的窗口按 linear_window_fit 逐个计算。
+        返回数组长度为 len(closes) + 1，下标 pos 对应窗口 closes[pos - window:pos]，
+        pos < window 时回归指标为 NaN；首尾价格在数据不足时取已有数据的首尾。
+        """
+        closes = self.closes
+        total = len(closes)
+        table = {name: np.full(total + 1, np.nan) for name in MOM_FIELDS}
+
+        positions = np.arange(total + 1)
+        has_data = positions > 0
+        start_idx = np.maximum(positions - window, 0)
+        table['start_price'][has_data] = closes[start_idx[has_data]]
+        table['end_price'][has_data] = closes[positions[has_data] - 1]
+
+        if total < window:
+            return table
+
+        # 权重写成 k 的多项式系数（低次在前）
+        if weighted:
+            c = 1.0 / (window - 1)
+            fit_poly, r2_poly, window_fit = (1.0, 2 * c, c * c), (1.0, c), weighted_window_fit
+        else:
+            fit_poly, r2_poly, window_fit = (1.0,), (1.0,), linear_window_fit
+
+        m, q, anchors = self.window_moments(window, len(fit_poly) + 1, len(r2_poly))
+
+        k = np.arange(window, dtype=np.float64)
+        k_powers = [np.sum(k ** p) for p in range(len(fit_poly) + 2)]
+
+        def const(poly, power):
+            return sum(a * k_powers[i + power] for i, a in enumerate(poly))
+
+        def with_y(poly, power):
+            return sum(a * m[i + power] for i, a in enumerate(poly))
+
+        # 回归所需的加权和：Σw、Σwx、Σwx² 为常数，Σwy、Σwxy 随窗口变化
+        sw, swx, swxx = const(fit_poly, 0), const(fit_poly, 1), const(fit_poly, 2)
+        swy, swxy = with_y(fit_poly, 0), with_y(fit_poly, 1)
+        slope = (sw * swxy - swx * swy) / (sw * swxx - swx * swx)
+        intercept = (swy - slope * swx) / sw
+
+        # Σw·(y - a - b·x)² 按平方展开
+        rw, rwx, rwxx = const(r2_poly, 0), const(r2_poly, 1), const(r2_poly, 2)
+        rwy, rwxy = with_y(r2_poly, 0), with_y(r2_poly, 1)
+        rwyy = sum(a * q[i] for i, a in enumerate(r2_poly))
+        y_mean = m[0] / window
+        ss_tot = rwyy - 2 * y_mean * rwy + y_mean * y_mean * rw
+        ss_res = (
+            rwyy
+            - 2 * intercept * rwy
+            - 2 * slope * rwxy
+            + intercept * intercept * rw
+            + 2 * intercept * slope * rwx
+            + slope * slope * rwxx
+        )
+        constant = self.constant_windows(window)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r_squared = 1 - ss_res / ss_tot
+
+        annualized_returns = np.power(np.exp(slope), 250) - 1
+        intercept = intercept + anchors
+
+        # 价格恒定的窗口（通常很少）按逐日实现的步骤逐个重算
+        for start in np.flatnonzero(constant):
+            fit = window_fit(closes[start:start + window])
+            slope[start], intercept[start], r_squared[start], annualized_returns[start] = fit
+
+        table['slope'][window:] = slope
+        table['intercept'][window:] = intercept
+        table['r_squared'][window:] = r_squared
+        table['annualized_returns'][window:] = annualized_returns
+        with np.errstate(invalid='ignore'):
+            table['score'][window:] = annualized_returns * r_squared
+        return table
+
+
+def weighted_mom_table(
+    closes: np.ndarray, m_days: int, kernel: Optional[WindowSumKernel] = None
+) -> Dict[str, np.ndarray]:
+    """
+    计算 LocalETFStrategy.MOM 在每个位置上的全部输出
+
+    返回的每个数组长度为 len(closes) + 1，下标 pos 表示“窗口之前共有 pos 条数据”，
+    即窗口为 closes[pos - m_days:pos]（不含第 pos 条），与 MOM 中 df.index < end_date 对应。
+    pos < m_days 时 score 为 -999，回归指标为 NaN，与 MOM 的“历史数据不足”分支一致。
+    """
+    kernel = kernel or WindowSumKernel(closes)
+    table = kernel.table(m_days, weighted=True)
+    table['score'][:m_days] = -999.0
+    return table
+
+
+def linear_trend_table(
+    closes: np.ndarray, window: int, kernel: Optional[WindowSumKernel] = None
+) -> Dict[str, np.ndarray]:
+    """
+    普通最小二乘版本，对应 LocalRankStrategy 中的 np.polyfit(x, y, 1)
+
+    R² = 1 - 残差平方和 / ((n-1)·var(y))，价格恒定的窗口与逐日实现一样取舍入误差下的结果；score 为年化收益×R²，
+    历史不足的位置全部为 NaN。
+    """
+    kernel = kernel or WindowSumKernel(closes)
+    return kernel.table(window, weighted=False)
+
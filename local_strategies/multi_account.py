@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多账户共享评分回测
+各账户的ETF池、持仓数量、初始资金不同，但同一只ETF在同一天的MOM评分与账户无关。
+这里只加载并打分一次所有账户ETF池的并集，各账户按自己的列从共享评分矩阵中切片排名，
+交易记录与组合历史按账户分别保存，逐日历史与单账户回测一样写入 HistoryRecorder。
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .book import Book
+    from .history_recorder import HistoryRecorder, history_frame
+    from .local_strategy import LocalETFStrategy
+    from .trading_calendar import epoch_day
+    from .vectorized import py_round
+except ImportError:
+    from book import Book
+    from history_recorder import HistoryRecorder, history_frame
+    from local_strategy import LocalETFStrategy
+    from trading_calendar import epoch_day
+    from vectorized import py_round
+
+
+@dataclass
+class AccountConfig:
+    name: str
+    etf_codes: Sequence[str]
+    target_num: int = 1
+    initial_capital: float = 100000
+
+
+class AccountBook(Book):
+    """
+    单个账户的组合账本，portfolio 字典的结构与 LocalETFStrategy.portfolio 相同
+
+    持有 target_num 只ETF：卖出不在目标中的持仓，现金在新买入的目标间平均分配；
+    target_num=1 时与 LocalETFStrategy.trade 的换仓逻辑完全一致。
+    回测中状态保存在账本上，close_portfolio() 把现金、持仓与交易写回 portfolio。
+    """
+
+    __slots__ = ('config', 'names', 'portfolio')
+
+    def __init__(self, config: AccountConfig, etf_config: Dict[str, dict]) -> None:
+        super().__init__(config.etf_codes, config.initial_capital)
+        self.config = config
+        self.names = [etf_config[code]['name'] for code in self.codes]
+        self.portfolio = {
+            'cash': config.initial_capital,
+            'positions': {code: {'shares': 0, 'value': 0} for code in self.codes},
+            'total_value': config.initial_capital,
+            'history': [],
+            'trades': [],
+        }
+
+    def holdings(self) -> List[str]:
+        return [self.codes[symbol] for symbol in self.held]
+
+    def rebalance(self, date: pd.Timestamp, targets: List[str], price_of) -> None:
+        held = [self.codes[symbol] for symbol in self.held]
+        if all(code in held for code in targets) and all(code in targets for code in held):
+            return
+
+        day = epoch_day(date)
+        for symbol in list(self.held):
+            if self.codes[symbol] in targets:
+                continue
+            price = price_of(self.codes[symbol], date)
+            if price:
+                self.sell(symbol, day, price)
+
+        orders = []
+        for etf_code in targets:
+            symbol = self.symbols[etf_code]
+            if self.positions[symbol].shares == 0:
+                price = price_of(etf_code, date)
+                if price:
+                    orders.append((symbol, price))
+        if orders and self.cash > 0:
+            self.buy_equally(orders, day)
+
+    def mark_to_market(self, date: pd.Timestamp, price_of) -> float:
+        total_value = self.cash
+        for symbol in self.held:
+            price = price_of(self.codes[symbol], date)
+            if price:
+                position = self.positions[symbol]
+                position.value = position.shares * price
+                total_value += position.value
+        self.total_value = total_value
+        return total_value
+
+    def close_portfolio(self) -> None:
+        self.close(self.portfolio, self.names)
+
+
+class MultiAccountRunner:
+    """
+    多账户回测：ETF数据与评分矩阵只构建一次，所有账户共用
+
+    etf_config 提供ETF名称与文件名，未列出的代码默认读取 {代码}_data.csv。
+    """
+
+    def __init__(
+        self,
+        accounts: Sequence[AccountConfig],
+        data_dir: str = '/home/suwei/回测策略/data',
+        etf_config: Optional[Dict[str, dict]] = None,
+    ) -> None:
+        names = [account.name for account in accounts]
+        if len(set(names)) != len(names):
+            raise ValueError(f"账户名称重复: {names}")
+
+        self.accounts = list(accounts)
+        etf_config = etf_config or {}
+        union_config = {}
+        for account in self.accounts:
+            for code in account.etf_codes:
+                union_config[code] = etf_config.get(code, {'name': code, 'file': f'{code}_data.csv'})
+
+        # 并集池只加载、打分一次
+        self.strategy = LocalETFStrategy(data_dir=data_dir, score_mode='matrix', etf_config=union_config)
+        self.etf_config = self.strategy.etf_config
+        self.books: Dict[str, AccountBook] = {}
+
+    def account_trading_dates(self, account: AccountConfig) -> List[pd.Timestamp]:
+        """
+        账户自身ETF池的共同交易日（跳过前 m_days 天），与单独实例化该池的策略一致
+        """
+        codes = [code for code in account.etf_codes if code in self.strategy.etf_data]
+        common = self.strategy.price_panel.common_dates(codes)
+        return common[self.strategy.m_days:] if len(common) > self.strategy.m_days else []
+
+    def _account_dates(self, account: AccountConfig, start_date=None, end_date=None) -> List[pd.Timestamp]:
+        dates = self.account_trading_dates(account)
+        if start_date:
+            start_ts = pd.to_datetime(start_date)
+            dates = [d for d in dates if d >= start_ts]
+        if end_date:
+            end_ts = pd.to_datetime(end_date)
+            dates = [d for d in dates if d <= end_ts]
+        return dates
+
+    def _columns(self, account: AccountConfig) -> np.ndarray:
+        positions = {code: i for i, code in enumerate(self.strategy.factor_engine.codes)}
+        return np.array([positions[code] for code in account.etf_codes if code in positions], dtype=np.int64)
+
+    def score_rows(self, dates) -> np.ndarray:
+        """
+        各日期所有ETF的评分：都在共享评分矩阵中时按行取出，否则单独计算这些日期，共享矩阵不变
+        """
+        rows = [self.strategy._score_rows.get(date) for date in pd.DatetimeIndex(pd.to_datetime(dates))]
+        if all(row is not None for row in rows):
+            return self.strategy.score_matrix['score'][np.array(rows, dtype=np.int64)]
+        return self.strategy.momentum_scores(dates)
+
+    def rank_matrix(self, account: AccountConfig, dates) -> np.ndarray:
+        """
+        账户在各日期的完整排名（列下标指向 account.etf_codes 中已加载的ETF），同分按池内顺序
+        """
+        scores = self.score_rows(dates)[:, self._columns(account)]
+        return np.argsort(-scores, axis=1, kind='stable')
+
+    def targets(self, date) -> Dict[str, List[str]]:
+        """
+        指定日期各账户的目标持仓（按得分从高到低的前 target_num 只）
+        """
+        date = pd.to_datetime(date)
+        result = {}
+        for account in self.accounts:
+            codes = [code for code in account.etf_codes if code in self.strategy.etf_data]
+            order = self.rank_matrix(account, [date])[0]
+            result[account.name] = [codes[i] for i in order[:account.target_num]]
+        return result
+
+    def run_backtest(self, start_date=None, end_date=None) -> Dict[str, AccountBook]:
+        """
+        对所有账户回测：评分矩阵按所有账户交易日的并集一次性构建
+        """
+        account_dates = {account.name: self._account_dates(account, start_date, end_date) for account in self.accounts}
+        all_dates = sorted(set().union(*account_dates.values()))
+        if not all_dates:
+            print("错误：没有足够的交易数据")
+            return {}
+
+        print(f"共享评分矩阵: {len(all_dates)} 个交易日 × {len(self.strategy.etf_data)} 只ETF, {len(self.accounts)} 个账户")
+        self.strategy.build_score_matrix(all_dates)
+        score = self.strategy.score_matrix['score']
+        price_of = self.strategy.get_current_price
+
+        self.books = {}
+        for account in self.accounts:
+            book = AccountBook(account, self.etf_config)
+            self.books[account.name] = book
+            dates = account_dates[account.name]
+            if not dates:
+                continue
+
+            codes = [code for code in account.etf_codes if code in self.strategy.etf_data]
+            top = self.rank_matrix(account, dates)[:, :account.target_num]
+            rows = np.array([self.strategy._score_rows[date] for date in dates], dtype=np.int64)
+            # 评分明细整块按 6 位舍入（与内置 round 逐位相同）
+            rounded = py_round(score[np.ix_(rows, self._columns(account))], 6)
+
+            labels = {code: f"{self.etf_config[code]['name']}({code})" for code in codes}
+            names = [self.etf_config[code]['name'] for code in codes]
+            history = HistoryRecorder(dates, codes, names, list(labels.values()), [('评分', np.float64)])
+            book.portfolio['history'] = history
+            for i, (date, order) in enumerate(zip(dates, top)):
+                book.rebalance(date, [codes[k] for k in order], price_of)
+                total_value = book.mark_to_market(date, price_of)
+                held = history.position_index('、'.join(labels[code] for code in book.holdings()) or '现金')
+                history.record(i, total_value, book.cash, held, [rounded[i]])
+            book.close_portfolio()
+
+        self.print_results()
+        return self.books
+
+    def print_results(self) -> None:
+        print("\n" + "=" * 60)
+        print("多账户回测结果")
+        print("=" * 60)
+        for name, book in self.books.items():
+            history = book.portfolio['history']
+            if not len(history):
+                print(f"{name}: 没有回测数据")
+                continue
+            values = history_frame(history)['total_value']
+            total_return = (values.iloc[-1] / values.iloc[0] - 1) * 100
+            max_drawdown = ((values / values.cummax()) - 1).min() * 100
+            print(
+                f"{name}: 最终资金 {values.iloc[-1]:,.0f}元, 总收益率 {total_return:.2f}%, "
+                f"最大回撤 {max_drawdown:.2f}%, 交易 {len(book.portfolio['trades'])} 笔"
+            )
+
+    def export_results(self, output_dir: str = 'analysis_results/accounts') -> None:
+        """
+        每个账户导出 {账户名}_backtest_results.csv 与 {账户名}_trades_record.csv
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        for name, book in self.books.items():
+            if len(book.portfolio['history']):
+                history_df = history_frame(book.portfolio['history'])
+                history_df['date'] = history_df['date'].dt.strftime('%Y-%m-%d')
+                history_df['total_value'] = history_df['total_value'].round(2)
+                history_df['cash'] = history_df['cash'].round(2)
+                history_df.rename(
+                    columns={'date': '日期', 'total_value': '总市值', 'cash': '现金', 'current_position': '当前持仓'}
+                ).to_csv(os.path.join(output_dir, f'{name}_backtest_results.csv'), index=False, encoding='utf-8-sig')
+            if book.portfolio['trades']:
+                pd.DataFrame(book.portfolio['trades']).to_csv(
+                    os.path.join(output_dir, f'{name}_trades_record.csv'), index=False
+                )
+        print(f"各账户结果已保存到: {output_dir}")
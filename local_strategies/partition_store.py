@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按代码、年份分区的只追加行情存储
+<root>/<代码>/<年份>.csv 的格式与 {代码}_data.csv 相同（date,net_value,code，按日期升序），
+<root>/manifest.json 记录每个代码已提交的最新日期与各年份分区的行数。
+
+每次写入只把晚于清单最新日期的新行追加到对应年份文件末尾，全部写完后替换清单完成提交：
+清单是唯一的提交点，中途失败留下的未提交行在读取时按清单日期过滤，下次写入前截掉。
+读取时按需拼接各年份分区（经共用加载器缓存，只有改动过的年份文件会重新解析），
+每日写入的开销只与新增行数有关，与历史长度无关。
+
+用法: python3 partition_store.py <CSV目录> [--store <存储目录>]   把已有 {代码}_data.csv 导入存储
+"""
+
+import argparse
+import json
+import os
+import re
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple
+
+import pandas as pd
+
+try:
+    from .data_loader import load_price_data
+except ImportError:
+    from data_loader import load_price_data
+
+# 与数据目录中 CSV 并列存放：data/partitions/<code>/<year>.csv
+PARTITION_DIRNAME = 'partitions'
+
+_MANIFEST_FILE = 'manifest.json'
+_HEADER = 'date,net_value,code\n'
+
+_PRICE_FILE = re.compile(r'^(\d{6})_data\.csv$')
+
+
+def _replace_file(path: str, text: str) -> None:
+    # 先写临时文件并落盘，再原子替换
+    staging = f'{path}.tmp'
+    with open(staging, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(staging, path)
+
+
+class PartitionedPriceStore:
+    """
+    只追加的分区行情存储
+
+    frame(code) 返回以 date 为索引、只含 close 列的 DataFrame（与 load_price_data 相同），只含已提交的行。
+    只追加：已提交日期之前的数据即使数据源修订也不会改写。
+    """
+
+    def __init__(self, root) -> None:
+        self.root = str(root)
+        self.manifest: Dict[str, dict] = self._read_manifest()
+
+    def _read_manifest(self) -> Dict[str, dict]:
+        path = os.path.join(self.root, _MANIFEST_FILE)
+        if not os.path.isfile(path):
+            return {}
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)['codes']
+
+    def __contains__(self, code: str) -> bool:
+        return code in self.manifest
+
+    def codes(self) -> List[str]:
+        return sorted(self.manifest)
+
+    def max_date(self, code: str) -> Optional[pd.Timestamp]:
+        entry = self.manifest.get(code)
+        return pd.Timestamp(entry['max_date']) if entry else None
+
+    def partition_path(self, code: str, year) -> str:
+        return os.path.join(self.root, code, f'{year}.csv')
+
+    def _committed_text(self, code: str, year: str) -> Tuple[str, int]:
+        """
+        分区文件中已提交的部分（表头加清单记录的行数），及文件中实际的数据行数
+        """
+        path = self.partition_path(code, year)
+        if not os.path.isfile(path):
+            return _HEADER, 0
+        with open(path, encoding='utf-8') as f:
+            lines = f.readlines()
+        committed = self.manifest.get(code, {}).get('rows', {}).get(year, 0)
+        return ''.join(lines[:committed + 1]), len(lines) - 1
+
+    def append(self, frames: Mapping[str, pd.DataFrame]) -> Dict[str, int]:
+        """
+        追加多个代码的新行并一次提交，frames 为 {代码: 以日期为索引、含 close 列的 DataFrame}
+
+        只写入晚于该代码已提交最新日期的行，同一日期重复时保留最后一行；返回 {代码: 新增行数}。
+        """
+        manifest = {code: dict(entry, rows=dict(entry['rows'])) for code, entry in self.manifest.items()}
+        added: Dict[str, int] = {}
+        for code, df in frames.items():
+            df = df[~df.index.duplicated(keep='last')].sort_index()
+            df = df[df['close'].notna()]
+            latest = self.max_date(code)
+            if latest is not None:
+                df = df[df.index > latest]
+            added[code] = len(df)
+            if df.empty:
+                continue
+
+            os.makedirs(os.path.join(self.root, code), exist_ok=True)
+            entry = manifest.setdefault(code, {'max_date': None, 'rows': {}})
+            for year, rows in df.groupby(df.index.year, sort=True):
+                year = str(year)
+                path = self.partition_path(code, year)
+                text = pd.DataFrame({
+                    'date': rows.index.strftime('%Y-%m-%d'),
+                    'net_value': rows['close'].to_numpy(),
+                    'code': code,
+                }).to_csv(index=False, header=False, lineterminator='\n')
+
+                committed, on_disk = self._committed_text(code, year)
+                if not os.path.isfile(path) or on_disk != entry['rows'].get(year, 0):
+                    # 新分区，或上次写入未提交就中断：写为已提交部分加新行
+                    _replace_file(path, committed + text)
+                else:
+                    with open(path, 'a', encoding='utf-8') as f:
+                        f.write(text)
+                        f.flush()
+                        os.fsync(f.fileno())
+                entry['rows'][year] = entry['rows'].get(year, 0) + len(rows)
+            entry['max_date'] = df.index[-1].strftime('%Y-%m-%d')
+
+        if any(added.values()):
+            os.makedirs(self.root, exist_ok=True)
+            _replace_file(
+                os.path.join(self.root, _MANIFEST_FILE),
+                json.dumps({'codes': manifest}, ensure_ascii=False, indent=1, sort_keys=True),
+            )
+            self.manifest = manifest
+        return added
+
+    def frame(self, code: str) -> pd.DataFrame:
+        """
+        按年份拼接已提交的分区
+        """
+        entry = self.manifest[code]
+        parts = [load_price_data(self.partition_path(code, year)) for year in sorted(entry['rows'])]
+        df = pd.concat(parts) if len(parts) > 1 else parts[0]
+        return df[df.index <= pd.Timestamp(entry['max_date'])]
+
+    def iter_frames(self, codes: Optional[List[str]] = None) -> Iterator[Tuple[str, pd.DataFrame]]:
+        """
+        逐个代码惰性读取，用于遍历全部数据而不一次性读入
+        """
+        for code in (self.codes() if codes is None else codes):
+            yield code, self.frame(code)
+
+    def combined(self, codes: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        与 all_funds_data.csv 相同格式的汇总表（date, net_value, code，按代码、日期排序），调用时才拼接
+        """
+        return pd.concat(
+            [
+                pd.DataFrame({'date': df.index.strftime('%Y-%m-%d'), 'net_value': df['close'].to_numpy(), 'code': code})
+                for code, df in self.iter_frames(codes)
+            ],
+            ignore_index=True,
+        )
+
+    def export_csv(self, code: str, path) -> None:
+        """
+        导出为旧格式的 {代码}_data.csv（日期降序），供仍直接读取 CSV 的脚本使用
+        """
+        df = self.frame(code).iloc[::-1]
+        pd.DataFrame({'date': df.index.strftime('%Y-%m-%d'), 'net_value': df['close'].to_numpy(), 'code': code}).to_csv(
+            path, index=False, encoding='utf-8-sig'
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='把 CSV 行情导入按年分区的存储')
+    parser.add_argument('data_dir')
+    parser.add_argument('--store', default=None, help=f'存储目录，缺省为 <CSV目录>/{PARTITION_DIRNAME}')
+    args = parser.parse_args()
+
+    store = PartitionedPriceStore(args.store or os.path.join(args.data_dir, PARTITION_DIRNAME))
+    frames = {
+        match.group(1): load_price_data(os.path.join(args.data_dir, name))
+        for name in sorted(os.listdir(args.data_dir))
+        for match in [_PRICE_FILE.match(name)] if match
+    }
+    for code, count in store.append(frames).items():
+        print(f'{code}: 新增 {count} 条，最新日期 {store.max_date(code).date() if code in store else "-"}')
+
+
+if __name__ == '__main__':
+    main()
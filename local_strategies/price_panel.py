@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+对齐的收盘价面板
+load_data 时把各ETF的收盘价一次性排到统一交易日历（各ETF日期的并集）上，
+得到连续的 日期×ETF float64 数组、整数日期索引与有效性掩码。
+每只ETF的有效价格另按时间压缩为连续数组，并记录每个日期之前已有的条数，
+“某日之前最近 n 个收盘价”由此成为按整数位置的 O(1) 切片。
+dtype=np.float32 时收盘价按单精度存放（紧凑模式），取出的窗口仍为 float64。
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .asof_index import date_keys
+except ImportError:
+    from asof_index import date_keys
+
+
+class PricePanel:
+    """
+    日期×ETF 收盘价面板
+
+    closes[i, j] 为第 j 只ETF在 dates[i] 的收盘价，当天无数据时为 NaN（valid[i, j] 为 False）。
+    窗口切片返回压缩数组的视图（float32 存放时为转换后的副本），调用方不应修改。
+    """
+
+    def __init__(self, closes: pd.DataFrame, dtype=np.float64) -> None:
+        closes = closes.sort_index()
+        self.dates = pd.DatetimeIndex(closes.index)
+        self.codes: List[str] = list(closes.columns)
+        self.closes = np.ascontiguousarray(closes.to_numpy(dtype=dtype))
+        self.valid = ~np.isnan(self.closes)
+
+        # 整数日期索引：日期 -> 行号；不在日历上的日期按纳秒时间戳二分定位
+        self.row_of: Dict[pd.Timestamp, int] = {date: i for i, date in enumerate(self.dates)}
+        self.column_of: Dict[str, int] = {code: j for j, code in enumerate(self.codes)}
+        self._date_values = date_keys(self.dates)
+
+        # 每只ETF按时间压缩后的有效收盘价，及第 i 行之前（不含）的有效条数
+        self.series: List[np.ndarray] = [
+            np.ascontiguousarray(self.closes[self.valid[:, j], j]) for j in range(len(self.codes))
+        ]
+        self.count_before = np.vstack([
+            np.zeros((1, len(self.codes)), dtype=np.int64),
+            np.cumsum(self.valid, axis=0, dtype=np.int64),
+        ])
+
+    @classmethod
+    def from_frames(cls, etf_data: Dict[str, pd.DataFrame], dtype=np.float64) -> 'PricePanel':
+        return cls(pd.DataFrame({code: df['close'] for code, df in etf_data.items()}), dtype=dtype)
+
+    @property
+    def nbytes(self) -> int:
+        return int(
+            self.closes.nbytes + self.valid.nbytes + self.count_before.nbytes
+            + sum(values.nbytes for values in self.series)
+        )
+
+    def frame(self) -> pd.DataFrame:
+        """
+        以 DataFrame 形式返回面板（与 closes 共用内存）
+        """
+        return pd.DataFrame(self.closes, index=self.dates, columns=self.codes, copy=False)
+
+    def row_before(self, date) -> int:
+        """
+        date 之前（不含当日）的面板行数，即 df.index < date 的口径
+        """
+        row = self.row_of.get(date)
+        if row is not None:
+            return row
+        return int(np.searchsorted(self._date_values, pd.Timestamp(date).value, side='left'))
+
+    def window_before(self, etf_code: str, date, window: int) -> np.ndarray:
+        """
+        date 之前最近 window 个收盘价（不足时返回全部已有数据），等价于 df.loc[df.index < date, 'close'].tail(window)
+        """
+        j = self.column_of[etf_code]
+        end = self.count_before[self.row_before(date), j]
+        return self.series[j][max(end - window, 0):end].astype(np.float64, copy=False)
+
+    def windows_before(self, codes: Sequence[str], date, window: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        多只ETF在 date 之前最近 window 个收盘价
+
+        返回 (N×window 数组, 是否有足够历史)；历史不足的行为 NaN。
+        """
+        row = self.row_before(date)
+        out = np.full((len(codes), window), np.nan)
+        ready = np.zeros(len(codes), dtype=bool)
+        for i, code in enumerate(codes):
+            j = self.column_of[code]
+            end = self.count_before[row, j]
+            if end >= window:
+                out[i] = self.series[j][end - window:end]
+                ready[i] = True
+        return out, ready
+
+    def common_dates(self, codes: Optional[Sequence[str]] = None) -> List[pd.Timestamp]:
+        """
+        给定ETF（缺省为全部）都有数据的日期，按时间升序
+        """
+        columns = [self.column_of[code] for code in (self.codes if codes is None else codes)]
+        if not columns:
+            return []
+        return list(self.dates[self.valid[:, columns].all(axis=1)])
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据目录下的行情来源
+只读收盘价时同一个代码按优先级取自：按年分区存储（data/partitions）→ 列式存储（data/columns）→ {代码}_data.csv；
+分区存储是抓取脚本逐日追加的完整历史；列式存储（只读所需列）提供收盘价以外的列，收盘价只在没有分区数据时取自它。
+策略、交易日历与分析脚本经由这里读取，数据目录从 CSV 迁移到存储后无需各自改动。
+"""
+
+import os
+import re
+from typing import List, Mapping, Optional, Sequence
+
+import pandas as pd
+
+try:
+    from .column_store import STORE_DIRNAME, ColumnStore
+    from .data_loader import load_price_data, prefetch_price_data
+    from .partition_store import PARTITION_DIRNAME, PartitionedPriceStore
+except ImportError:
+    from column_store import STORE_DIRNAME, ColumnStore
+    from data_loader import load_price_data, prefetch_price_data
+    from partition_store import PARTITION_DIRNAME, PartitionedPriceStore
+
+# 场内ETF行情文件，例如 159509_data.csv；汇总文件 all_funds_data.csv 不参与
+_PRICE_FILE = re.compile(r'^(\d{6})_data\.csv$')
+
+
+class PriceSources:
+    """
+    一个数据目录的全部行情来源
+
+    load 返回以 date 为索引的 DataFrame，缺省只含 close 列（与 load_price_data 相同）；
+    需要开盘价等其他列时只有列式存储可以提供。
+    """
+
+    def __init__(self, data_dir) -> None:
+        self.data_dir = str(data_dir)
+        self.columns = ColumnStore(os.path.join(self.data_dir, STORE_DIRNAME))
+        self.partitions = PartitionedPriceStore(os.path.join(self.data_dir, PARTITION_DIRNAME))
+
+    def csv_path(self, code: str, file_name=None) -> str:
+        return os.path.join(self.data_dir, str(file_name or f'{code}_data.csv'))
+
+    def source(self, code: str, file_name=None, columns: Sequence[str] = ('close',)) -> Optional[str]:
+        """
+        代码的数据来源，收盘价依次为 'partitions'、'columns'、'csv'，其他列只取 'columns'；都没有时为 None
+        """
+        if tuple(columns) != ('close',):
+            return 'columns' if self.columns.has(code, columns) else None
+        if code in self.partitions:
+            return 'partitions'
+        if self.columns.has(code, columns):
+            return 'columns'
+        if os.path.isfile(self.csv_path(code, file_name)):
+            return 'csv'
+        return None
+
+    def codes(self) -> List[str]:
+        """
+        目录中有数据的全部代码
+        """
+        names = os.listdir(self.data_dir) if os.path.isdir(self.data_dir) else []
+        from_csv = {match.group(1) for match in map(_PRICE_FILE.match, names) if match}
+        return sorted(from_csv | set(self.partitions.codes()) | set(self.columns.codes()))
+
+    def prefetch(self, files: Mapping[str, Optional[str]]) -> int:
+        """
+        预先解析要从 CSV 读取的文件，files 为 {代码: 文件名（可为 None）}
+        """
+        return prefetch_price_data(
+            self.csv_path(code, file_name) for code, file_name in files.items()
+            if self.source(code, file_name) == 'csv'
+        )
+
+    def load(self, code: str, file_name=None, columns: Sequence[str] = ('close',)) -> pd.DataFrame:
+        source = self.source(code, file_name, columns)
+        if source == 'columns':
+            return self.columns.read(code, list(columns))
+        if source == 'partitions':
+            return self.partitions.frame(code)
+        if tuple(columns) != ('close',):
+            raise KeyError(f'{code} 没有列式存储，无法读取 {", ".join(columns)}')
+        # CSV 缺失时由加载器抛出 FileNotFoundError
+        return load_price_data(self.csv_path(code, file_name))
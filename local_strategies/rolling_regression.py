@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量滑动窗口回归
+每日推入一个收盘价即可在常数时间内得到与 np.polyfit 一致的斜率、R² 与评分，
+状态可序列化为 JSON，便于每日早盘打分时跨进程恢复。
+"""
+
+import json
+import math
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+# 需要维护的矩：M_p = Σ k^p·y (p=0..3)，Q_p = Σ k^p·y² (p=0..1)，k 为窗口内位置
+_Y_ORDERS = 4
+_Y2_ORDERS = 2
+
+
+class _CompensatedSum:
+    """Neumaier 补偿求和，避免长期加减累积舍入误差"""
+
+    __slots__ = ('total', 'comp')
+
+    def __init__(self, total: float = 0.0, comp: float = 0.0) -> None:
+        self.total = total
+        self.comp = comp
+
+    def add(self, value: float) -> None:
+        t = self.total + value
+        if abs(self.total) >= abs(value):
+            self.comp += (self.total - t) + value
+        else:
+            self.comp += (value - t) + self.total
+        self.total = t
+
+    @property
+    def value(self) -> float:
+        return self.total + self.comp
+
+
+def _shift_moments(moments: List[_CompensatedSum], dropped: float, added: float, last_k: int) -> None:
+    """
+    窗口滑动一格：移除 k=0 的旧值，其余位置 k→k-1，新值放在 k=last_k
+
+    Σ(k-1)^p·y = Σ_q C(p,q)·(-1)^(p-q)·Σk^q·y，只依赖当前各阶矩，因此为 O(1)。
+    """
+    current = [(m.total, m.comp) for m in moments]
+
+    for p in range(len(moments)):
+        acc = _CompensatedSum()
+        for q in range(p + 1):
+            coeff = math.comb(p, q) * (-1) ** (p - q)
+            acc.add(coeff * current[q][0])
+            acc.add(coeff * current[q][1])
+        # 旧值位于 k=0，只对 0 阶矩有贡献
+        acc.add(-(-1) ** p * dropped)
+        acc.add(last_k ** p * added)
+        moments[p] = acc
+
+
+@dataclass
+class WindowSums:
+    """
+    当前窗口的回归中间量（见 RollingRegression.window_sums）
+
+    y_moments / y2_moments 为 Σk^p·y 与 Σk^p·y²（y 为减去 anchor 的对数价格）；
+    fit_poly / r2_poly 为回归与 R² 的权重关于 k 的多项式系数，fit_const / r2_const 为对应的 (Σw, Σwx, Σwx²)。
+    """
+
+    anchor: float
+    y_moments: List[float]
+    y2_moments: List[float]
+    fit_poly: Tuple[float, ...]
+    r2_poly: Tuple[float, ...]
+    fit_const: Tuple[float, float, float]
+    r2_const: Tuple[float, float, float]
+
+
+class RollingRegression:
+    """
+    单只ETF、单个窗口长度的滑动对数价格回归
+
+    weighted=True 对应 LocalETFStrategy.MOM（线性权重 1→2，polyfit 的 w 等价于 w² 加权），
+    weighted=False 对应 LocalRankStrategy 的普通最小二乘。
+    线性权重随窗口位置变化，因此不直接保存 Σwy 等，而是保存各阶位置矩，
+    取结果时再组合成 Σw、Σwx、Σwy、Σwxy、Σwy²。
+    """
+
+    def __init__(self, window: int, weighted: bool = True, rebase_every: Optional[int] = None) -> None:
+        if window < 2:
+            raise ValueError('window 至少为 2')
+        self.window = window
+        self.weighted = weighted
+        # 每推入 rebase_every 个数据后用 math.fsum 从缓冲区精确重算一次，彻底消除漂移
+        self.rebase_every = rebase_every or window
+        self.closes: deque = deque(maxlen=window)
+        self._since_rebase = 0
+        # 矩以 y - anchor 计算，数值更小、相消误差更低；anchor 只在重算时更新
+        self._anchor: Optional[float] = None
+        self._y_moments = [_CompensatedSum() for _ in range(_Y_ORDERS)]
+        self._y2_moments = [_CompensatedSum() for _ in range(_Y2_ORDERS)]
+
+        # 权重写成 k 的多项式系数（低次在前）：w = 1 + k/(n-1)，回归用 w²
+        if weighted:
+            c = 1.0 / (window - 1)
+            self._fit_poly = (1.0, 2 * c, c * c)
+            self._r2_poly = (1.0, c)
+        else:
+            self._fit_poly = (1.0,)
+            self._r2_poly = (1.0,)
+        # Σk^p (k=0..n-1)，窗口长度固定后即为常数
+        max_power = len(self._fit_poly) + 1
+        self._k_powers = [math.fsum(k ** p for k in range(window)) for p in range(max_power + 1)]
+
+    @property
+    def is_ready(self) -> bool:
+        return len(self.closes) == self.window
+
+    def push(self, close: float) -> Optional[Dict[str, float]]:
+        """
+        推入最新收盘价，窗口满时返回最新回归结果
+        """
+        close = float(close)
+        if self._anchor is None:
+            self._anchor = math.log(close)
+        y = math.log(close) - self._anchor
+
+        if self.is_ready:
+            y_old = math.log(self.closes[0]) - self._anchor
+            self.closes.append(close)
+            last_k = self.window - 1
+            _shift_moments(self._y_moments, y_old, y, last_k)
+            _shift_moments(self._y2_moments, y_old * y_old, y * y, last_k)
+        else:
+            k = len(self.closes)
+            self.closes.append(close)
+            for p, moment in enumerate(self._y_moments):
+                moment.add(k ** p * y)
+            for p, moment in enumerate(self._y2_moments):
+                moment.add(k ** p * y * y)
+
+        self._since_rebase += 1
+        if self._since_rebase >= self.rebase_every:
+            self.rebase()
+
+        return self.result() if self.is_ready else None
+
+    def rebase(self) -> None:
+        """
+        以窗口首个价格为新锚点，用缓冲区中的价格精确重算各阶矩
+        """
+        logs = [math.log(c) for c in self.closes]
+        self._anchor = logs[0] if logs else None
+        ys = [v - logs[0] for v in logs]
+        self._y_moments = [
+            _CompensatedSum(math.fsum(k ** p * y for k, y in enumerate(ys))) for p in range(_Y_ORDERS)
+        ]
+        self._y2_moments = [
+            _CompensatedSum(math.fsum(k ** p * y * y for k, y in enumerate(ys))) for p in range(_Y2_ORDERS)
+        ]
+        self._since_rebase = 0
+
+    def _sum_const(self, poly: tuple, power: int) -> float:
+        # Σ_k poly(k)·k^power
+        return sum(a * self._k_powers[i + power] for i, a in enumerate(poly))
+
+    def window_sums(self) -> WindowSums:
+        """
+        当前窗口的锚点、各阶矩与权重常数和，供推算下一窗口的评分函数（见 breakeven.py）
+        """
+        return WindowSums(
+            anchor=self._anchor,
+            y_moments=[moment.value for moment in self._y_moments],
+            y2_moments=[moment.value for moment in self._y2_moments],
+            fit_poly=self._fit_poly,
+            r2_poly=self._r2_poly,
+            fit_const=tuple(self._sum_const(self._fit_poly, p) for p in range(3)),
+            r2_const=tuple(self._sum_const(self._r2_poly, p) for p in range(3)),
+        )
+
+    def result(self) -> Dict[str, float]:
+        """
+        由各阶矩组合出加权和，返回与 MOM 相同口径的指标
+        """
+        n = self.window
+        m = [moment.value for moment in self._y_moments]
+        q = [moment.value for moment in self._y2_moments]
+        fit_poly, r2_poly = self._fit_poly, self._r2_poly
+
+        def with_y(poly, power):
+            return sum(a * m[i + power] for i, a in enumerate(poly))
+
+        # 加权最小二乘（权重 W）
+        sw = self._sum_const(fit_poly, 0)
+        swx = self._sum_const(fit_poly, 1)
+        swxx = self._sum_const(fit_poly, 2)
+        swy = with_y(fit_poly, 0)
+        swxy = with_y(fit_poly, 1)
+        slope = (sw * swxy - swx * swy) / (sw * swxx - swx * swx)
+        intercept = (swy - slope * swx) / sw
+
+        # R²：残差与对算术均值的离差均以 w 加权
+        rw = self._sum_const(r2_poly, 0)
+        rwx = self._sum_const(r2_poly, 1)
+        rwxx = self._sum_const(r2_poly, 2)
+        rwy = with_y(r2_poly, 0)
+        rwxy = with_y(r2_poly, 1)
+        rwyy = sum(a * q[i] for i, a in enumerate(r2_poly))
+        y_mean = m[0] / n
+
+        ss_tot = rwyy - 2 * y_mean * rwy + y_mean * y_mean * rw
+        ss_res = (
+            rwyy
+            - 2 * intercept * rwy
+            - 2 * slope * rwxy
+            + intercept * intercept * rw
+            + 2 * intercept * slope * rwx
+            + slope * slope * rwxx
+        )
+        if ss_tot != 0:
+            r_squared = 1 - ss_res / ss_tot
+        else:
+            r_squared = float('nan') if self.weighted else 0.0
+
+        annualized_returns = math.pow(math.exp(slope), 250) - 1
+        return {
+            'score': annualized_returns * r_squared,
+            'annualized_returns': annualized_returns,
+            'r_squared': r_squared,
+            'slope': slope,
+            'intercept': intercept + self._anchor,
+            'start_price': self.closes[0],
+            'end_price': self.closes[-1],
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            'window': self.window,
+            'weighted': self.weighted,
+            'rebase_every': self.rebase_every,
+            'closes': list(self.closes),
+            'since_rebase': self._since_rebase,
+            'anchor': self._anchor,
+            'y_moments': [[m.total, m.comp] for m in self._y_moments],
+            'y2_moments': [[m.total, m.comp] for m in self._y2_moments],
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> 'RollingRegression':
+        reg = cls(state['window'], state['weighted'], state['rebase_every'])
+        reg.closes.extend(state['closes'])
+        reg._since_rebase = state['since_rebase']
+        reg._anchor = state['anchor']
+        reg._y_moments = [_CompensatedSum(t, c) for t, c in state['y_moments']]
+        reg._y2_moments = [_CompensatedSum(t, c) for t, c in state['y2_moments']]
+        return reg
+
+
+class RollingScoreBook:
+    """
+    按 ETF × 窗口长度 管理 RollingRegression，并记录每只ETF已推入的最后日期
+    """
+
+    def __init__(self, windows: Iterable[int], weighted: bool = True) -> None:
+        self.windows = tuple(windows)
+        self.weighted = weighted
+        self.regressions: Dict[str, Dict[int, RollingRegression]] = {}
+        self.last_dates: Dict[str, str] = {}
+
+    def push(self, etf_code: str, date, close: float) -> None:
+        if etf_code not in self.regressions:
+            self.regressions[etf_code] = {
+                window: RollingRegression(window, self.weighted) for window in self.windows
+            }
+        for regression in self.regressions[etf_code].values():
+            regression.push(close)
+        self.last_dates[etf_code] = pd.Timestamp(date).strftime('%Y-%m-%d')
+
+    def update_from_data(self, etf_data: Dict[str, pd.DataFrame]) -> int:
+        """
+        把各ETF数据中晚于已记录日期的收盘价依次推入，返回新增条数
+        """
+        pushed = 0
+        for etf_code, df in etf_data.items():
+            last_date = self.last_dates.get(etf_code)
+            new_rows = df if last_date is None else df[df.index > pd.Timestamp(last_date)]
+            for date, close in new_rows['close'].items():
+                self.push(etf_code, date, close)
+                pushed += 1
+        return pushed
+
+    def results(self, window: int) -> Dict[str, Dict[str, float]]:
+        """
+        返回指定窗口下所有已就绪ETF的最新回归结果
+        """
+        return {
+            etf_code: regressions[window].result()
+            for etf_code, regressions in self.regressions.items()
+            if regressions[window].is_ready
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            'windows': list(self.windows),
+            'weighted': self.weighted,
+            'last_dates': dict(self.last_dates),
+            'regressions': {
+                etf_code: {str(window): reg.to_dict() for window, reg in regressions.items()}
+                for etf_code, regressions in self.regressions.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> 'RollingScoreBook':
+        book = cls(state['windows'], state['weighted'])
+        book.last_dates = dict(state['last_dates'])
+        book.regressions = {
+            etf_code: {int(window): RollingRegression.from_dict(reg) for window, reg in regressions.items()}
+            for etf_code, regressions in state['regressions'].items()
+        }
+        return book
+
+    def save(self, path) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(path.suffix + '.tmp')
+        tmp_path.write_text(json.dumps(self.to_dict(), ensure_ascii=False), encoding='utf-8')
+        tmp_path.replace(path)
+
+    @classmethod
+    def load(cls, path) -> 'RollingScoreBook':
+        return cls.from_dict(json.loads(Path(path).read_text(encoding='utf-8')))
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+评分公式小语言
+把 strategy/mom.py、strategy/加权评分.py、test/test.py、test/test2.py 这类只在公式上
+略有差别的打分写成一行表达式，例如 sigmoid(ann_ret(25)*r2(25)) * sigmoid(slope(3))。
+一批公式编译为共享公共子表达式的计算图，在 日期×ETF 面板上整体向量化求值。
+"""
+
+import ast
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .factor_engine import FactorEngine
+except ImportError:
+    from factor_engine import FactorEngine
+
+
+# 数据函数：公式名 -> (因子节点, 是否加权)，参数为窗口长度
+# 不带 w 前缀的为普通最小二乘（LocalRankStrategy 口径），w 前缀为线性加权（MOM 口径）
+REGRESSION_FUNCS = {
+    'slope': ('slope', False),
+    'r2': ('r_squared', False),
+    'ann_ret': ('annualized_returns', False),
+    'score': ('momentum_score', False),
+    'wslope': ('slope', True),
+    'wr2': ('r_squared', True),
+    'wann_ret': ('annualized_returns', True),
+    'wscore': ('momentum_score', True),
+}
+
+# 其他数据函数：公式名 -> (因子节点, 参数名, 必填参数个数)
+DATA_FUNCS = {
+    'close': ('close', (), 0),
+    'log_ret': ('log_return', (), 0),
+    'ma': ('moving_average', ('window',), 1),
+    'vol': ('volatility', ('window',), 1),
+    'drawdown': ('drawdown', ('window',), 0),
+}
+
+
+def _flip_if_both_neg(value, a, b):
+    return np.where((a < 0) & (b < 0), -value, value)
+
+
+# 逐元素函数：公式名 -> (参数个数, 实现)
+ELEMENTWISE_FUNCS = {
+    'sigmoid': (1, lambda x: 1.0 / (1.0 + np.exp(-x))),
+    'log': (1, np.log),
+    'exp': (1, np.exp),
+    'abs': (1, np.abs),
+    'sqrt': (1, np.sqrt),
+    'min': (2, np.minimum),
+    'max': (2, np.maximum),
+    'where': (3, np.where),
+    # 两项原始分数都为负时翻转符号（LocalRankStrategy 的双负规则）
+    'flip_if_both_neg': (3, _flip_if_both_neg),
+}
+
+_BIN_OPS = {
+    ast.Add: ('add', np.add),
+    ast.Sub: ('sub', np.subtract),
+    ast.Mult: ('mul', np.multiply),
+    ast.Div: ('div', np.divide),
+    ast.Pow: ('pow', np.power),
+    ast.BitAnd: ('and', np.logical_and),
+    ast.BitOr: ('or', np.logical_or),
+}
+_CMP_OPS = {
+    ast.Lt: ('lt', np.less),
+    ast.LtE: ('le', np.less_equal),
+    ast.Gt: ('gt', np.greater),
+    ast.GtE: ('ge', np.greater_equal),
+}
+_COMMUTATIVE = {'add', 'mul', 'and', 'or', 'min', 'max'}
+_OP_FUNCS = {name: func for name, func in list(_BIN_OPS.values()) + list(_CMP_OPS.values())}
+_OP_FUNCS['neg'] = np.negative
+for _name, (_, _func) in ELEMENTWISE_FUNCS.items():
+    _OP_FUNCS[_name] = _func
+
+# 仓库里几份聚宽脚本对应的公式
+KNOWN_VARIANTS = {
+    # strategy/mom.py、LocalETFStrategy.MOM：25 日加权年化收益 × 加权 R²
+    'mom': 'wscore(25)',
+    # LocalRankStrategy：25 日动量与 3 日斜率的 Sigmoid 乘积，双负翻转
+    'rank': 'flip_if_both_neg(sigmoid(score(25)) * sigmoid(slope(3)), score(25), slope(3))',
+    # strategy/加权评分.py、test/test.py：翻转条件写在 Sigmoid 之后，永远不会触发
+    '加权评分': 'sigmoid(score(25)) * sigmoid(slope(3))',
+    # test/test2.py：长短周期都用加权回归的年化收益 × R²
+    'test2': 'flip_if_both_neg(sigmoid(wscore(25)) * sigmoid(wscore(3)), wscore(25), wscore(3))',
+}
+
+
+class FormulaBatch:
+    """
+    一批公式编译后的计算图
+
+    nodes 按拓扑顺序排列，每个节点是 ('const', 值)、('data', 因子节点, 参数) 或
+    ('op', 运算名, 子节点下标...)；结构相同的子表达式只保留一个节点。
+    """
+
+    def __init__(self, formulas: Dict[str, str]) -> None:
+        self.formulas = dict(formulas)
+        self.nodes: List[tuple] = []
+        self._node_ids: Dict[tuple, int] = {}
+        self.expression_size = 0
+        self.outputs: Dict[str, int] = {
+            name: self._compile(ast.parse(expr, mode='eval').body, expr)
+            for name, expr in self.formulas.items()
+        }
+
+    def _intern(self, node: tuple) -> int:
+        if node not in self._node_ids:
+            self._node_ids[node] = len(self.nodes)
+            self.nodes.append(node)
+        return self._node_ids[node]
+
+    def _op(self, op_name: str, children: List[int]) -> int:
+        if op_name in _COMMUTATIVE:
+            children = sorted(children)
+        # 常量折叠
+        if all(self.nodes[c][0] == 'const' for c in children):
+            value = _OP_FUNCS[op_name](*[self.nodes[c][1] for c in children])
+            return self._intern(('const', float(value)))
+        return self._intern(('op', op_name) + tuple(children))
+
+    def _compile(self, node: ast.AST, expr: str) -> int:
+        self.expression_size += 1
+
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return self._intern(('const', float(node.value)))
+
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            child = self._compile(node.operand, expr)
+            return child if isinstance(node.op, ast.UAdd) else self._op('neg', [child])
+
+        if isinstance(node, ast.BinOp) and type(node.op) in _BIN_OPS:
+            op_name = _BIN_OPS[type(node.op)][0]
+            return self._op(op_name, [self._compile(node.left, expr), self._compile(node.right, expr)])
+
+        if isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in _CMP_OPS:
+            op_name = _CMP_OPS[type(node.ops[0])][0]
+            return self._op(op_name, [self._compile(node.left, expr), self._compile(node.comparators[0], expr)])
+
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+            return self._compile_call(node.func.id, node.args, expr)
+
+        raise ValueError(f"公式中不支持的语法: {ast.unparse(node)}（{expr}）")
+
+    def _compile_call(self, func: str, args: List[ast.AST], expr: str) -> int:
+        if func in REGRESSION_FUNCS or func in DATA_FUNCS:
+            values = []
+            for arg in args:
+                if not (isinstance(arg, ast.Constant) and isinstance(arg.value, int)):
+                    raise ValueError(f"{func} 的参数必须是整数常量（{expr}）")
+                values.append(arg.value)
+
+            if func in REGRESSION_FUNCS:
+                if len(values) != 1 or values[0] < 2:
+                    raise ValueError(f"{func} 需要一个不小于 2 的窗口长度参数（{expr}）")
+                factor_name, weighted = REGRESSION_FUNCS[func]
+                params = (('weighted', weighted), ('window', values[0]))
+            else:
+                factor_name, param_names, required = DATA_FUNCS[func]
+                if not required <= len(values) <= len(param_names):
+                    raise ValueError(f"{func} 参数个数不正确（{expr}）")
+                params = tuple(zip(param_names, values))
+            return self._intern(('data', factor_name, params))
+
+        if func in ELEMENTWISE_FUNCS:
+            arity = ELEMENTWISE_FUNCS[func][0]
+            if len(args) != arity:
+                raise ValueError(f"{func} 需要 {arity} 个参数（{expr}）")
+            return self._op(func, [self._compile(arg, expr) for arg in args])
+
+        raise ValueError(f"公式中未知的函数: {func}（{expr}）")
+
+    def summary(self) -> Dict[str, int]:
+        """
+        公式数量、展开后的表达式节点总数，以及去重后实际需要计算的节点数
+        """
+        return {
+            'formulas': len(self.formulas),
+            'expression_nodes': self.expression_size,
+            'unique_nodes': len(self.nodes),
+            'data_nodes': sum(1 for node in self.nodes if node[0] == 'data'),
+        }
+
+    def evaluate(self, engine: FactorEngine, dates) -> Dict[str, np.ndarray]:
+        """
+        在给定日期上求值全部公式，返回 {公式名: 日期×ETF 矩阵}
+
+        数据函数按 df.index < date 的口径取值（与策略 get_rank 一致），
+        每个节点只计算一次；历史不足处为 NaN。
+        """
+        dates = pd.DatetimeIndex(pd.to_datetime(dates))
+        shape = (len(dates), len(engine.codes))
+        values: List[np.ndarray] = []
+
+        with np.errstate(all='ignore'):
+            for node in self.nodes:
+                kind = node[0]
+                if kind == 'const':
+                    values.append(np.full(shape, node[1]))
+                elif kind == 'data':
+                    values.append(engine.lookup_before(node[1], dates, **dict(node[2])))
+                else:
+                    args = [values[child] for child in node[2:]]
+                    values.append(np.asarray(_OP_FUNCS[node[1]](*args), dtype=np.float64))
+
+        return {name: values[node_id] for name, node_id in self.outputs.items()}
+
+
+def compile_formulas(formulas) -> FormulaBatch:
+    """
+    编译公式：可传入 {名称: 表达式}，或表达式列表（名称即表达式本身）
+    """
+    if not isinstance(formulas, dict):
+        formulas = {expr: expr for expr in formulas}
+    return FormulaBatch(formulas)
+
+
+def evaluate_formulas(engine: FactorEngine, formulas, dates) -> Dict[str, pd.DataFrame]:
+    """
+    编译并求值一批公式，返回 {名称: DataFrame(日期×ETF)}
+    """
+    dates = pd.DatetimeIndex(pd.to_datetime(dates))
+    batch = compile_formulas(formulas)
+    results = batch.evaluate(engine, dates)
+    return {name: pd.DataFrame(matrix, index=dates, columns=engine.codes) for name, matrix in results.items()}
+
+
+def rank_frame(scores: pd.DataFrame) -> Tuple[pd.Series, pd.DataFrame]:
+    """
+    对公式得分逐日排名：返回每日得分最高的ETF代码，以及名次矩阵（1 为最高）
+
+    NaN（历史不足）排在最后。
+    """
+    filled = scores.fillna(-np.inf)
+    return filled.idxmax(axis=1), filled.rank(axis=1, ascending=False, method='first').astype(int)
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多进程共享的行情面板
+把对齐的 日期×ETF 收盘价面板与派生矩阵（对数价格、预先算好的因子矩阵等）放进
+multiprocessing.shared_memory 段，工作进程只拿到一个很小的描述符（段名、形状、dtype），
+附加后得到指向同一块内存的只读数组，不经 pickle 传输、也不重新读取 CSV。
+
+各段共用一个引用计数（独立的 int64 段，增减时用文件锁互斥）：发布者持有一个引用，
+每个附加的进程各持有一个，最后一个释放的进程删除全部段。工作进程正常退出时自动释放；
+被强制终止的进程来不及释放，其段由发布者进程的 resource_tracker 在所有进程退出后清理。
+工作进程应为发布者的子进程（Pool / Process），与发布者共用 resource_tracker。
+
+用法: python3 shared_panel.py [数据目录] [--workers 2] [--window 25]
+"""
+
+import argparse
+import fcntl
+import os
+import secrets
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from multiprocessing import Pool, shared_memory, util
+from typing import Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .asof_index import date_keys
+    from .factor_engine import FactorEngine
+    from .price_panel import PricePanel
+    from .price_sources import PriceSources
+except ImportError:
+    from asof_index import date_keys
+    from factor_engine import FactorEngine
+    from price_panel import PricePanel
+    from price_sources import PriceSources
+
+
+@dataclass(frozen=True)
+class SharedArraySpec:
+    """
+    一个共享数组：所在段、dtype、形状；factor 非空时为因子矩阵，附加后可预置进 FactorEngine 的缓存
+    """
+    segment: str
+    dtype: str
+    shape: Tuple[int, ...]
+    factor: Optional[str] = None
+    params: Tuple[Tuple[str, object], ...] = ()
+    forward_filled: bool = False
+
+
+@dataclass(frozen=True)
+class SharedPanelDescriptor:
+    """
+    传给工作进程的描述符，只含名称与形状，pickle 后不过几百字节
+    """
+    prefix: str
+    codes: Tuple[str, ...]
+    arrays: Tuple[Tuple[str, SharedArraySpec], ...]
+
+    @property
+    def refs_segment(self) -> str:
+        return f'{self.prefix}_refs'
+
+
+def factor_key(name: str, forward_filled: bool = False, **params) -> str:
+    """
+    因子矩阵在共享面板中的键，例如 momentum_score(weighted=True,window=25)
+    """
+    key = name
+    if params:
+        key += '(' + ','.join(f'{k}={v}' for k, v in sorted(params.items())) + ')'
+    return 'ffill:' + key if forward_filled else key
+
+
+def _lock_path(prefix: str) -> str:
+    return os.path.join(tempfile.gettempdir(), f'{prefix}.lock')
+
+
+@contextmanager
+def _locked(prefix: str) -> Iterator[None]:
+    # 引用计数的增减跨进程互斥
+    with open(_lock_path(prefix), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _unlink_segments(names: Sequence[str]) -> None:
+    for name in names:
+        try:
+            segment = shared_memory.SharedMemory(name)
+        except FileNotFoundError:
+            continue
+        segment.close()
+        segment.unlink()
+
+
+class SharedPanel:
+    """
+    发布或附加的共享面板
+
+    arrays[key] 为只读数组：'dates'（int64 纳秒时间戳）、'close'（日期×ETF 收盘价）及发布的因子矩阵。
+    release() 释放本进程的引用；之后不应再使用 arrays 及由它构建的 DataFrame / 引擎。
+    """
+
+    def __init__(
+        self,
+        descriptor: SharedPanelDescriptor,
+        segments: Dict[str, shared_memory.SharedMemory],
+        refs: shared_memory.SharedMemory,
+    ) -> None:
+        self.descriptor = descriptor
+        self.codes: List[str] = list(descriptor.codes)
+        self.specs: Dict[str, SharedArraySpec] = dict(descriptor.arrays)
+        self._segments = segments
+        self._refs = refs
+        self.arrays: Dict[str, np.ndarray] = {}
+        for key, spec in self.specs.items():
+            array = np.ndarray(spec.shape, dtype=np.dtype(spec.dtype), buffer=segments[key].buf)
+            array.flags.writeable = False
+            self.arrays[key] = array
+        self.dates = pd.DatetimeIndex(self.arrays['dates'].view('datetime64[ns]'))
+        # 进程正常退出时（含 Pool 工作进程）自动释放引用
+        self._finalizer = util.Finalize(self, self._release, exitpriority=10)
+
+    @classmethod
+    def publish(
+        cls,
+        dates,
+        codes: Sequence[str],
+        arrays: Mapping[str, np.ndarray],
+        factors: Optional[Mapping[str, Tuple[str, dict, bool]]] = None,
+    ) -> 'SharedPanel':
+        """
+        把数组复制进新建的共享内存段，返回持有一个引用的发布者
+
+        arrays 须含 'close'，各数组首维与 dates 等长；factors 为 {键: (因子名, 参数, 是否向前填充)}。
+        """
+        factors = factors or {}
+        prefix = f'etfpanel_{os.getpid()}_{secrets.token_hex(4)}'
+        entries = {'dates': date_keys(dates)}
+        entries.update(arrays)
+
+        segments: Dict[str, shared_memory.SharedMemory] = {}
+        specs = []
+        try:
+            for i, (key, values) in enumerate(entries.items()):
+                values = np.ascontiguousarray(values)
+                segment = shared_memory.SharedMemory(f'{prefix}_{i}', create=True, size=max(values.nbytes, 1))
+                segments[key] = segment
+                np.ndarray(values.shape, dtype=values.dtype, buffer=segment.buf)[...] = values
+                name, params, forward_filled = factors.get(key, (None, {}, False))
+                specs.append((key, SharedArraySpec(
+                    segment.name, values.dtype.str, values.shape, name, tuple(sorted(params.items())), forward_filled,
+                )))
+            refs = shared_memory.SharedMemory(f'{prefix}_refs', create=True, size=8)
+        except BaseException:
+            for segment in segments.values():
+                segment.close()
+                segment.unlink()
+            raise
+        np.ndarray((1,), dtype=np.int64, buffer=refs.buf)[0] = 1
+
+        descriptor = SharedPanelDescriptor(prefix, tuple(codes), tuple(specs))
+        return cls(descriptor, segments, refs)
+
+    @classmethod
+    def from_engine(
+        cls,
+        engine: FactorEngine,
+        factors: Sequence[Tuple[str, dict]] = (('log_price', {}),),
+        forward_filled: bool = False,
+    ) -> 'SharedPanel':
+        """
+        发布因子引擎的收盘价面板与给定因子矩阵，factors 为 [(因子名, 参数)]
+
+        forward_filled=True 时同时发布 lookup_before 使用的向前填充矩阵，工作进程按日期取值也不必再算。
+        """
+        arrays = {'close': engine.closes}
+        meta = {}
+        for name, params in factors:
+            value = engine.get(name, **params)
+            if not isinstance(value, np.ndarray):
+                raise TypeError(f'因子 {name} 不是矩阵，不能放入共享内存')
+            key = factor_key(name, **params)
+            arrays[key] = value
+            meta[key] = (name, params, False)
+            if forward_filled:
+                key = factor_key(name, forward_filled=True, **params)
+                arrays[key] = engine.forward_filled(value)
+                meta[key] = (name, params, True)
+        return cls.publish(engine.dates, engine.codes, arrays, meta)
+
+    @classmethod
+    def attach(cls, descriptor: SharedPanelDescriptor) -> 'SharedPanel':
+        """
+        附加已发布的面板并持有一个引用；面板已被释放时抛出 FileNotFoundError
+        """
+        with _locked(descriptor.prefix):
+            try:
+                refs = shared_memory.SharedMemory(descriptor.refs_segment)
+            except FileNotFoundError:
+                refs = None
+            else:
+                count = np.ndarray((1,), dtype=np.int64, buffer=refs.buf)
+                alive = count[0] > 0
+                if alive:
+                    count[0] += 1
+                del count
+                if not alive:
+                    refs.close()
+                    refs = None
+            if refs is None:
+                # 锁文件是本次打开时新建的，随之删除
+                os.remove(_lock_path(descriptor.prefix))
+                raise FileNotFoundError(f'共享面板 {descriptor.prefix} 已释放')
+        segments = {key: shared_memory.SharedMemory(spec.segment) for key, spec in descriptor.arrays}
+        return cls(descriptor, segments, refs)
+
+    @property
+    def refcount(self) -> int:
+        return int(np.ndarray((1,), dtype=np.int64, buffer=self._refs.buf)[0])
+
+    def frame(self, key: str = 'close') -> pd.DataFrame:
+        """
+        以 DataFrame 形式返回日期×ETF 数组（与共享内存共用数据）
+        """
+        return pd.DataFrame(self.arrays[key], index=self.dates, columns=self.codes, copy=False)
+
+    def price_panel(self) -> PricePanel:
+        """
+        由共享收盘价构建 PricePanel（按ETF压缩的序列与计数在本进程内生成）
+        """
+        return PricePanel(self.frame('close'))
+
+    def factor_engine(self, max_entries: int = 128) -> FactorEngine:
+        """
+        以共享收盘价为面板的因子引擎，发布的因子矩阵已预置进缓存，get / lookup_before 直接命中
+        """
+        engine = FactorEngine(self.frame('close'), max_entries=max_entries)
+        for key, spec in self.specs.items():
+            if spec.factor is not None:
+                engine.preload(spec.factor, self.arrays[key], forward_filled=spec.forward_filled, **dict(spec.params))
+        return engine
+
+    def release(self) -> None:
+        """
+        释放本进程的引用，最后一个引用释放时删除全部段；可重复调用
+        """
+        self._finalizer()
+
+    def _release(self) -> None:
+        self.arrays = {}
+        self.dates = None
+        for segment in self._segments.values():
+            try:
+                segment.close()
+            except BufferError:
+                # 调用方仍持有数组视图：映射留到进程退出，段本身照常按引用计数删除
+                pass
+
+        prefix = self.descriptor.prefix
+        with _locked(prefix):
+            count = np.ndarray((1,), dtype=np.int64, buffer=self._refs.buf)
+            count[0] -= 1
+            last = count[0] == 0
+            del count
+            self._refs.close()
+            if last:
+                _unlink_segments([spec.segment for _, spec in self.descriptor.arrays])
+                self._refs.unlink()
+                os.remove(_lock_path(prefix))
+
+    def __enter__(self) -> 'SharedPanel':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+# ---------------------------------------------------------------------------
+# Pool 工作进程
+# ---------------------------------------------------------------------------
+
+_worker_panel: Optional[SharedPanel] = None
+
+
+def init_worker(descriptor: SharedPanelDescriptor) -> None:
+    """
+    Pool 的 initializer：工作进程启动时附加共享面板，进程正常退出（pool.close() 后 join）时释放
+    """
+    global _worker_panel
+    _worker_panel = SharedPanel.attach(descriptor)
+
+
+def worker_panel() -> SharedPanel:
+    if _worker_panel is None:
+        raise RuntimeError('当前进程未附加共享面板，请以 init_worker 作为 Pool 的 initializer')
+    return _worker_panel
+
+
+def _score_slice(task):
+    # 工作进程：在共享面板上取一段日期的评分并选出最高分ETF
+    dates, params = task
+    panel = worker_panel()
+    start = time.perf_counter()
+    engine = panel.factor_engine()
+    scores = engine.lookup_before('momentum_score', dates, **params)
+    enough = engine.history_count_before(dates) >= params['window']
+    scores = np.where(enough, scores, -999.0)
+    shared = np.shares_memory(engine.closes, panel.arrays['close'])
+    picks = [panel.codes[j] for j in np.argmax(scores, axis=1)]
+    return os.getpid(), shared, engine.misses, time.perf_counter() - start, picks
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='共享内存行情面板：多进程按日期分段选出最高分ETF')
+    parser.add_argument('data_dir', nargs='?', default='data')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--window', type=int, default=25)
+    args = parser.parse_args()
+
+    sources = PriceSources(args.data_dir)
+    codes = sources.codes()
+    sources.prefetch({code: None for code in codes})
+    panel = PricePanel.from_frames({code: sources.load(code) for code in codes})
+    engine = FactorEngine.from_panel(panel)
+    params = {'window': args.window, 'weighted': True}
+    dates = panel.common_dates()[args.window:]
+
+    with SharedPanel.from_engine(engine, [('log_price', {}), ('momentum_score', params)], forward_filled=True) as shared:
+        size = sum(array.nbytes for array in shared.arrays.values()) / 1e6
+        print(f'已发布 {len(shared.specs)} 个数组，共 {size:.2f} MB；描述符 {len(repr(shared.descriptor))} 字节')
+
+        slices = [(chunk, params) for chunk in np.array_split(pd.DatetimeIndex(dates), args.workers) if len(chunk)]
+        pool = Pool(args.workers, initializer=init_worker, initargs=(shared.descriptor,))
+        results = pool.map(_score_slice, slices)
+        print(f'工作进程附加后引用计数: {shared.refcount}')
+        pool.close()
+        pool.join()
+        print(f'工作进程退出后引用计数: {shared.refcount}')
+
+        for pid, zero_copy, misses, seconds, picks in results:
+            print(f'  进程 {pid}: {len(picks)} 个交易日, 零拷贝 {zero_copy}, 重新计算的因子 {misses} 个, 用时 {seconds * 1e3:.1f} ms')
+
+        expected = np.where(
+            engine.history_count_before(dates) >= args.window,
+            engine.lookup_before('momentum_score', dates, **params),
+            -999.0,
+        )
+        picks = [code for result in results for code in result[4]]
+        assert picks == [panel.codes[j] for j in np.argmax(expected, axis=1)], '工作进程结果与单进程不一致'
+        print('工作进程选出的ETF与单进程一致')
+
+    leftover = [name for name in os.listdir('/dev/shm') if name.startswith(shared.descriptor.prefix)] \
+        if os.path.isdir('/dev/shm') else []
+    print(f'释放后残留的共享内存段: {len(leftover)}')
+
+
+if __name__ == '__main__':
+    main()
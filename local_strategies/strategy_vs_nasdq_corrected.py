@@ -8,6 +8,13 @@ from typing import Dict, Optional
 import pandas as pd
 import warnings
 
+try:
+    from .asof_index import AsOfIndex
+    from .price_sources import PriceSources
+except ImportError:
+    from asof_index import AsOfIndex
+    from price_sources import PriceSources
+
 warnings.filterwarnings('ignore')
 
 ROOT_DIR = Path(__file__).resolve().parent.parent
@@ -25,24 +32,6 @@ ETF_CONFIG: Dict[str, Dict[str, object]] = {
 BASELINE_CODE = '159509'
 
 
-def _load_price_series(csv_path: Path) -> pd.DataFrame:
-    """Load a price series CSV and normalize columns."""
-
-    df = pd.read_csv(csv_path)
-    if 'close' not in df.columns:
-        rename_map = {
-            'net_value': 'close',
-            '单位净值': 'close',
-            '净值日期': 'date',
-        }
-        df = df.rename(columns={k: v for k, v in rename_map.items() if k in df.columns})
-
-    df['date'] = pd.to_datetime(df['date'])
-    df = df.sort_values('date').set_index('date')
-    df['close'] = pd.to_numeric(df['close'], errors='coerce')
-    return df.dropna(subset=['close'])
-
-
 def _load_etf_data(codes: set[str]) -> Dict[str, pd.DataFrame]:
     data: Dict[str, pd.DataFrame] = {}
     for code in codes:
@@ -52,26 +41,27 @@ def _load_etf_data(codes: set[str]) -> Dict[str, pd.DataFrame]:
             continue
 
         csv_path = config['file']
-        if not csv_path.exists():
+        sources = PriceSources(csv_path.parent)
+        if sources.source(code, csv_path.name) is None:
             print(f"⚠️ 数据文件缺失: {csv_path}")
             continue
 
-        data[code] = _load_price_series(csv_path)
+        data[code] = sources.load(code, csv_path.name)
     return data
 
 
-def _price_on_or_before(df: Optional[pd.DataFrame], target_date: pd.Timestamp) -> Optional[float]:
-    if df is None or df.empty:
-        return None
-    subset = df.loc[:target_date]
-    if subset.empty:
+def _price_on_or_before(prices: AsOfIndex, code: str, target_date: pd.Timestamp) -> Optional[float]:
+    if code not in prices:
         return None
-    return float(subset['close'].iloc[-1])
+    price = prices.price(code, target_date)
+    return None if pd.isna(price) else price
 
 
-def _compute_return(df: Optional[pd.DataFrame], start_date: pd.Timestamp, end_date: pd.Timestamp) -> Optional[float]:
-    buy_price = _price_on_or_before(df, start_date)
-    sell_price = _price_on_or_before(df, end_date)
+def _compute_return(
+    prices: AsOfIndex, code: str, start_date: pd.Timestamp, end_date: pd.Timestamp
+) -> Optional[float]:
+    buy_price = _price_on_or_before(prices, code, start_date)
+    sell_price = _price_on_or_before(prices, code, end_date)
     if buy_price is None or sell_price is None:
         return None
     return (sell_price / buy_price - 1.0) * 100
@@ -82,27 +72,25 @@ def _make_period_record(
     position: dict,
     sell_date: pd.Timestamp,
     sell_price: Optional[float],
-    etf_data: Dict[str, pd.DataFrame],
-    baseline_data: Optional[pd.DataFrame],
+    prices: AsOfIndex,
 ) -> Optional[dict]:
     code = position['code']
-    held_data = etf_data.get(code)
     buy_date = position['date']
 
     buy_price = position.get('price')
     if pd.isna(buy_price):
-        buy_price = _price_on_or_before(held_data, buy_date)
+        buy_price = _price_on_or_before(prices, code, buy_date)
 
     exit_price = sell_price
     if exit_price is None or pd.isna(exit_price):
-        exit_price = _price_on_or_before(held_data, sell_date)
+        exit_price = _price_on_or_before(prices, code, sell_date)
 
     if buy_price is None or exit_price is None:
         print(f"⚠️ 无法获取 {code} 在 {buy_date:%Y-%m-%d} 至 {sell_date:%Y-%m-%d} 的价格，已跳过")
         return None
 
     strategy_return = (exit_price / buy_price - 1.0) * 100
-    baseline_return = _compute_return(baseline_data, buy_date, sell_date)
+    baseline_return = _compute_return(prices, BASELINE_CODE, buy_date, sell_date)
 
     if baseline_return is None:
         baseline_label = '数据不足'
@@ -143,7 +131,7 @@ def analyze_holding_periods() -> pd.DataFrame:
     required_codes = set(trades_df['code'])
     required_codes.add(BASELINE_CODE)
     etf_data = _load_etf_data(required_codes)
-    baseline_data = etf_data.get(BASELINE_CODE)
+    prices = AsOfIndex.from_frames(etf_data)
 
     holding_periods = []
     current_position: Optional[dict] = None
@@ -169,8 +157,7 @@ def analyze_holding_periods() -> pd.DataFrame:
                 current_position,
                 trade_date,
                 trade_price,
-                etf_data,
-                baseline_data,
+                prices,
             )
             if record:
                 holding_periods.append(record)
@@ -186,8 +173,7 @@ def analyze_holding_periods() -> pd.DataFrame:
                 current_position,
                 last_date,
                 None,
-                etf_data,
-                baseline_data,
+                prices,
             )
             if record:
                 holding_periods.append(record)
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+测试共用的合成行情：CSV 格式同 data/ 下的文件（日期倒序，net_value 为收盘价），
+代码沿用两个策略默认池中的 159509 / 518880，策略以 data_dir 指向临时目录即可加载。
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CODES = ('159509', '518880')
+
+
+def write_prices(data_dir, codes=CODES, days=300, start='2022-01-03', flat=None, seed=0):
+    """
+    每只ETF写一份对数正态随机游走的收盘价；flat={代码: (起, 止)} 时该区间价格恒定
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    dates = pd.bdate_range(start, periods=days)
+    for j, code in enumerate(codes):
+        rng = np.random.default_rng(seed + j)
+        values = np.round(np.exp(np.cumsum(rng.normal(0.0005, 0.012, days))), 4)
+        if flat and code in flat:
+            first, last = flat[code]
+            values[first:last] = values[first - 1]
+        frame = pd.DataFrame({'date': dates.strftime('%Y-%m-%d'), 'net_value': values, 'code': code})
+        frame.iloc[::-1].to_csv(os.path.join(data_dir, f'{code}_data.csv'), index=False)
+    return dates
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    以临时目录为当前目录（LocalETFStrategy 的结果写入相对路径 analysis_results/）
+    """
+    (tmp_path / 'analysis_results').mkdir()
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    path = tmp_path / 'data'
+    write_prices(path)
+    return str(path)
+
+
+@pytest.fixture
+def flat_data_dir(tmp_path):
+    """
+    159509 有 40 个交易日价格恒定，覆盖总平方和为 0 的回归窗口；
+    种子避开非恒定窗口上斜率恰为 0 的巧合（此时斜率只剩舍入误差，正负无法与逐日回归逐位对齐）
+    """
+    path = tmp_path / 'flat_data'
+    write_prices(path, flat={'159509': (150, 190)}, seed=2)
+    return str(path)
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+盘中临界价：下一窗口评分函数与实际推入价格后的回归结果一致
+"""
+
+import copy
+import math
+
+import numpy as np
+import pytest
+
+from breakeven import NextWindowTrend, solve_flip_log_price
+from rolling_regression import RollingRegression
+
+
+def filled_regression(window, weighted, seed=0):
+    reg = RollingRegression(window, weighted=weighted)
+    closes = np.exp(np.cumsum(np.random.default_rng(seed).normal(0.0005, 0.012, 3 * window)))
+    for close in closes:
+        reg.push(close)
+    return reg
+
+
+@pytest.mark.parametrize('weighted', [True, False])
+def test_next_window_matches_push(weighted):
+    reg = filled_regression(25, weighted)
+    trend = NextWindowTrend(reg)
+    last = math.log(reg.closes[-1])
+    for move in (-0.05, -0.01, 0.0, 0.02, 0.08):
+        pushed = copy.deepcopy(reg).push(math.exp(last + move))
+        score, _ = trend.at(last + move)
+        slope, _ = trend.slope_at(last + move)
+        assert score == pytest.approx(pushed['score'], rel=1e-9, abs=1e-12)
+        assert slope == pytest.approx(pushed['slope'], rel=1e-9, abs=1e-15)
+
+
+def test_flip_price_reaches_target_score():
+    reg = filled_regression(25, True)
+    trend = NextWindowTrend(reg)
+    last = math.log(reg.closes[-1])
+    target = trend.at(last + 0.03)[0]
+    log_price = solve_flip_log_price(trend.at, target, last)
+    assert trend.at(log_price)[0] == pytest.approx(target, rel=1e-9)
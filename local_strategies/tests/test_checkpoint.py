@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+检查点续跑与从头回测一致；评分窗口内的数据被修订时不续跑
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+from history_recorder import history_frame
+from local_rank_strategy import LocalRankStrategy
+from local_strategy import LocalETFStrategy
+
+STRATEGIES = [LocalETFStrategy, LocalRankStrategy]
+
+
+def backtest(make, data_dir, workdir, **kwargs):
+    if make is LocalRankStrategy:
+        strategy = make(data_dir=data_dir, output_dir=str(workdir / 'rank'))
+    else:
+        strategy = make(data_dir=data_dir)
+    strategy.run_backtest(**kwargs)
+    return strategy
+
+
+def assert_same_result(left, right):
+    pd.testing.assert_frame_equal(history_frame(left.portfolio['history']), history_frame(right.portfolio['history']))
+    pd.testing.assert_frame_equal(pd.DataFrame(left.portfolio['trades']), pd.DataFrame(right.portfolio['trades']))
+    assert left.portfolio['positions'] == right.portfolio['positions']
+    assert left.portfolio['cash'] == right.portfolio['cash']
+
+
+def revise_close(data_dir, code, days_before_end):
+    """
+    把 code 在倒数第 days_before_end 个交易日的收盘价上调 1%，并推后文件修改时间
+    """
+    path = os.path.join(data_dir, f'{code}_data.csv')
+    frame = pd.read_csv(path, dtype={'code': str})
+    # 文件按日期倒序保存，第 0 行为最新一日
+    frame.loc[days_before_end, 'net_value'] = round(frame.loc[days_before_end, 'net_value'] * 1.01, 4)
+    frame.to_csv(path, index=False)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    return pd.to_datetime(frame.loc[days_before_end, 'date'])
+
+
+@pytest.mark.parametrize('make', STRATEGIES)
+def test_resume_matches_full_backtest(make, data_dir, workdir, capsys):
+    checkpoint = str(workdir / 'state.npz')
+    first = backtest(make, data_dir, workdir, end_date='2022-11-30', checkpoint_path=checkpoint)
+    resumed = backtest(make, data_dir, workdir, checkpoint_path=checkpoint)
+    assert '从检查点恢复' in capsys.readouterr().out
+    assert len(history_frame(resumed.portfolio['history'])) > len(history_frame(first.portfolio['history']))
+    assert_same_result(resumed, backtest(make, data_dir, workdir))
+
+
+@pytest.mark.parametrize('make', STRATEGIES)
+def test_revision_inside_score_window_rebuilds(make, data_dir, workdir, capsys):
+    checkpoint = str(workdir / 'state.npz')
+    backtest(make, data_dir, workdir, end_date='2023-02-17', checkpoint_path=checkpoint)
+    # 检查点最后一日的收盘价不变，只修订其前几天（仍在评分窗口内）的价格
+    revised = revise_close(data_dir, '159509', 10)
+    assert revised < pd.Timestamp('2023-02-17')
+    capsys.readouterr()
+
+    rerun = backtest(make, data_dir, workdir, checkpoint_path=checkpoint)
+    output = capsys.readouterr().out
+    assert '从头回测' in output and '从检查点恢复' not in output
+    assert_same_result(rerun, backtest(make, data_dir, workdir))
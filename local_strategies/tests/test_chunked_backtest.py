@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+分块外存回测导出的结果与内存回测逐字节相同
+"""
+
+import numpy as np
+import pytest
+
+from chunked_backtest import ChunkedETFStrategy
+from conftest import CODES, write_prices
+from local_strategy import LocalETFStrategy
+from memmap_store import MemmapPriceStore
+
+LATE_CODE = '512890'
+
+
+@pytest.fixture
+def late_data_dir(data_dir):
+    # 第三只ETF晚 60 个交易日才有数据
+    write_prices(data_dir, codes=(LATE_CODE,), days=240, start='2022-03-28', seed=7)
+    return data_dir
+
+
+# 小于 m_days、不是内核块长整数倍、一块装下全部日期
+@pytest.mark.parametrize('chunk_days', [7, 40, 5000])
+def test_chunked_csv_matches_in_memory(chunk_days, late_data_dir, workdir, tmp_path):
+    etf_config = {code: {'name': code, 'file': f'{code}_data.csv'} for code in CODES + (LATE_CODE,)}
+    reference = LocalETFStrategy(data_dir=late_data_dir, etf_config=etf_config)
+    reference.run_backtest()
+
+    store = MemmapPriceStore.from_frames(tmp_path / 'store', reference.etf_data)
+    chunked = ChunkedETFStrategy(store, etf_config=etf_config, chunk_days=chunk_days)
+    chunked.run_backtest(
+        results_path=str(tmp_path / 'chunked' / 'backtest_results.csv'),
+        trades_path=str(tmp_path / 'chunked' / 'trades_record.csv'),
+    )
+
+    for name in ('backtest_results.csv', 'trades_record.csv'):
+        expected = (workdir / 'analysis_results' / name).read_bytes()
+        assert (tmp_path / 'chunked' / name).read_bytes() == expected, name
+
+    # 导出值经过舍入，另把最后一块的评分与整段评分矩阵逐位比对（回看尾部须从内核块首截取）
+    rows = reference.score_dates.get_indexer(chunked.score_dates)
+    assert chunked.score_codes == reference.score_codes
+    for name, matrix in chunked.score_matrix.items():
+        np.testing.assert_array_equal(matrix, reference.score_matrix[name][rows], err_msg=name)
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+列式存储的增量写入
+"""
+
+import numpy as np
+
+from column_store import ColumnStore
+
+
+def columns(dates, close, **others):
+    out = {'date': np.array(dates, dtype='datetime64[D]'), 'close': np.array(close, dtype=np.float64)}
+    out.update({name: np.array(values, dtype=np.float64) for name, values in others.items()})
+    return out
+
+
+def test_update_keeps_older_history(tmp_path):
+    store = ColumnStore(tmp_path)
+    store.write('518880', columns(['2024-01-02', '2024-01-03', '2024-01-04'], [1.0, 1.1, 1.2]))
+
+    # 接口只返回最近一段：与已有数据重叠的日期以新数据为准，更早的行保留
+    total = store.update(
+        '518880', columns(['2024-01-04', '2024-01-05'], [1.25, 1.3], open=[1.21, 1.26])
+    )
+
+    frame = store.read('518880', ['close', 'open'])
+    assert total == 4
+    assert frame.index.strftime('%Y-%m-%d').tolist() == ['2024-01-02', '2024-01-03', '2024-01-04', '2024-01-05']
+    np.testing.assert_array_equal(frame['close'].to_numpy(), [1.0, 1.1, 1.25, 1.3])
+    np.testing.assert_array_equal(frame['open'].to_numpy(), [np.nan, np.nan, 1.21, 1.26])
+
+
+def test_update_creates_missing_partition(tmp_path):
+    store = ColumnStore(tmp_path)
+    assert store.update('518880', columns(['2024-01-03', '2024-01-02'], [1.1, 1.0])) == 2
+    assert store.has('518880')
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+因子引擎的按日期定位
+"""
+
+import numpy as np
+import pandas as pd
+
+from factor_engine import FactorEngine
+
+
+def test_forward_fill_keeps_nan_factor_rows():
+    dates = pd.bdate_range('2024-01-01', periods=5)
+    closes = pd.DataFrame(
+        {'A': [np.nan, 1.0, 1.1, np.nan, 1.3], 'B': [2.0, 2.1, 2.2, 2.3, 2.4]}, index=dates
+    )
+    engine = FactorEngine(closes)
+    # A 第 2 行有数据但因子为 NaN，第 3 行无数据：应沿用第 2 行的 NaN，而不是第 1 行的值
+    factor = np.array([[np.nan, 0.0], [0.5, 0.1], [np.nan, 0.2], [np.nan, 0.3], [0.7, 0.4]])
+    expected = np.array([[np.nan, 0.0], [0.5, 0.1], [np.nan, 0.2], [np.nan, 0.3], [0.7, 0.4]])
+    np.testing.assert_array_equal(engine.forward_filled(factor), expected)
+
+    engine.preload('log_return', factor)
+    looked_up = engine.lookup_before('log_return', dates[1:] + pd.Timedelta(hours=1))
+    np.testing.assert_array_equal(looked_up, expected[1:])
+
+
+def test_compact_panel_stays_float32_with_float64_factors():
+    dates = pd.bdate_range('2024-01-01', periods=120)
+    values = np.exp(np.cumsum(np.random.default_rng(0).normal(0, 0.01, (120, 3)), axis=0)).astype(np.float32)
+    values[:30, 2] = np.nan
+    compact = FactorEngine(pd.DataFrame(values, index=dates, columns=['A', 'B', 'C'], copy=False))
+    wide = FactorEngine(pd.DataFrame(values.astype(np.float64), index=dates, columns=['A', 'B', 'C']))
+
+    # 面板不复制为 float64；因子仍按 float64 计算，结果与 float64 面板逐位相同
+    assert compact.closes.dtype == np.float32 and np.shares_memory(compact.closes, values)
+    factors = [
+        ('log_return', {}), ('moving_average', {'window': 20}), ('drawdown', {'window': 60}),
+        ('momentum_score', {'window': 25, 'weighted': True}), ('window_start_price', {'window': 25}),
+    ]
+    for name, params in factors:
+        np.testing.assert_array_equal(compact.get(name, **params), wide.get(name, **params), err_msg=name)
+        assert compact.get(name, **params).dtype == np.float64
+    np.testing.assert_array_equal(compact.lookup_before('close', dates), wide.lookup_before('close', dates))
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from local_strategy import LocalETFStrategy
+from momentum_kernel import weighted_mom_table
+
+
+def assert_matches_mom(strategy, code, table, tol=1e-10):
+    dates = strategy.etf_data[code].index
+    for pos in range(strategy.m_days, len(dates)):
+        score, details = strategy.MOM(code, dates[pos])
+        for field, expected in (('score', score), ('r_squared', details['r_squared']), ('slope', details['slope'])):
+            actual = table[field][pos]
+            if np.isnan(expected) or np.isinf(expected):
+                assert actual == expected or (np.isnan(actual) and np.isnan(expected)), (dates[pos], field)
+            else:
+                assert actual == pytest.approx(expected, abs=tol), (dates[pos], field)
+
+
+def test_constant_price_window_matches_mom(flat_data_dir, workdir):
+    strategy = LocalETFStrategy(data_dir=flat_data_dir)
+    closes = strategy.etf_data['159509']['close'].to_numpy(dtype=np.float64)
+    table = weighted_mom_table(closes, strategy.m_days)
+    assert_matches_mom(strategy, '159509', table)
+
+
+def test_random_walk_matches_mom(data_dir, workdir):
+    strategy = LocalETFStrategy(data_dir=data_dir)
+    for code in strategy.etf_data:
+        closes = strategy.etf_data[code]['close'].to_numpy(dtype=np.float64)
+        assert_matches_mom(strategy, code, weighted_mom_table(closes, strategy.m_days), tol=1e-9)
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+多账户共享评分回测
+"""
+
+import numpy as np
+import pandas as pd
+
+from conftest import CODES
+from history_recorder import HistoryRecorder, history_frame
+from local_strategy import LocalETFStrategy
+from multi_account import AccountConfig, MultiAccountRunner
+
+
+def test_targets_outside_matrix_leave_shared_scores_intact(data_dir, workdir):
+    runner = MultiAccountRunner([AccountConfig('全池', CODES), AccountConfig('单只', CODES[:1])], data_dir=data_dir)
+    dates = runner.account_trading_dates(runner.accounts[0])
+    runner.run_backtest(end_date=dates[100])
+    score_dates = runner.strategy.score_dates.copy()
+    scores = runner.strategy.score_matrix['score'].copy()
+
+    # 回测区间之后的日期单独计算，不替换共享评分矩阵
+    later = runner.targets(dates[150])
+    pd.testing.assert_index_equal(runner.strategy.score_dates, score_dates)
+    np.testing.assert_array_equal(runner.strategy.score_matrix['score'], scores)
+
+    ranked, _, _ = runner.strategy.get_rank(dates[150])
+    assert later == {'全池': ranked[:1], '单只': [CODES[0]]}
+    # 回测区间内的日期仍可从矩阵中查到
+    assert set(runner.targets(dates[50])) == {'全池', '单只'}
+
+
+def test_history_recorded_like_single_account(data_dir, workdir):
+    single = LocalETFStrategy(data_dir=data_dir)
+    single.run_backtest()
+    accounts = [AccountConfig('全池', CODES), AccountConfig('双持', CODES, target_num=2)]
+    books = MultiAccountRunner(accounts, data_dir=data_dir, etf_config=single.etf_config).run_backtest()
+
+    history = books['全池'].portfolio['history']
+    assert isinstance(history, HistoryRecorder)
+    expected = history_frame(single.portfolio['history'])
+    actual = history_frame(history)
+    pd.testing.assert_frame_equal(
+        actual[['date', 'total_value', 'cash', 'current_position']],
+        expected[['date', 'total_value', 'cash', 'current_position']],
+    )
+
+    # 同时持有两只时持仓文本按池内顺序以顿号连接
+    both = '、'.join(f"{single.etf_config[code]['name']}({code})" for code in CODES)
+    assert history_frame(books['双持'].portfolio['history'])['current_position'].iloc[-1] == both
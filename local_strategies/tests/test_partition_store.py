@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+分区存储的追加、提交与中断恢复
+"""
+
+import numpy as np
+import pandas as pd
+
+from partition_store import PartitionedPriceStore
+
+
+def closes(start, periods, first=1.0):
+    dates = pd.bdate_range(start, periods=periods)
+    values = np.round(first + 0.001 * np.arange(periods), 4)
+    return pd.DataFrame({'close': values}, index=pd.DatetimeIndex(dates, name='date'))
+
+
+def test_append_only_adds_newer_rows(tmp_path):
+    store = PartitionedPriceStore(tmp_path)
+    history = closes('2023-12-20', 20)
+    assert store.append({'518880': history.iloc[:10]}) == {'518880': 10}
+    # 与已提交日期重叠的行被忽略，跨年份的新行写入两个分区
+    assert store.append({'518880': history.iloc[5:]}) == {'518880': 10}
+    assert store.append({'518880': history.iloc[:15]}) == {'518880': 0}
+
+    reopened = PartitionedPriceStore(tmp_path)
+    pd.testing.assert_frame_equal(reopened.frame('518880'), history, check_freq=False)
+    assert reopened.max_date('518880') == history.index[-1]
+    assert sorted(reopened.manifest['518880']['rows']) == ['2023', '2024']
+
+
+def test_uncommitted_rows_are_ignored_and_replaced(tmp_path):
+    store = PartitionedPriceStore(tmp_path)
+    history = closes('2024-01-02', 30)
+    store.append({'159509': history.iloc[:20]})
+
+    # 模拟写入分区后、替换清单前中断：分区末尾留下未提交的行
+    with open(store.partition_path('159509', 2024), 'a', encoding='utf-8') as f:
+        f.write('2024-02-01,9.9999,159509\n2024-02-02,9.9999,159509\n')
+    reopened = PartitionedPriceStore(tmp_path)
+    pd.testing.assert_frame_equal(reopened.frame('159509'), history.iloc[:20], check_freq=False)
+
+    # 下次写入先截掉未提交的行再追加
+    assert reopened.append({'159509': history}) == {'159509': 10}
+    pd.testing.assert_frame_equal(PartitionedPriceStore(tmp_path).frame('159509'), history, check_freq=False)
+    with open(store.partition_path('159509', 2024), encoding='utf-8') as f:
+        assert '9.9999' not in f.read()
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+行情来源的优先级
+"""
+
+import numpy as np
+import pandas as pd
+
+from column_store import STORE_DIRNAME, ColumnStore
+from partition_store import PARTITION_DIRNAME, PartitionedPriceStore
+from price_sources import PriceSources
+
+
+def test_close_prefers_partition_history(tmp_path):
+    dates = pd.bdate_range('2023-12-01', periods=40)
+    closes = pd.DataFrame({'close': np.linspace(1.0, 1.39, 40)}, index=pd.DatetimeIndex(dates, name='date'))
+    PartitionedPriceStore(tmp_path / PARTITION_DIRNAME).append({'518880': closes})
+    # 列式存储只有最近一段K线（含开盘价）
+    recent = closes.iloc[-10:].assign(open=closes['close'].iloc[-10:] - 0.01)
+    ColumnStore(tmp_path / STORE_DIRNAME).import_frame('518880', recent)
+
+    sources = PriceSources(tmp_path)
+    assert sources.source('518880') == 'partitions'
+    pd.testing.assert_frame_equal(sources.load('518880'), closes, check_freq=False)
+    assert sources.source('518880', columns=('open',)) == 'columns'
+    assert len(sources.load('518880', columns=('open',))) == 10
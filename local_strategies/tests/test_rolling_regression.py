@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+滑动回归的增量结果与逐窗口重算一致，长序列推入后误差不累积
+"""
+
+import numpy as np
+import pytest
+
+from rolling_regression import RollingRegression
+
+
+def direct_fit(closes, weighted):
+    y = np.log(closes)
+    x = np.arange(len(y))
+    weights = np.linspace(1, 2, len(y)) if weighted else np.ones(len(y))
+    slope, intercept = np.polyfit(x, y, 1, w=weights)
+    residuals = y - (slope * x + intercept)
+    r_squared = 1 - np.sum(weights * residuals ** 2) / np.sum(weights * (y - np.mean(y)) ** 2)
+    return slope, r_squared
+
+
+def random_walk(count, seed=0):
+    # 价格量级接近实际ETF
+    return 3.0 * np.exp(np.cumsum(np.random.default_rng(seed).normal(0.0003, 0.012, count)))
+
+
+def worst_errors(reg, closes, every=97):
+    worst_slope = worst_r2 = 0.0
+    for pos, close in enumerate(closes):
+        result = reg.push(close)
+        if result is None or pos % every:
+            continue
+        slope, r_squared = direct_fit(closes[pos + 1 - reg.window:pos + 1], reg.weighted)
+        worst_slope = max(worst_slope, abs(result['slope'] - slope))
+        worst_r2 = max(worst_r2, abs(result['r_squared'] - r_squared))
+    return worst_slope, worst_r2
+
+
+@pytest.mark.parametrize('weighted', [True, False])
+def test_long_sequence_drift_is_bounded(weighted):
+    # 推入两万个数据后，默认每个窗口重算一次，误差与逐窗口 polyfit 同量级
+    worst_slope, worst_r2 = worst_errors(RollingRegression(25, weighted=weighted), random_walk(20000))
+    assert worst_slope < 1e-13
+    assert worst_r2 < 1e-11
+
+
+def test_rebase_removes_accumulated_drift():
+    closes = random_walk(20000)
+    reg = RollingRegression(25, rebase_every=10**9)
+    for close in closes:
+        reg.push(close)
+    reg.rebase()
+    slope, r_squared = direct_fit(closes[-25:], True)
+    assert reg.result()['slope'] == pytest.approx(slope, abs=1e-13)
+    assert reg.result()['r_squared'] == pytest.approx(r_squared, abs=1e-11)
+
+
+def test_round_trip_state_continues_identically():
+    closes = np.exp(np.cumsum(np.random.default_rng(1).normal(0, 0.01, 200)))
+    reg = RollingRegression(25)
+    for close in closes[:100]:
+        reg.push(close)
+    restored = RollingRegression.from_dict(reg.to_dict())
+    for close in closes[100:]:
+        assert restored.push(close) == reg.push(close)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+评分公式编译求值与直接计算一致
+"""
+
+import numpy as np
+import pytest
+
+from local_strategy import LocalETFStrategy
+from score_formula import compile_formulas, evaluate_formulas
+
+
+def test_shared_subexpressions_match_direct_numpy(data_dir, workdir):
+    strategy = LocalETFStrategy(data_dir=data_dir)
+    engine = strategy.factor_engine
+    dates = strategy.get_trading_dates()[30:]
+    formulas = {
+        'mom': 'sigmoid(ann_ret(25)*r2(25)) * sigmoid(slope(3))',
+        'trend': 'ann_ret(25)*r2(25) - 0.5*vol(20)',
+    }
+    # ann_ret(25)*r2(25) 在两个公式中只计算一次
+    batch = compile_formulas(formulas)
+    assert batch.summary()['unique_nodes'] < batch.summary()['expression_nodes']
+
+    results = evaluate_formulas(engine, formulas, dates)
+    ann_ret = engine.lookup_before('annualized_returns', dates, window=25, weighted=False)
+    r2 = engine.lookup_before('r_squared', dates, window=25, weighted=False)
+    slope = engine.lookup_before('slope', dates, window=3, weighted=False)
+    vol = engine.lookup_before('volatility', dates, window=20)
+
+    def sigmoid(x):
+        return 1.0 / (1.0 + np.exp(-x))
+
+    np.testing.assert_array_equal(results['mom'].to_numpy(), sigmoid(ann_ret * r2) * sigmoid(slope))
+    np.testing.assert_array_equal(results['trend'].to_numpy(), ann_ret * r2 - 0.5 * vol)
+
+
+def test_wscore_matches_mom(data_dir, workdir):
+    strategy = LocalETFStrategy(data_dir=data_dir)
+    dates = strategy.get_trading_dates()[strategy.m_days:]
+    scores = evaluate_formulas(strategy.factor_engine, [f'wscore({strategy.m_days})'], dates)
+    scores = scores[f'wscore({strategy.m_days})']
+    for date in dates[::7]:
+        for code in scores.columns:
+            expected, _ = strategy.MOM(code, date)
+            assert scores.at[date, code] == pytest.approx(expected, rel=1e-9, abs=1e-12), (date, code)
+
+
+def test_rejects_unknown_function():
+    with pytest.raises(ValueError):
+        compile_formulas(['foo(25)'])
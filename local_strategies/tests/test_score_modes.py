@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+评分矩阵（score_mode='matrix'）与逐日回归（'loop'）的回测结果一致
+"""
+
+import numpy as np
+import pandas as pd
+
+from history_recorder import history_frame
+from local_rank_strategy import LocalRankStrategy
+from local_strategy import LocalETFStrategy
+
+
+def run(make, **kwargs):
+    strategy = make(**kwargs)
+    strategy.run_backtest()
+    return history_frame(strategy.portfolio['history']), pd.DataFrame(strategy.portfolio['trades'])
+
+
+def test_etf_matrix_matches_loop_on_constant_prices(flat_data_dir, workdir):
+    matrix = run(LocalETFStrategy, data_dir=flat_data_dir, score_mode='matrix')
+    loop = run(LocalETFStrategy, data_dir=flat_data_dir, score_mode='loop')
+    pd.testing.assert_frame_equal(matrix[0], loop[0], check_exact=False, rtol=0, atol=1e-9)
+    pd.testing.assert_frame_equal(matrix[1], loop[1], check_exact=False, rtol=0, atol=1e-9)
+
+
+def test_rank_matrix_matches_loop_on_constant_prices(flat_data_dir, workdir):
+    kwargs = dict(data_dir=flat_data_dir, output_dir=str(workdir / 'rank'))
+    matrix = run(LocalRankStrategy, score_mode='matrix', **kwargs)
+    loop = run(LocalRankStrategy, score_mode='loop', **kwargs)
+    pd.testing.assert_frame_equal(matrix[0], loop[0], check_exact=False, rtol=0, atol=1e-9)
+    pd.testing.assert_frame_equal(matrix[1], loop[1], check_exact=False, rtol=0, atol=1e-9)
+
+
+def test_rank_score_panel_matches_score_record(flat_data_dir, workdir):
+    strategy = LocalRankStrategy(data_dir=flat_data_dir, output_dir=str(workdir / 'rank'))
+    dates = strategy.get_trading_dates()
+    strategy.build_score_panel(dates)
+    for i, date in enumerate(dates):
+        for j, code in enumerate(strategy.score_codes):
+            expected = np.array(strategy.score_record(code, date), dtype=np.float64)
+            actual = np.array(strategy.score_panel[i, j].tolist()[:len(expected)], dtype=np.float64)
+            np.testing.assert_allclose(actual, expected, rtol=0, atol=1e-9, err_msg=f'{code} {date.date()}')
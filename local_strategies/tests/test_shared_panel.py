@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+共享面板的引用计数与清理：工作进程零拷贝附加，最后一个引用释放后不留段与锁文件
+"""
+
+import os
+import time
+from multiprocessing import Pool
+
+import numpy as np
+import pytest
+
+from factor_engine import FactorEngine
+from local_strategy import LocalETFStrategy
+from shared_panel import SharedPanel, _lock_path, _score_slice, init_worker
+
+PARAMS = {'window': 25, 'weighted': True}
+
+
+def leftover_segments(prefix):
+    return [name for name in os.listdir('/dev/shm') if name.startswith(f'{prefix}_')]
+
+
+@pytest.mark.skipif(not os.path.isdir('/dev/shm'), reason='需要 /dev/shm')
+def test_refcount_and_cleanup_across_workers(data_dir, workdir):
+    strategy = LocalETFStrategy(data_dir=data_dir)
+    engine = FactorEngine.from_panel(strategy.price_panel)
+    dates = strategy.get_trading_dates()
+    shared = SharedPanel.from_engine(engine, [('momentum_score', PARAMS)], forward_filled=True)
+    descriptor = shared.descriptor
+    assert shared.refcount == 1 and leftover_segments(descriptor.prefix)
+
+    pool = Pool(2, initializer=init_worker, initargs=(descriptor,))
+    try:
+        # initializer 在工作进程启动后异步执行
+        deadline = time.monotonic() + 30
+        while shared.refcount < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert shared.refcount == 3
+        results = pool.map(_score_slice, [(chunk, PARAMS) for chunk in np.array_split(dates, 2)])
+    finally:
+        pool.close()
+        pool.join()
+    assert shared.refcount == 1
+    assert all(zero_copy for _, zero_copy, _, _, _ in results)
+
+    shared.release()
+    shared.release()
+    assert leftover_segments(descriptor.prefix) == []
+    assert not os.path.exists(_lock_path(descriptor.prefix))
+    with pytest.raises(FileNotFoundError):
+        SharedPanel.attach(descriptor)
+    assert not os.path.exists(_lock_path(descriptor.prefix))
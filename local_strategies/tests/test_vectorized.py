@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+向量化回测与事件循环一致
+"""
+
+import numpy as np
+import pytest
+
+from conftest import CODES, write_prices
+from local_rank_strategy import LocalRankStrategy
+from local_strategy import LocalETFStrategy
+from vectorized import assert_same_backtest, py_round, rotation_path
+
+STRATEGIES = [LocalETFStrategy, LocalRankStrategy]
+
+
+def backtest(make, data_dir, workdir, mode, **kwargs):
+    if make is LocalRankStrategy:
+        strategy = make(data_dir=data_dir, output_dir=str(workdir / 'rank'))
+    else:
+        strategy = make(data_dir=data_dir)
+    strategy.run_backtest(mode=mode, **kwargs)
+    return strategy.portfolio
+
+
+@pytest.mark.parametrize('make', STRATEGIES)
+def test_vectorized_matches_loop(make, data_dir, workdir):
+    vectorized = backtest(make, data_dir, workdir, 'vectorized', check_parity=True)
+    assert_same_backtest(vectorized, backtest(make, data_dir, workdir, 'loop'))
+
+
+def test_vectorized_falls_back_to_loop_on_nan_scores(tmp_path, workdir):
+    # 该种子下价格恒定区间的 MOM 评分含 NaN，事件循环对这些行按 get_rank 排序选取
+    data_dir = str(tmp_path / 'nan_data')
+    write_prices(data_dir, CODES, flat={'159509': (150, 190)}, seed=4)
+    strategy = LocalETFStrategy(data_dir=data_dir)
+    strategy.build_score_matrix(strategy.get_trading_dates())
+    assert np.isnan(strategy.score_matrix['score']).any()
+
+    vectorized = backtest(LocalETFStrategy, data_dir, workdir, 'vectorized')
+    assert_same_backtest(vectorized, backtest(LocalETFStrategy, data_dir, workdir, 'loop'))
+
+
+def test_rotation_path_rejects_nan_rows():
+    scores = np.array([[0.1, 0.2], [np.nan, 0.3]])
+    with pytest.raises(ValueError):
+        rotation_path(scores, np.ones((2, 2)), 100000)
+
+
+def test_py_round_matches_builtin():
+    values = np.random.default_rng(0).normal(0, 1, 2000) * 10.0 ** np.random.default_rng(1).integers(-3, 4, 2000)
+    values = np.concatenate([values, [0.5e-6, 1.5e-6, 2.5e-6, -0.0000125, np.inf, np.nan]])
+    expected = [round(float(value), 6) for value in values]
+    np.testing.assert_array_equal(py_round(values, 6), expected)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+有界 Top-K 排名
+先对所有候选ETF一次性算出评分上界，再按上界从高到低做完整回归；
+当剩余候选的上界已低于当前第 k 名的得分时直接剪枝，不再计算。
+"""
+
+import heapq
+import math
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+
+# 上界放宽量，抵消闭式斜率与 np.polyfit 之间的舍入差异，保证上界不会低于真实得分
+_BOUND_SLACK = 1e-9
+
+
+@dataclass
+class TopKResult:
+    selected: List[str]
+    scores: Dict[str, float]
+    evaluated: int
+    pruned: int
+
+
+def slope_coefficients(window: int, weighted: bool) -> np.ndarray:
+    """
+    回归斜率的线性系数 c，使 slope = c·y
+
+    weighted=True 为 MOM 口径（np.polyfit 的 w=linspace(1,2,n)，实际以 w² 加权）。
+    """
+    x = np.arange(window, dtype=np.float64)
+    fit_w = np.linspace(1, 2, window) ** 2 if weighted else np.ones(window)
+    xc = x - np.sum(fit_w * x) / np.sum(fit_w)
+    return fit_w * xc / np.sum(fit_w * xc * xc)
+
+
+def momentum_score_bound(log_windows: np.ndarray, weighted: bool) -> np.ndarray:
+    """
+    年化收益 × R² 的上界，log_windows 每行为一只ETF窗口内的对数价格
+
+    斜率精确计算（一次矩阵乘法），只放宽 R²：
+    普通最小二乘 R² ∈ [0, 1]，故得分 ≤ max(年化收益, 0)；
+    MOM 口径下回归按 w² 拟合而 R² 按 w 计算，R² 可能略小于 0，
+    由 Σw·残差² ≤ Σw²·残差² ≤ Σw²·(y-ȳ)² 得 R² ≥ 1 - Σw²(y-ȳ)² / Σw(y-ȳ)²，
+    年化收益为负时得分不超过 |年化收益| × max(0, -R²下界)。窗口内价格恒定时 R² 为 NaN，上界取 +inf。
+    """
+    window = log_windows.shape[1]
+    slope = log_windows @ slope_coefficients(window, weighted)
+    annualized_returns = np.expm1(250 * slope)
+
+    if not weighted:
+        bound = np.maximum(annualized_returns, 0.0)
+    else:
+        w = np.linspace(1, 2, window)
+        dev_sq = (log_windows - log_windows.mean(axis=1, keepdims=True)) ** 2
+        ss_tot = dev_sq @ w
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r2_floor = 1 - (dev_sq @ (w * w)) / ss_tot
+        bound = np.where(
+            annualized_returns >= 0,
+            annualized_returns,
+            -annualized_returns * np.maximum(-r2_floor, 0.0),
+        )
+        bound[ss_tot == 0] = np.inf
+    return bound * (1 + _BOUND_SLACK) + _BOUND_SLACK
+
+
+def combined_score_bound(long_logs: np.ndarray, short_logs: np.ndarray) -> np.ndarray:
+    """
+    LocalRankStrategy 综合得分的上界：sigmoid(长周期得分上界) × sigmoid(短周期斜率)
+
+    双负翻转后的得分为负，不会超过未翻转时的正乘积，因此同一个上界对两种情形都成立。
+    """
+    long_bound = momentum_score_bound(long_logs, weighted=False)
+    short_slope = short_logs @ slope_coefficients(short_logs.shape[1], weighted=False)
+    bound = 1.0 / (1.0 + np.exp(-long_bound)) / (1.0 + np.exp(-short_slope))
+    return bound * (1 + _BOUND_SLACK) + _BOUND_SLACK
+
+
+def bounded_top_k(
+    candidates: Sequence[str],
+    bounds: np.ndarray,
+    evaluate: Callable[[str], float],
+    k: int,
+) -> TopKResult:
+    """
+    按上界从高到低计算真实得分，上界低于当前第 k 名得分的候选全部跳过
+
+    结果与“全部打分后稳定降序排序再取前 k 个”一致（同分按候选原顺序）。
+    evaluate 返回 NaN 的候选不参与门槛计算。
+    """
+    order = sorted(range(len(candidates)), key=lambda i: -bounds[i])
+    scores: Dict[str, float] = {}
+    best: List[float] = []  # 已计算得分中最大的 k 个（小顶堆）
+
+    for i in order:
+        if len(best) >= k and bounds[i] < best[0]:
+            break
+        code = candidates[i]
+        score = evaluate(code)
+        scores[code] = score
+        if math.isnan(score):
+            continue
+        if len(best) < k:
+            heapq.heappush(best, score)
+        elif score > best[0]:
+            heapq.heapreplace(best, score)
+
+    position = {code: i for i, code in enumerate(candidates)}
+    ranked = sorted(sorted(scores, key=position.__getitem__), key=scores.__getitem__, reverse=True)
+    return TopKResult(
+        selected=ranked[:k],
+        scores=scores,
+        evaluated=len(scores),
+        pruned=len(candidates) - len(scores),
+    )
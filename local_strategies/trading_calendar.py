@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+沪深交易所交易日历
+交易日存为升序 int32 数组（距 1970-01-01 的天数），另建从首个交易日起按自然日索引的位置表，
+“某日之后/之前第 n 个交易日”只需一次查表加下标运算；多个日期序列的交集按有序数组归并求得。
+交易日取自数据目录中场内ETF（6位代码）的行情日期（经 PriceSources 读取），同一进程内所有脚本共用一份日历。
+"""
+
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .price_sources import PriceSources
+except ImportError:
+    from price_sources import PriceSources
+
+DEFAULT_DATA_DIR = Path(__file__).resolve().parent.parent / 'data'
+
+_NS_PER_DAY = 86_400_000_000_000
+
+
+def epoch_day(date) -> int:
+    """
+    单个日期距 1970-01-01 的天数
+    """
+    return pd.Timestamp(date).value // _NS_PER_DAY
+
+
+def epoch_days(dates) -> np.ndarray:
+    """
+    日期序列转为 int32 天数数组
+    """
+    # 已是 DatetimeIndex 时跳过 to_datetime（它会逐个元素检查是否值得缓存）
+    values = (dates if isinstance(dates, pd.DatetimeIndex) else pd.DatetimeIndex(pd.to_datetime(dates))).values
+    return values.astype('datetime64[D]').astype(np.int64).astype(np.int32)
+
+
+def to_timestamps(days: np.ndarray) -> pd.DatetimeIndex:
+    return pd.DatetimeIndex(np.asarray(days, dtype=np.int64).astype('datetime64[D]'))
+
+
+def intersect_sorted(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    两个升序、无重复数组的交集：把较短的一个在较长的一个上归并定位，不重新排序
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    if len(a) == 0:
+        return a[:0]
+    pos = np.searchsorted(b, a)
+    pos[pos == len(b)] = len(b) - 1
+    return a[b[pos] == a]
+
+
+def intersect_sessions(arrays: Iterable[np.ndarray]) -> np.ndarray:
+    """
+    多个升序天数数组的交集，从最短的开始两两归并
+    """
+    arrays = sorted(arrays, key=len)
+    if not arrays:
+        return np.empty(0, dtype=np.int32)
+    common = arrays[0]
+    for other in arrays[1:]:
+        common = intersect_sorted(common, other)
+    return common
+
+
+class TradingCalendar:
+    """
+    交易日历：days 为升序 int32 天数
+
+    shift(date, n) 中 n > 0 为 date 之后第 n 个交易日，n < 0 为之前第 |n| 个，n = 0 为当日或之前最近的交易日；
+    超出日历范围时返回 None。
+    """
+
+    def __init__(self, days) -> None:
+        self.days = np.unique(np.asarray(days, dtype=np.int32))
+        if len(self.days):
+            self.first = int(self.days[0])
+            self.last = int(self.days[-1])
+            # 位置表：第 k 项为 (first + k) 当日及之前的交易日个数
+            calendar_days = np.arange(self.first, self.last + 1, dtype=np.int32)
+            self._count_through = np.searchsorted(self.days, calendar_days, side='right').astype(np.int32)
+        else:
+            self.first, self.last = 0, -1
+            self._count_through = np.empty(0, dtype=np.int32)
+
+    @classmethod
+    def from_dates(cls, dates) -> 'TradingCalendar':
+        return cls(epoch_days(dates))
+
+    @classmethod
+    def from_frames(cls, frames: Iterable[pd.DataFrame]) -> 'TradingCalendar':
+        """
+        多个以日期为索引的 DataFrame 的日期并集
+        """
+        arrays = [epoch_days(df.index) for df in frames]
+        return cls(np.concatenate(arrays) if arrays else [])
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def __contains__(self, date) -> bool:
+        day = epoch_day(date)
+        count = self.count_through(day)
+        return count > 0 and int(self.days[count - 1]) == day
+
+    @property
+    def sessions(self) -> pd.DatetimeIndex:
+        return to_timestamps(self.days)
+
+    def count_through(self, day: int) -> int:
+        """
+        第 day 天（含）及之前的交易日个数，O(1) 查表
+        """
+        if day < self.first:
+            return 0
+        if day > self.last:
+            return len(self.days)
+        return int(self._count_through[day - self.first])
+
+    def is_session(self, dates) -> np.ndarray:
+        """
+        批量判断是否为交易日（searchsorted）
+        """
+        days = epoch_days(dates)
+        pos = np.searchsorted(self.days, days)
+        found = pos < len(self.days)
+        found[found] = self.days[pos[found]] == days[found]
+        return found
+
+    def shift(self, date, n: int) -> Optional[pd.Timestamp]:
+        day = epoch_day(date)
+        if n > 0:
+            index = self.count_through(day) - 1 + n
+        elif n < 0:
+            index = self.count_through(day - 1) + n
+        else:
+            index = self.count_through(day) - 1
+        if 0 <= index < len(self.days):
+            return to_timestamps(self.days[index:index + 1])[0]
+        return None
+
+    def sessions_after(self, date, n: int) -> pd.DatetimeIndex:
+        """
+        date 之后（不含当日）的 n 个交易日，日历末尾不足时只返回已有部分
+        """
+        start = self.count_through(epoch_day(date))
+        return to_timestamps(self.days[start:start + n])
+
+    def sessions_before(self, date, n: int) -> pd.DatetimeIndex:
+        """
+        date 之前（不含当日）的 n 个交易日
+        """
+        end = self.count_through(epoch_day(date) - 1)
+        return to_timestamps(self.days[max(end - n, 0):end])
+
+    def sessions_between(self, start, end) -> pd.DatetimeIndex:
+        """
+        [start, end] 之间的交易日（含两端）
+        """
+        lo = self.count_through(epoch_day(start) - 1)
+        hi = self.count_through(epoch_day(end))
+        return to_timestamps(self.days[lo:hi])
+
+    def intersect(self, *others: Sequence) -> 'TradingCalendar':
+        """
+        与其他日历（或日期序列）的共同交易日
+        """
+        arrays = [self.days] + [
+            other.days if isinstance(other, TradingCalendar) else np.unique(epoch_days(other)) for other in others
+        ]
+        return TradingCalendar(intersect_sessions(arrays))
+
+
+@lru_cache(maxsize=None)
+def _calendar_for(data_dir: str) -> TradingCalendar:
+    sources = PriceSources(data_dir)
+    codes = sources.codes()
+    # 与策略共用加载器缓存，之后加载同一文件不再解析
+    sources.prefetch(dict.fromkeys(codes))
+    arrays = [epoch_days(sources.load(code).index) for code in codes]
+    return TradingCalendar(np.concatenate(arrays) if arrays else [])
+
+
+def shared_calendar(data_dir=DEFAULT_DATA_DIR) -> TradingCalendar:
+    """
+    数据目录对应的交易日历，同一进程内只构建一次
+    """
+    return _calendar_for(os.path.abspath(str(data_dir)))
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+单一持仓轮动的数组化回测
+每天收盘后持有当日评分最高的ETF（与 get_rank 排序后取第一只相同，平分时取列序靠前者），
+因此持仓序列就是评分矩阵逐行的 argmax，换仓日为持仓变化的行（首日买入也算一次）；
+评分含 NaN 时事件循环另按 get_rank 排序，不能数组化，调用方整段改走事件循环。
+两次换仓之间份额不变，每日市值 = 份额 × 持仓ETF当日收盘价；
+份额只在换仓日按“卖出所得全部买入”递推，运算顺序与事件循环相同，结果逐位一致。
+
+assert_same_backtest 逐项比对两次回测的交易、历史与最终持仓，不一致时抛出 ParityError；
+py_round 是与内置 round 逐位一致的数组舍入，用于整行、整列生成历史记录中保留 6 位的评分明细。
+"""
+
+from dataclasses import dataclass
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .history_recorder import history_frame
+except ImportError:
+    from history_recorder import history_frame
+
+
+class ParityError(AssertionError):
+    """
+    向量化回测与逐日事件循环的结果不一致
+    """
+
+
+@dataclass
+class RotationPath:
+    held: np.ndarray        # 每日收盘后持有的列号
+    switch_rows: np.ndarray  # 换仓日的行号，第一个为首日买入
+    shares: np.ndarray      # 每次换仓买入的份额
+    values: np.ndarray      # 每日组合市值
+
+
+def rotation_path(scores: np.ndarray, prices: np.ndarray, initial_capital: float) -> RotationPath:
+    """
+    scores / prices 为 交易日×ETF 的评分与当日收盘价，返回持仓、换仓、份额与市值
+
+    评分含 NaN 时 np.argmax 取到 NaN 所在列，而事件循环对这样的行改按 get_rank 排序选取，
+    两者不再等同，此时抛出 ValueError，由调用方改走事件循环。
+    """
+    if np.isnan(scores).any():
+        raise ValueError('评分含 NaN，持仓不能按逐行 argmax 确定')
+    held = np.argmax(scores, axis=1)
+    switch = np.ones(len(held), dtype=bool)
+    switch[1:] = held[1:] != held[:-1]
+    switch_rows = np.flatnonzero(switch)
+
+    # 份额按换仓递推：卖出所得 = 上段份额 × 卖出价，全部买入 = 所得 ÷ 买入价
+    shares = np.empty(len(switch_rows))
+    cash = initial_capital
+    for k, row in enumerate(switch_rows):
+        if k:
+            cash = shares[k - 1] * prices[row, held[switch_rows[k - 1]]]
+        shares[k] = cash / prices[row, held[row]]
+
+    segment = np.cumsum(switch) - 1
+    values = shares[segment] * prices[np.arange(len(held)), held]
+    return RotationPath(held, switch_rows, shares, values)
+
+
+def rotation_trades(
+    path: RotationPath, prices: np.ndarray, dates, codes: List[str], names: List[str], initial_capital: float
+) -> List[dict]:
+    """
+    换仓日的交易记录，字段与事件循环 trade 记录的相同：先卖出上一只，再用全部现金买入新的一只
+    """
+    trades = []
+    cash = initial_capital
+    for k, row in enumerate(path.switch_rows):
+        date = dates[row].strftime('%Y-%m-%d')
+        if k:
+            j = int(path.held[path.switch_rows[k - 1]])
+            price = float(prices[row, j])
+            shares = float(path.shares[k - 1])
+            cash = shares * price
+            trades.append({
+                'date': date, 'type': 'sell', 'code': codes[j], 'name': names[j],
+                'shares': shares, 'price': price, 'amount': cash,
+            })
+        j = int(path.held[row])
+        trades.append({
+            'date': date, 'type': 'buy', 'code': codes[j], 'name': names[j],
+            'shares': float(path.shares[k]), 'price': float(prices[row, j]), 'amount': cash,
+        })
+    return trades
+
+
+def py_round(values, ndigits: int) -> np.ndarray:
+    """
+    与内置 round(x, ndigits) 逐位相同的数组舍入，结果为 float64
+
+    rint(x·10^n) / 10^n 中除法是正确舍入的，只有乘积的舍入误差可能让 rint 落到 .5 分界的另一侧；
+    乘积离分界在误差范围内、或超出整数精度（含 inf）的元素改用内置 round 逐个计算。
+    """
+    values = np.asarray(values, dtype=np.float64)
+    scale = 10.0 ** ndigits
+    scaled = values * scale
+    out = np.rint(scaled) / scale
+    magnitude = np.abs(scaled)
+    with np.errstate(invalid='ignore'):
+        unsure = (np.abs(scaled - np.floor(scaled) - 0.5) <= magnitude * 1e-15) | (magnitude >= 2.0 ** 52)
+    for i in np.flatnonzero(unsure):
+        out.flat[i] = round(float(values.flat[i]), ndigits)
+    return out
+
+
+def assert_same_backtest(vectorized: dict, loop: dict) -> None:
+    """
+    比对两个回测后的 portfolio：交易记录、逐日历史、最终现金、市值与持仓
+    """
+    checks = [
+        ('交易记录', pd.DataFrame(vectorized['trades']), pd.DataFrame(loop['trades'])),
+        ('逐日历史', history_frame(vectorized['history']), history_frame(loop['history'])),
+    ]
+    for label, left, right in checks:
+        try:
+            pd.testing.assert_frame_equal(left, right, check_exact=True)
+        except AssertionError as exc:
+            raise ParityError(f'向量化回测与事件循环的{label}不一致:\n{exc}') from exc
+
+    for key in ('cash', 'total_value', 'positions'):
+        if vectorized[key] != loop[key]:
+            raise ParityError(f"向量化回测与事件循环的最终 {key} 不一致: {vectorized[key]!r} != {loop[key]!r}")
@@ -9,18 +9,24 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import warnings
+
+from local_strategies.price_sources import PriceSources
+from local_strategies.trading_calendar import shared_calendar
+
 warnings.filterwarnings('ignore')
 
-def get_next_n_trading_days(data, start_date, n_days):
-    """获取指定日期后N个交易日的数据"""
+def get_next_n_trading_days(data, start_date, n_days, calendar):
+    """获取指定日期后N个交易日的数据，calendar 为数据目录的交易日历"""
     try:
-        # 找到开始日期及之后的数据
-        future_data = data[data.index > start_date]
-        if len(future_data) >= n_days:
-            return future_data.iloc[:n_days]
-        else:
-            return future_data
-    except:
+        # 交易日历给出之后第N个交易日，再在行情索引上二分截取
+        sessions = calendar.sessions_after(start_date, n_days)
+        if len(sessions) == 0:
+            return data.iloc[0:0]
+        start = data.index.searchsorted(start_date, side='right')
+        end = data.index.searchsorted(sessions[-1], side='right')
+        return data.iloc[start:end]
+    except (TypeError, ValueError):
+        # 日期无法解析或与行情索引不可比较
         return pd.DataFrame()
 
 def calculate_switch_performance(days=15):
@@ -30,16 +36,11 @@ def calculate_switch_performance(days=15):
     trades_df = pd.read_csv('analysis_results/trades_record.csv')
     trades_df['date'] = pd.to_datetime(trades_df['date'])
 
-    # 读取价格数据
-    data_159509 = pd.read_csv('data/159509_data.csv')
-    data_159509['date'] = pd.to_datetime(data_159509['date'])
-    data_159509 = data_159509.sort_values('date').set_index('date')
-    data_159509.rename(columns={'net_value': 'close'}, inplace=True)
-
-    data_161116 = pd.read_csv('data/161116_data.csv')
-    data_161116['date'] = pd.to_datetime(data_161116['date'])
-    data_161116 = data_161116.sort_values('date').set_index('date')
-    data_161116.rename(columns={'net_value': 'close'}, inplace=True)
+    # 读取价格数据（共用加载器缓存，多次调用只解析一次；数据目录已迁移到存储时从存储读取）
+    sources = PriceSources('data')
+    data_159509 = sources.load('159509')
+    data_161116 = sources.load('161116')
+    calendar = shared_calendar('data')
     
     # 获取所有买入交易（切换点）
     buy_trades = trades_df[trades_df['type'] == 'buy'].copy()
@@ -75,8 +76,8 @@ def calculate_switch_performance(days=15):
             other_start_price = other_trade_date_data.iloc[-1]['close']
             
             # 获取后续N个交易日的数据
-            buy_future = get_next_n_trading_days(buy_data, trade_date, days)
-            other_future = get_next_n_trading_days(other_data, trade_date, days)
+            buy_future = get_next_n_trading_days(buy_data, trade_date, days, calendar)
+            other_future = get_next_n_trading_days(other_data, trade_date, days, calendar)
             
             if len(buy_future) == 0 or len(other_future) == 0:
                 continue